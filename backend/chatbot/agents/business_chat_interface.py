@@ -3,17 +3,23 @@ from .central_agent_utils import create_structured_input
 from fastapi import BackgroundTasks
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+from ..llm import chat_model
 from ..prompts.prompt import business_chat_prompt
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from backend.db.cache_utils import get_user_state, modify_user_state, delete_user_state
 from backend.db.db_utils import *
 from fastapi import BackgroundTasks
 from .business_function_args_schema import arg_schema
+from .conversation_summarizer import prompt_history
+from .tools import add_to_chat_history
+from backend.jobs.tasks import enqueue_central_agent
+from backend import deadline
+from backend.deadline import DeadlineExceeded, DEADLINE_MESSAGE
+from backend.telemetry.tracing import span
 import json
 
 prompt = PromptTemplate.from_template(business_chat_prompt)
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, streaming=True).bind(
+llm = chat_model("business_router", model="gpt-3.5-turbo", temperature=0, streaming=True).bind(
     tools=[convert_to_openai_tool(func) for func in arg_schema]
 )
 
@@ -25,10 +31,9 @@ agent_functions = {
 }
     
 async def business_chat(business_request, background_tasks: BackgroundTasks, debug=False):
-    from .central_agent import run_central_agent
-
     # We use the vendor_id as key to fetch the business state.
-    user_state  = await get_user_state(business_request.vendor_id, business_request.vendor_id)
+    with span("get_user_state"):
+        user_state  = await get_user_state(business_request.vendor_id, business_request.vendor_id)
     if debug:
         print("Initial user_state: ", user_state)
         
@@ -39,8 +44,12 @@ async def business_chat(business_request, background_tasks: BackgroundTasks, deb
     else:
         chat_history  = user_state.get("chat_history",[])
         
-    response = chain.invoke({"business_message": business_request.message,
-                             "chat_history": chat_history})
+    try:
+        with span("business_router"):
+            response = await deadline.within(chain.ainvoke({"business_message": business_request.message,
+                                                            "chat_history": prompt_history(user_state)}))
+    except DeadlineExceeded:
+        return DEADLINE_MESSAGE
     
     # If a tool is called: for either central agent or other tools
     if response.content == "":
@@ -71,15 +80,15 @@ async def business_chat(business_request, background_tasks: BackgroundTasks, deb
                                         )
             
             # Update the chat history
-            user_state["chat_history"].extend([{"role": "user" , "name": "business", "content": business_request.message}])
-            # run central agent in the background. 
-            background_tasks.add_task(run_central_agent, agent_input, user_state)      
+            add_to_chat_history(user_state, [{"role": "user" , "name": "business", "content": business_request.message}])
+            # Hand the central agent process off to the workers once the response is sent.
+            background_tasks.add_task(enqueue_central_agent, agent_input)
         return 
     
     else: # if no tool is called reply business directly
         response = str_output_parser.invoke(response)
         
         # Update the chat history
-        user_state["chat_history"].extend([{"role": "user" , "name": "business", "content": business_request.message},
+        add_to_chat_history(user_state, [{"role": "user" , "name": "business", "content": business_request.message},
                             {"role": "assistant", "name": "ai", "content": response}])
         return response
\ No newline at end of file
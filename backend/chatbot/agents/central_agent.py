@@ -1,14 +1,14 @@
-from langchain_openai import ChatOpenAI
+from ..llm import chat_model
 from langchain_core.prompts import (
     ChatPromptTemplate,
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate
 )  
-from langchain_openai import ChatOpenAI
 # from .product_agent import product_agent
 from ..prompts.central_agent_prompt import *
 from backend.db.cache_utils import get_user_state, modify_user_state
 # from .tools import format_communication
+from .tools import add_to_chat_history
 from .central_agent_utils import *
 from backend.whatsapp.utils import whatsapp
 
@@ -126,7 +126,7 @@ payment_verification_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, streaming=True).with_structured_output(Response)
+llm = chat_model("central_agent", model="gpt-3.5-turbo", temperature=0, streaming=True).with_structured_output(Response)
 
 # Map each chain to the appropriate task
 llm_chains = {
@@ -142,7 +142,9 @@ async def run_central_agent(event_message: Input, user_state =None, vendor_only=
     business_id = event_message.business_id
         
     if user_state is None:
-        user_state = get_user_state(customer_id, business_id)
+        user_state = await get_user_state(customer_id, business_id)
+    # The state is empty when /chat deleted it after the turn (reset_user_state).
+    user_state.setdefault("chat_history", [])
         
     if debug:
         print("user_state inside central agent: ", user_state["chat_history"])
@@ -200,11 +202,11 @@ async def run_central_agent(event_message: Input, user_state =None, vendor_only=
     
     if user_state is not None:
         if recipient == 'Customer' : #Add agent's response to chat history.
-            user_state['chat_history'].append({"role": "assistant", "name": sender, "content": response})
+            add_to_chat_history(user_state, [{"role": "assistant", "name": sender, "content": response}])
         elif recipient == 'Customer':
-            user_state['chat_history'].append({"role": "assistant", "name": sender, "content": response})
+            add_to_chat_history(user_state, [{"role": "assistant", "name": sender, "content": response}])
         elif recipient == 'Customer':
-            user_state['chat_history'].append({"role": "assistant", "name": sender, "content": response})
+            add_to_chat_history(user_state, [{"role": "assistant", "name": sender, "content": response}])
             
     
     if debug:
@@ -236,7 +238,7 @@ async def run_central_agent(event_message: Input, user_state =None, vendor_only=
     recipient_number = get_contact(recipient, event_message)
     
     # send message to recipient.
-    whatsapp.send_message(sender_number, recipient_number, response.message)
+    await whatsapp.send_message(sender_number, recipient_number, response.message)
     
     return
     
@@ -61,7 +61,7 @@ def get_contact(query, input_):
 # Function to create structured Input
 async def create_structured_input(sender: str, recipient: str, message: str, product_name: str,
                                   price: str, customer_id: str = None, business_id: Optional[str] = None, 
-                                  customer_address: str = "", bank_details: str="",  message_type: Optional[str]=""):
+                                  logistic_id: Optional[str] = "", customer_address: str = "", bank_details: str="",  message_type: Optional[str]=""):
     structured_input = {
         "sender":sender,
         "recipient":recipient,
@@ -71,6 +71,7 @@ async def create_structured_input(sender: str, recipient: str, message: str, pro
         "price":price,
         "customer_id":customer_id,
         "business_id":business_id,
+        "logistic_id":logistic_id,
         "message_type": message_type,
         "customer_address" : customer_address,
         "customer_bank_details": bank_details
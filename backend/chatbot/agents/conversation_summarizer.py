@@ -0,0 +1,155 @@
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from ..llm import chat_model
+from backend.db.cache_utils import get_user_state, modify_user_state
+from ..prompts.summary_prompt import summary_prompt
+from backend.telemetry.tracing import turn
+from .tools import drop_from_chat_history, strip_token_counts
+import logging
+import os
+
+"""
+Rolling summary of long conversations.
+
+Once a conversation's chat history grows past SUMMARY_TRIGGER_MESSAGES messages or SUMMARY_TRIGGER_TOKENS tokens
+(its running token total, see add_to_chat_history), the oldest messages are folded into a running summary kept in
+the user state, leaving only the SUMMARY_RECENT_WINDOW most recent messages in the chat history. Folding runs as a housekeeping task on the scheduler, so it never sits on the request path. Prompts are then built from the summary plus the unsummarized messages (see prompt_history).
+
+user_state == {
+                chat_history: [...],            # messages not yet folded into the summary
+                history_tokens: int,            # running token total of chat_history
+                summary: "",                    # running summary of the folded messages
+                summarized_messages: int,       # number of messages folded so far
+                ...
+}
+"""
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", 24))
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", 3000))
+SUMMARY_RECENT_WINDOW = int(os.getenv("SUMMARY_RECENT_WINDOW", 8))
+# Seconds a scheduled fold may wait before it is dropped; the next turn schedules a new one.
+SUMMARY_JOB_DEADLINE = float(os.getenv("SUMMARY_JOB_DEADLINE", 300))
+
+prompt = PromptTemplate.from_template(summary_prompt)
+llm = chat_model("summarizer", model="gpt-3.5-turbo", temperature=0)
+
+summary_chain = prompt | llm | StrOutputParser()
+
+# Conversations with a fold currently running on this node.
+_in_flight = set()
+
+
+def needs_summary(user_state, trigger=SUMMARY_TRIGGER_MESSAGES, token_trigger=SUMMARY_TRIGGER_TOKENS,
+                  window=SUMMARY_RECENT_WINDOW):
+    """
+    Check if the chat history of a user state is long enough to be folded into the summary.
+
+    Parameters:
+    - user_state (dict): The user state.
+    - trigger (int): Number of messages above which the history is summarized.
+    - token_trigger (int): Running token total above which the history is summarized, if it has more messages
+      than the recent window.
+    - window (int): Number of recent messages kept out of the summary.
+
+    Returns:
+    bool: True if the oldest messages should be folded into the summary.
+    """
+    if not user_state:
+        return False
+    messages = len(user_state.get("chat_history", []))
+    return messages > trigger or (messages > window and user_state.get("history_tokens", 0) > token_trigger)
+
+
+def split_for_summary(chat_history, window=SUMMARY_RECENT_WINDOW):
+    """
+    Split a chat history into the messages to fold into the summary and the recent window to keep.
+
+    Returns:
+    tuple: (messages to fold, messages to keep)
+    """
+    if len(chat_history) <= window:
+        return [], chat_history
+    return chat_history[:-window], chat_history[-window:]
+
+
+def render_messages(messages):
+    """
+    Render chat messages as plain text lines for the summary prompt.
+    """
+    return "\n".join(f"{message.get('name', message.get('role'))}: {message.get('content')}" for message in messages)
+
+
+def prompt_history(user_state):
+    """
+    Build the chat history to pass into prompts: the running summary (if any) followed by
+    the messages that have not been folded into it yet.
+
+    Parameters:
+    - user_state (dict): The user state.
+
+    Returns:
+    List[dict]: Chat history for the prompt.
+    """
+    chat_history = strip_token_counts(user_state.get("chat_history", []))
+    summary = user_state.get("summary")
+    if not summary:
+        return chat_history
+
+    return [{"role": "system", "name": "summary", "content": f"Summary of earlier conversation: {summary}"}] + chat_history
+
+
+async def fold_history(summary, messages, chain=None):
+    """
+    Fold messages into an existing summary.
+
+    Parameters:
+    - summary (str): The current summary, empty if there is none yet.
+    - messages (List[dict]): Oldest messages to fold into the summary.
+    - chain: Runnable used to write the summary. Defaults to summary_chain.
+
+    Returns:
+    str: The updated summary.
+    """
+    chain = chain or summary_chain
+    return await chain.ainvoke({"summary": summary or "None yet.",
+                                "new_messages": render_messages(messages)})
+
+
+async def summarize_user_state(user_id, vendor_id, window=SUMMARY_RECENT_WINDOW, trigger=SUMMARY_TRIGGER_MESSAGES):
+    """
+    Background job: fold the oldest turns of a conversation into its running summary.
+
+    The state is re-read after the summary is written since new turns may have been saved while the LLM was
+    running. The folded messages are only dropped if they are still at the head of the chat history.
+    """
+    key = f"{user_id}:{vendor_id}"
+    if key in _in_flight:
+        return
+    _in_flight.add(key)
+
+    try:
+        user_state = await get_user_state(user_id, vendor_id)
+        if not needs_summary(user_state, trigger, window=window):
+            return
+
+        to_fold, _ = split_for_summary(user_state["chat_history"], window)
+        # Scheduled jobs run outside the customer's turn, open one so the LLM usage is billed to the business.
+        with turn("summary", conversation=key, business=vendor_id):
+            summary = await fold_history(user_state.get("summary", ""), to_fold)
+
+        latest_state = await get_user_state(user_id, vendor_id)
+        latest_history = latest_state.get("chat_history", [])
+        if latest_history[:len(to_fold)] != to_fold:
+            logger.warning(f"Chat history of {key} changed while summarizing, skipping fold.")
+            return
+
+        latest_state["summary"] = summary
+        drop_from_chat_history(latest_state, len(to_fold))
+        latest_state["summarized_messages"] = latest_state.get("summarized_messages", 0) + len(to_fold)
+        await modify_user_state(user_id, vendor_id, latest_state)
+    except Exception as e:
+        logger.error(f"Failed to summarize conversation {key}: {e}")
+    finally:
+        _in_flight.discard(key)
@@ -1,4 +1,4 @@
-from .central_agent import run_central_agent
+from backend.jobs.tasks import enqueue_central_agent
 from .central_agent_utils import create_structured_input
 from fastapi import BackgroundTasks
 
@@ -15,8 +15,8 @@ async def run_customer_complaint_agent(complaint, product_name, background_tasks
     # Run this in a background process
     # response = await run_central_agent(agent_input, kwargs["user_state"])
     
-    # Add the central agent execution as a background task.
-    background_tasks.add_task(run_central_agent, agent_input, kwargs["user_state"])
+    # Hand the central agent process off to the workers once the response is sent.
+    background_tasks.add_task(enqueue_central_agent, agent_input)
 
     # Return a placeholder message to customer.
 
@@ -1,4 +1,4 @@
-from .central_agent import run_central_agent
+from backend.jobs.tasks import enqueue_central_agent
 from .central_agent_utils import create_structured_input
 from fastapi import BackgroundTasks
 
@@ -19,11 +19,11 @@ async def run_logistics_agent(product_name, customer_message, customer_address,
     
     if is_first_call:
         kwargs["user_state"].set("first_logistic_call", False)
-        # Add the central agent execution as a background task.
-        background_tasks.add_task(run_central_agent, agent_input, kwargs["user_state"])
+        # Hand the central agent process off to the workers once the response is sent.
+        background_tasks.add_task(enqueue_central_agent, agent_input)
         return f"Please, hold on why we work on the logistics around delivery."
         
     else:
-        # Add the central agent execution as a background task.
-        background_tasks.add_task(run_central_agent, agent_input, kwargs["user_state"])
+        # Hand the central agent process off to the workers once the response is sent.
+        background_tasks.add_task(enqueue_central_agent, agent_input)
         return f"Please, hold on why we work out further details.", kwargs["user_state"]
\ No newline at end of file
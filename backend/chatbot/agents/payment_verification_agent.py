@@ -1,4 +1,4 @@
-from .central_agent import run_central_agent
+from backend.jobs.tasks import enqueue_central_agent
 from .central_agent_utils import create_structured_input
 from fastapi import BackgroundTasks
 
@@ -28,13 +28,13 @@ async def run_verification_agent(product_name, product_price, amount_paid, custo
     # Return a placeholder message to customer.
     if is_first_call:
         kwargs["user_state"].set("first_verification_call", False)
-        # Add the central agent execution as a background task.
-        background_tasks.add_task(run_central_agent, agent_input, kwargs["user_state"])
+        # Hand the central agent process off to the workers once the response is sent.
+        background_tasks.add_task(enqueue_central_agent, agent_input)
     
         
         return f"Please, hold while we verify payment for this product: {product_name}." , kwargs["user_state"]
     else:
-        # Add the central agent execution as a background task.
-        background_tasks.add_task(run_central_agent, agent_input, kwargs["user_state"])
+        # Hand the central agent process off to the workers once the response is sent.
+        background_tasks.add_task(enqueue_central_agent, agent_input)
     
         return "Please, hold on while we process your message. I will get back to you shortly.", kwargs['user_state']
\ No newline at end of file
@@ -0,0 +1,120 @@
+from prometheus_client import Counter
+from typing import List, Optional
+import asyncio
+import logging
+import os
+import re
+
+from backend.db.db_utils import get_products_by_keywords
+from backend.telemetry.tracing import span
+
+"""
+Speculative catalogue lookups, started from the customer's message while the router LLM call is still running.
+
+The router only names the product (and picks the product agent) once it answers, and the database search used to
+start after that. `CatalogPrefetch` extracts keywords from the message locally and searches the catalogue for any of
+them in a thread, concurrently with the router. If the router then picks ProductInfo for a product name containing
+one of the keywords, the prefetched rows are a superset of what get_products would return: they are filtered locally
+with the same substring match and the database hop disappears from the critical path. Otherwise the search is wasted.
+
+CATALOG_PREFETCH counts the outcome of every turn:
+- used: the product agent was served from the prefetched rows,
+- miss: the product agent needed a product no keyword covered, and queried the database as before,
+- truncated: more than CATALOG_PREFETCH_MAX_ROWS products matched, too broad to reuse,
+- failed: the search raised,
+- wasted: the router did not need a catalogue lookup (another agent, a plain reply, or a product already cached),
+- skipped: no keyword in the message, nothing was searched.
+"""
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PREFETCH_ENABLED = os.getenv("CATALOG_PREFETCH_ENABLED", "true").lower() == "true"
+CATALOG_PREFETCH_MAX_KEYWORDS = int(os.getenv("CATALOG_PREFETCH_MAX_KEYWORDS", 4))
+CATALOG_PREFETCH_MAX_ROWS = int(os.getenv("CATALOG_PREFETCH_MAX_ROWS", 200))
+KEYWORD_MIN_LENGTH = 3
+
+# Words of customer messages that never name a product, searching them would only match half the catalogue.
+STOPWORDS = frozenset("""
+    about above after again all also and any anything are available back bad because been before being below best
+    between both but buy bought can cannot cheap cheaper cost costs could day deliver delivery did does doing done
+    don down each else even every few for from get gets give good got great had has have having hello her here hers
+    him his hope how into its just know like look looking many may more most much must need new nice not now off
+    okay once one only order orders other our ours out over own paid pay payment please price prices product
+    products purchase really same see sell selling send she should show some still stock such sure than thank thanks
+    that the their theirs them then there these they thing things this those through today tomorrow too under until
+    very want wanted was way well were what when where which while who whom why will with would yes yesterday yet
+    you your yours
+""".split())
+
+CATALOG_PREFETCH = Counter("autobiz_catalog_prefetch", "Speculative catalogue searches per turn, by outcome.",
+                           ["outcome"])
+
+
+def extract_keywords(message: str, limit: int = CATALOG_PREFETCH_MAX_KEYWORDS) -> List[str]:
+    """
+    Candidate product words of a message: lowercase alphanumeric words that are not stopwords, longest first.
+    """
+    words = dict.fromkeys(word for word in re.findall(r"[a-z0-9]+", message.lower())
+                          if len(word) >= KEYWORD_MIN_LENGTH and word not in STOPWORDS and not word.isdigit())
+    return sorted(words, key=len, reverse=True)[:limit]
+
+
+def _search(keywords):
+    with span("catalog_prefetch", keywords=",".join(keywords)):
+        return get_products_by_keywords(keywords, limit=CATALOG_PREFETCH_MAX_ROWS)
+
+
+class CatalogPrefetch:
+    def __init__(self, message: str):
+        """
+        Start searching the catalogue for the keywords of `message`. Must be created inside the turn so the search
+        carries its trace and deadline.
+        """
+        self.keywords = extract_keywords(message) if CATALOG_PREFETCH_ENABLED else []
+        self.task = None
+        self.outcome = None
+        if self.keywords:
+            self.task = asyncio.ensure_future(asyncio.to_thread(_search, self.keywords))
+            self.task.add_done_callback(self._consume_error)
+        else:
+            self._record("skipped")
+
+    async def products(self, product_name: str) -> Optional[List[dict]]:
+        """
+        The products get_products(product_name) would return, from the prefetched rows.
+
+        Returns:
+        Optional[List[dict]]: The matching products, None if the prefetch cannot answer for this product.
+        """
+        if self.task is None or self.outcome:
+            return None
+        name = product_name.lower()
+        if not any(keyword in name for keyword in self.keywords):
+            self._record("miss")
+            return None
+        try:
+            rows = await self.task
+        except Exception:
+            self._record("failed")
+            return None
+        if rows is None:
+            self._record("truncated")
+            return None
+        self._record("used")
+        return [product for columns, product in rows if any(name in column for column in columns)]
+
+    def discard(self):
+        """
+        End of the turn: a search nobody asked for is counted as wasted. Its thread finishes in the background.
+        """
+        if self.outcome is None:
+            self._record("wasted")
+
+    def _record(self, outcome):
+        self.outcome = outcome
+        CATALOG_PREFETCH.labels(outcome).inc()
+
+    @staticmethod
+    def _consume_error(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Catalogue prefetch failed: {task.exception()!r}")
@@ -4,16 +4,24 @@ from langchain_core.prompts import (
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )  # PromptTemplate,
-from langchain_openai import ChatOpenAI
+from ..llm import chat_model
 from backend.db.cache_utils import get_user_state, modify_user_state
 from backend.db.db_utils import *
+from backend.db.attributes import filter_products, normalize_attributes
+from backend.db.product_cache import product_cache, refs as product_cache_refs
+from backend.db.fuzzy_catalog import fuzzy_catalog
 from ..prompts.product_agent_prompt import *
 from .user_function_args_schema import ProductInfoEvaluationOutput
 from .upselling_agent import run_upselling_agent
+from .product_context import build_product_context, select_products
+from .product_matcher import exact_match
 from langchain_core.output_parsers import StrOutputParser
 # from langchain.output_parsers.openai_functions import StrOJsonOutputFunctionsParser
 from .tools import *
 from langchain_core.utils.function_calling import convert_to_openai_tool
+from backend import deadline
+from backend.deadline import DeadlineExceeded
+from backend.telemetry.tracing import span
 import json
 
 
@@ -22,9 +30,9 @@ import json
 #1. Answer enquiries concerning product availabiility, price, product attributes or similar products.
 #2. Provide bank details or payment links when customers are ready to buy a product.
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0) #, streaming=True)
+llm = chat_model("product_agent", model="gpt-4o-mini", temperature=0) #, streaming=True)
 
-product_evaluator = llm.bind(
+product_evaluator = chat_model("product_evaluator", model="gpt-4o-mini", temperature=0).bind(
     tools=[convert_to_openai_tool(ProductInfoEvaluationOutput)]
 )
 
@@ -55,6 +63,24 @@ evaluator_chain = evaluator_prompt | product_evaluator
 product_agent = prompt | llm | StrOutputParser() 
 
 
+def degraded_product_reply(product_name, products, bank_details=""):
+    """
+    Reply built from the catalogue alone, for when the turn's deadline leaves no time for the evaluator or the product
+    agent.
+
+    Parameters:
+    - product_name (str): Product the customer asked about.
+    - products (List[dict]): Matching products from the database.
+    - bank_details (str): Payment details to include, if the customer wants to buy.
+    """
+    if not products:
+        return f"Sorry, I couldn't find {product_name} right now. Could you tell me a bit more about what you are looking for?"
+    reply = f"Here is what we have for {product_name}:\n{format_product_list(products)}\nWhich one would you like?"
+    if bank_details:
+        reply += f"\n\nYou can pay to: {bank_details}"
+    return reply
+
+
 async def run_product_agent(
     customer_message,
     product_name,
@@ -63,6 +89,7 @@ async def run_product_agent(
     user_state= None,
     instruction=None,
     product_attributes=None,
+    prefetch=None,
     debug = True,
     **kwargs
 ):
@@ -112,40 +139,82 @@ async def run_product_agent(
             products = {}
             
         product = products.get(product_name, {})
+        # Rows were narrowed to the attributes asked for then, others (another colour or size) need a new search.
+        if product and product.get("attributes", {}) != normalize_attributes(product_attributes):
+            product = {}
         
-        # Fetch products that were previously retrieved from the database for this index product if exists
-        retrieved_products_info = product.get("retrieved_results", None)
+        # The state only keeps references to the products retrieved before, their rows (current price and stock) come
+        # from the shared product cache.
+        product_refs = product.get("product_refs", None)
+        retrieved_products_info = None
+        if product_refs is not None:
+            with span("product_cache"):
+                retrieved_products_info = product_cache.get(product_refs)
         
-        db_queried = product.get("db_queried", False)
         if debug:
             print("Product name: ", product_name)
             print("category: ", product_category)
         
         # if this is a new product (never been retrieved from db before), get items from db
-        if retrieved_products_info is None and not db_queried:
-            retrieved_products_info = await get_products(product_name, product_category, **kwargs )
+        if retrieved_products_info is None:
+            # Served from the catalogue search started alongside the router when it covers this product.
+            if prefetch is not None:
+                retrieved_products_info = await prefetch.products(product_name)
+                if retrieved_products_info is not None:
+                    retrieved_products_info = filter_products(retrieved_products_info, product_attributes) or \
+                        retrieved_products_info
+            if retrieved_products_info is None:
+                with span("get_products"):
+                    # Narrowed to the attributes asked for, unless none has them: then the evaluator offers the others.
+                    retrieved_products_info = await get_products(product_name, product_category,
+                                                                 attributes=product_attributes, **kwargs)
+                    if not retrieved_products_info and normalize_attributes(product_attributes):
+                        retrieved_products_info = await get_products(product_name, product_category, **kwargs)
+            # Misspelt, run together or a business's own word for the product: before giving up on the catalogue.
+            business_id = (user_state.get("business_information") or {}).get("id")
+            if not retrieved_products_info and business_id is not None:
+                with span("fuzzy_search"):
+                    retrieved_products_info = fuzzy_catalog.search(business_id, product_name)
             # products["product_name"] = product_name
             if debug:
                 print("Products: ", products)
                 print("Retrieved products: ", retrieved_products_info)
                 
             product = {}
-            product["retrieved_results"]= retrieved_products_info
+            product["product_refs"] = product_cache_refs(retrieved_products_info)
+            product["attributes"] = normalize_attributes(product_attributes)
             product["db_queried"] = True
             user_state["products"][product_name] = product
         
         # Use evaluator to determine if enquired product matches any product in the retrieved products
         result_match = product.get("result_match", None)
+        if result_match is not None:
+            # The evaluator's verdict is kept with references to the products it picked.
+            picked = {tuple(ref) for ref in result_match.get("available_product_refs", [])}
+            result_match = {**result_match, "available_products": [
+                row for row in retrieved_products_info if (row["business_id"], row["id"]) in picked]}
+        
+        # A single in-stock product matching the enquiry exactly needs no LLM to confirm it.
+        evaluated = False
+        if result_match is None:
+            result_match = exact_match(retrieved_products_info, product_name, product_attributes, customer_message, intent)
         
         if result_match is None:
-            result_match = await evaluator_chain.ainvoke({
-                "available_products": retrieved_products_info,
-                "customer_enquiry": customer_message
-            })
+            try:
+                with span("evaluator_chain"):
+                    context = build_product_context(retrieved_products_info, product_name, customer_message,
+                                                    model=product_evaluator.bound.model_name, agent="product_evaluator")
+                    result_match = await deadline.within(evaluator_chain.ainvoke({
+                        "available_products": context.text,
+                        "customer_enquiry": customer_message
+                    }))
+            except DeadlineExceeded:
+                return degraded_product_reply(product_name, retrieved_products_info), user_state
             
 
             # Retrieve output of the evaluator chain
             result_match = json.loads(result_match.additional_kwargs.get("tool_calls")[0].get("function")["arguments"])
+            evaluated = True
             
             if debug:
                 print("Retrieved products info: ", retrieved_products_info)
@@ -181,20 +250,37 @@ async def run_product_agent(
         # put in available product into input, if no available product, inform product agent that product is not available.
         # We might have to upsell here instead.'
         
-        # Add result match to product cache.
-        user_state["products"][product_name]['result_match'] = result_match
+        # Keep the evaluator's verdict, with references to the products it picked. Exact matches are cheap to redo
+        # against current stock, and a verdict naming no catalogue row is evaluated again.
+        if evaluated:
+            picked = select_products(retrieved_products_info, result_match.get("available_products") or [])
+            if picked or not result_match.get("available_products"):
+                user_state["products"][product_name]["result_match"] = {
+                    **{key: value for key, value in result_match.items() if key != "available_products"},
+                    "available_product_refs": product_cache_refs(picked)}
         
         # Get available products
         available_products = result_match.get("available_products", None)
         
         if available_products:
-            chain_input["available_products"] = f"\n**product details**\navailable products: {available_products}"
+            # The catalogue rows the evaluator picked, with their actual price and stock.
+            matched = select_products(retrieved_products_info, available_products)
+            if matched:
+                available_products = build_product_context(matched, product_name, customer_message,
+                                                            model=llm.model_name, agent="product_agent").text
+            chain_input["available_products"] = f"\n**product details**\navailable products:\n{available_products}"
         
-            return await product_agent.ainvoke(
-                chain_input
-            ), user_state
+            try:
+                with span("product_agent"):
+                    response = await deadline.within(product_agent.ainvoke(
+                        chain_input
+                    ))
+            except DeadlineExceeded:
+                response = degraded_product_reply(product_name, matched or retrieved_products_info, bank_details)
+            return response, user_state
         else:
-            response = await run_upselling_agent(product_name, "inquired")
+            with span("upselling_agent"):
+                response = await run_upselling_agent(product_name, "inquired")
             return response , user_state
             
         # print(chain_input)
@@ -214,4 +300,9 @@ async def run_product_agent(
         # print("Result match: " , result_match)
         chain_input["available_products"] =  "NO PRODUCT was mentioned in the customer_message" 
         
-        return product_agent.invoke(chain_input), user_state
+        try:
+            with span("product_agent"):
+                response = await deadline.within(product_agent.ainvoke(chain_input))
+        except DeadlineExceeded:
+            response = "Which product are you interested in? Please send me its name."
+        return response, user_state
@@ -0,0 +1,206 @@
+from prometheus_client import Counter, Histogram
+from pydantic import BaseModel
+from typing import Dict, List, Set
+import json
+import logging
+import os
+import re
+
+from backend.db.descriptors import HEADER, descriptor_encoding, descriptor_line, details, format_price, is_current
+from backend.db.popularity import prior
+from .tools import get_encoding, num_tokens_from_string
+
+"""
+Product context of the evaluator and product agent prompts.
+
+get_products can return hundreds of rows for a generic name ("shirt"), and the whole list used to be pasted into the
+evaluator prompt, then again into the product agent's. `build_product_context` keeps the prompt size constant instead:
+- ranks the products against the product name and the customer's message (name words, then tags, then stock, then
+  the popularity prior of backend/db/popularity.py),
+- collapses near-identical variants (same name once the colours and sizes the customer did not ask for are removed)
+  into one row with a price range and the stock of each variant,
+- renders one compact "name | price | stock | details" line per row, best first, until the model's token budget
+  (PRODUCT_CONTEXT_TOKENS) is spent, and ends with a line saying how many products were left out. A product on its
+  own row is its precomputed descriptor (backend/db/descriptors.py), counted with its stored token count when the
+  model uses the same encoding and the descriptor is current; merged rows list the attribute values of all their variants.
+Dropped products are counted in PRODUCT_CONTEXT_DROPPED and logged with the turn.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Tokens of product context per prompt, by model (prefix match).
+PRODUCT_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 1_200,
+    "gpt-4o-mini": 2_000,
+    "gpt-4o": 2_000,
+    **json.loads(os.getenv("PRODUCT_CONTEXT_TOKENS", "{}")),
+}
+DEFAULT_PRODUCT_CONTEXT_TOKENS = int(os.getenv("DEFAULT_PRODUCT_CONTEXT_TOKENS", 1_200))
+VARIANTS_MAX_NAMES = 4
+# Kept free in the budget for the line saying how many products were left out.
+FOOTER_TOKENS = 25
+
+# Words that tell variants of the same product apart, ignored when looking for near-identical products.
+VARIANT_WORDS = frozenset("""
+    xs s m l xl xxl xxxl small medium large extra black white red blue green yellow pink purple orange brown grey gray
+    gold silver navy beige cream maroon
+""".split())
+
+PRODUCT_CONTEXT_TOKENS_USED = Histogram("autobiz_product_context_tokens", "Tokens of product context per prompt.",
+                                        ["agent"], buckets=(50, 100, 250, 500, 1_000, 2_000, 4_000))
+PRODUCT_CONTEXT_DROPPED = Counter("autobiz_product_context_dropped", "Products left out of a prompt's context.",
+                                  ["agent", "reason"])
+
+
+class ProductContext(BaseModel):
+    text: str
+    tokens: int
+    shown: List[str]  # product names, in prompt order
+    merged: int  # products folded into another row as a variant
+    dropped: int  # rows left out for the token budget
+
+
+def context_budget(model: str) -> int:
+    for name in sorted(PRODUCT_CONTEXT_TOKENS, key=len, reverse=True):
+        if model.startswith(name):
+            return PRODUCT_CONTEXT_TOKENS[name]
+    return DEFAULT_PRODUCT_CONTEXT_TOKENS
+
+
+def name_words(text) -> List[str]:
+    return re.findall(r"[a-z0-9]+", str(text or "").lower())
+
+
+def rank_products(products: List[dict], product_name: str, customer_message: str = "") -> List[dict]:
+    """
+    Sort products by relevance to the enquiry, keeping the database order between equals.
+    """
+    enquiry_words = set(name_words(product_name))
+    message_words = set(name_words(customer_message))
+    wanted = product_name.strip().lower()
+
+    def score(product):
+        title = set(name_words(product.get("product_name")))
+        tags = set(name_words(product.get("tags")))
+        return (
+            (product.get("product_name") or "").strip().lower() == wanted,
+            len(enquiry_words & title) / (len(enquiry_words) or 1),
+            len(message_words & title) + len((enquiry_words | message_words) & tags) / 2,
+            product.get("items_left_in_stock") != 0,
+            prior(product),
+        )
+    return sorted(products, key=score, reverse=True)
+
+
+def merge_variants(products: List[dict], keep: Set[str] = frozenset()) -> List[List[dict]]:
+    """
+    Group near-identical products, in order of their first appearance.
+
+    Parameters:
+    - products (List[dict]): Products, ranked.
+    - keep (Set[str]): Variant words the customer asked for, variants with them stay on their own rows.
+    """
+    groups: Dict[tuple, List[dict]] = {}
+    for product in products:
+        words = name_words(product.get("product_name"))
+        key = tuple(word for word in words if word not in VARIANT_WORDS or word in keep) or tuple(words)
+        groups.setdefault(key, []).append(product)
+    return list(groups.values())
+
+
+def render_row(group: List[dict]) -> str:
+    first = group[0]
+    if len(group) == 1:
+        return descriptor_line(first)
+
+    names = [product["product_name"] for product in group[:VARIANTS_MAX_NAMES]]
+    if len(group) > VARIANTS_MAX_NAMES:
+        names.append(f"+{len(group) - VARIANTS_MAX_NAMES} more variants")
+    prices = [product["price"] for product in group if isinstance(product.get("price"), (int, float))]
+    price = format_price(min(prices)) if prices and min(prices) == max(prices) else \
+        f"{format_price(min(prices))}-{format_price(max(prices))}" if prices else ""
+    stocks = ["" if product.get("items_left_in_stock") is None else str(product["items_left_in_stock"])
+              for product in group]
+    # Stock per variant, so a size or colour that is sold out is never hidden behind the others' stock.
+    stock = stocks[0] if len(set(stocks)) == 1 else \
+        "/".join(f"{label}:{stock}" for label, stock in zip(variant_labels(group), stocks))
+    return f"{' / '.join(names)} | {price} | {stock} | {details(group)}"
+
+
+def variant_labels(group: List[dict]) -> List[str]:
+    """
+    What tells each product of a merged row apart: its variant words, else its attribute values that differ within
+    the group, else its name.
+    """
+    varying = [key for key in {key for product in group for key in (product.get("attributes") or {})}
+               if len({str((product.get("attributes") or {}).get(key)) for product in group}) > 1]
+    labels = []
+    for product in group:
+        label = " ".join(word for word in name_words(product.get("product_name")) if word in VARIANT_WORDS)
+        if not label:
+            attributes = product.get("attributes") or {}
+            label = " ".join(str(attributes[key]) for key in sorted(varying) if attributes.get(key))
+        labels.append(label or str(product.get("product_name")))
+    return labels
+
+
+def build_product_context(products: List[dict], product_name: str, customer_message: str = "",
+                          model: str = "gpt-4o-mini", agent: str = "product_evaluator",
+                          max_tokens: int = None) -> ProductContext:
+    """
+    Render the products most relevant to an enquiry within a token budget.
+
+    Parameters:
+    - products (List[dict]): Products as returned by get_products.
+    - product_name (str): Product the customer asked about.
+    - customer_message (str): The customer's message, to rank by the attributes they mention.
+    - model (str): Model of the prompt, for the token budget and count.
+    - agent (str): Agent the context is for, for the metrics.
+    - max_tokens (int): Budget override, context_budget(model) by default.
+
+    Returns:
+    ProductContext: The context text and what was left out.
+    """
+    if not products:
+        return ProductContext(text="No products found.", tokens=0, shown=[], merged=0, dropped=0)
+    budget = max_tokens or context_budget(model)
+    groups = merge_variants(rank_products(products, product_name, customer_message),
+                            keep=set(name_words(product_name)) | set(name_words(customer_message)))
+
+    lines, shown = [HEADER], []
+    tokens = num_tokens_from_string(HEADER, model)
+    stored_counts = get_encoding(model).name == descriptor_encoding().name
+    for group in groups:
+        line = render_row(group)
+        if stored_counts and len(group) == 1 and group[0].get("descriptor_tokens") and is_current(group[0]):
+            line_tokens = group[0]["descriptor_tokens"] + 1  # newline
+        else:
+            line_tokens = num_tokens_from_string(line, model) + 1
+        if tokens + line_tokens > budget - FOOTER_TOKENS and len(lines) > 1:
+            break
+        lines.append(line)
+        tokens += line_tokens
+        shown.extend(product["product_name"] for product in group)
+
+    dropped = len(groups) - (len(lines) - 1)
+    merged = len(products) - len(groups)
+    if dropped:
+        footer = f"({dropped} more matching products not shown, ask the customer for details to narrow them down.)"
+        lines.append(footer)
+        tokens += num_tokens_from_string(footer, model) + 1
+        PRODUCT_CONTEXT_DROPPED.labels(agent, "budget").inc(dropped)
+        logger.info(f"Product context for {agent} ({product_name!r}): {len(lines) - 2} rows in {tokens} tokens, "
+                    f"{dropped} rows dropped")
+    if merged:
+        PRODUCT_CONTEXT_DROPPED.labels(agent, "variant").inc(merged)
+    PRODUCT_CONTEXT_TOKENS_USED.labels(agent).observe(tokens)
+    return ProductContext(text="\n".join(lines), tokens=tokens, shown=shown, merged=merged, dropped=dropped)
+
+
+def select_products(products: List[dict], selection) -> List[dict]:
+    """
+    The catalogue rows named in `selection`, e.g. the available_products the evaluator returned, whatever its shape.
+    """
+    text = json.dumps(selection, default=str).lower()
+    return [product for product in products if product.get("product_name") and
+            re.search(rf"(?<![a-z0-9]){re.escape(product['product_name'].lower())}(?![a-z0-9])", text)]
@@ -0,0 +1,89 @@
+from prometheus_client import Counter
+from typing import List, Optional
+import logging
+
+from backend.db.attributes import normalize_attributes
+from .product_context import VARIANT_WORDS, name_words
+from .user_function_args_schema import ProductInfoEvaluationOutput
+
+"""
+Deterministic product matching, to skip the evaluator LLM call when the catalogue already answers the enquiry.
+
+A product matches the enquiry exactly when, after lowercasing and dropping punctuation:
+- its name without size and colour words has the same words as the enquired name without them,
+- its size and colour words were all asked for (in the product name, the router's product_attributes, or the message),
+- every size and colour asked for, and every other attribute value the router extracted (e.g. "256gb"), appears in
+  its name, tags or attributes,
+- none of its attributes contradicts one asked for (a {"color": "blue"} product for a {"colour": "red"} enquiry).
+If exactly one product matches and it is in stock, `exact_match` returns the evaluator's output for it
+(EXACT_MATCH, no attributes to confirm). Anything else — several candidates, none, out of stock, unknown stock — is
+left to the LLM evaluator. PRODUCT_EVALUATIONS counts both paths, its "exact_match" label being the LLM calls avoided.
+"""
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_EVALUATIONS = Counter("autobiz_product_evaluations", "Product enquiries evaluated, by matcher.", ["matcher"])
+
+
+def _attribute_words(product_attributes) -> List[str]:
+    if not product_attributes:
+        return []
+    # Normalized like the stored attributes: "16 GB" is "16gb".
+    values = normalize_attributes(product_attributes).values() if isinstance(product_attributes, dict) \
+        else [product_attributes]
+    return [word for value in values for word in name_words(value)]
+
+
+def exact_match(products: List[dict], product_name: str, product_attributes=None, customer_message: str = "",
+                intent: str = "enquiry") -> Optional[dict]:
+    """
+    The evaluator's output for an enquiry that matches exactly one in-stock product.
+
+    Parameters:
+    - products (List[dict]): Products retrieved for the enquiry.
+    - product_name (str): Product the customer asked about.
+    - product_attributes: Attributes the router extracted, e.g. {"colour": "blue", "size": "M"}.
+    - customer_message (str): The customer's message, for the sizes and colours it mentions.
+    - intent (str): Customer's intent, enquiry or purchase.
+
+    Returns:
+    Optional[dict]: A ProductInfoEvaluationOutput as a dict, None when the LLM evaluator is needed.
+    """
+    enquiry = name_words(product_name)
+    base = sorted(word for word in enquiry if word not in VARIANT_WORDS)
+    attributes = _attribute_words(product_attributes)
+    # Single letters of the message are too noisy ("it's") to be sizes, the router's attributes carry those.
+    wanted_variants = {word for word in enquiry + attributes if word in VARIANT_WORDS} | \
+                      {word for word in name_words(customer_message) if word in VARIANT_WORDS and len(word) > 1}
+    required = {word for word in attributes if word not in VARIANT_WORDS}
+    requested = normalize_attributes(product_attributes)
+
+    candidates = []
+    for product in products:
+        words = name_words(product.get("product_name"))
+        if sorted(word for word in words if word not in VARIANT_WORDS) != base:
+            continue
+        if not {word for word in words if word in VARIANT_WORDS} <= wanted_variants:
+            continue
+        stored = normalize_attributes(product.get("attributes"))
+        if any(key in stored and stored[key] != value for key, value in requested.items()):
+            continue
+        known = set(words) | set(name_words(product.get("tags"))) | \
+            set(name_words(" ".join(stored.values())))
+        if not (wanted_variants | required) <= known:
+            continue
+        candidates.append(product)
+
+    if not base or len(candidates) != 1 or not isinstance(candidates[0].get("items_left_in_stock"), int) \
+            or candidates[0]["items_left_in_stock"] <= 0:
+        PRODUCT_EVALUATIONS.labels("llm").inc()
+        return None
+
+    product = candidates[0]
+    PRODUCT_EVALUATIONS.labels("exact_match").inc()
+    logger.info(f"Exact match for {product_name!r}: {product['product_name']!r}, evaluator skipped")
+    instruction = (f"{product['product_name']} is available at {product['price']} with "
+                   f"{product['items_left_in_stock']} in stock. Confirm it to the customer with its price")
+    instruction += " and give them the payment details." if intent == "purchase" else " and ask if they want to buy it."
+    return ProductInfoEvaluationOutput(product_match="EXACT_MATCH", product_attribute_enquiry=None,
+                                       available_products=[product], instruction=instruction).dict()
@@ -2,7 +2,7 @@ import os
 from langchain_core.tools import tool
 from .user_function_args_schema import *
 from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
-from langchain_openai import ChatOpenAI
+from ..llm import chat_model
 from langchain_community.tools.tavily_search import TavilySearchResults
 from dotenv import load_dotenv
 import base64
@@ -11,12 +11,19 @@ import tiktoken
 from datetime import datetime, timedelta
 import re
 import json
+import logging
+from functools import lru_cache
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Model the running token total of a chat history is counted for (see add_to_chat_history).
+HISTORY_TOKEN_MODEL = os.getenv("HISTORY_TOKEN_MODEL", "gpt-3.5-turbo")
+
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, streaming=True)
+llm = chat_model("tools", model="gpt-3.5-turbo", temperature=0, streaming=True)
 
 search = TavilySearchAPIWrapper()
 tavily_tool = TavilySearchResults(api_wrapper=search)
@@ -211,11 +218,68 @@ def history_to_db_format(chat_history, user_id, chatbot_id, session_id):
     return history
             
 
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-3.5-turbo"):
+    """
+    Returns the tiktoken encoding for a model. Encodings are loaded once per process and cached.
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        logger.warning(f"Model {model} not found. Using cl100k_base encoding.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=None)
+def message_token_overhead(model: str = "gpt-3.5-turbo") -> Tuple[int, int]:
+    """
+    Returns the (tokens_per_message, tokens_per_name) overhead of the chat format used by a model.
+    See https://github.com/openai/openai-python/blob/main/chatml.md for how messages are converted to tokens.
+    """
+    if model == "gpt-3.5-turbo-0301":
+        return 4, -1  # every message follows <|start|>{role/name}\n{content}<|end|>\n, if there's a name, the role is omitted
+    elif "gpt-3.5-turbo" in model or "gpt-4" in model:
+        return 3, 1
+    raise NotImplementedError(
+        f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
+    )
+
+
 def num_tokens_from_string(string: str, encoding_name: str = "gpt-3.5-turbo") -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.encoding_for_model(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+    return len(get_encoding(encoding_name).encode(string))
+
+
+def _content_tokens(message: dict, encoding) -> int:
+    return sum(len(encoding.encode(value)) for value in message.values() if isinstance(value, str))
+
+
+def num_tokens_from_message(message: dict, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Return the number of tokens used by a single chat message.
+
+    Messages of a chat history carry the token count of their text under "tokens", by encoding (see
+    add_to_chat_history), so they are only ever encoded once per encoding. Other messages are encoded, and never
+    modified.
+    """
+    encoding = get_encoding(model)
+    tokens_per_message, tokens_per_name = message_token_overhead(model)
+    stored = message.get("tokens")
+    content_tokens = stored.get(encoding.name) if isinstance(stored, dict) else None
+    if content_tokens is None:
+        content_tokens = _content_tokens(message, encoding)
+    return tokens_per_message + content_tokens + (tokens_per_name if isinstance(message.get("name"), str) else 0)
+
+
+def store_token_count(message: dict, model: str = "gpt-3.5-turbo"):
+    """
+    Store the token count of a message's text under "tokens", keyed by the model's encoding: gpt-3.5-turbo
+    (cl100k_base) and gpt-4o-mini (o200k_base) count the same text differently.
+    """
+    encoding = get_encoding(model)
+    stored = message.get("tokens") if isinstance(message.get("tokens"), dict) else {}
+    if encoding.name not in stored:
+        message["tokens"] = {**stored, encoding.name: _content_tokens(message, encoding)}
 
 
 def num_tokens_from_messages(messages, model="gpt-3.5-turbo"):
@@ -224,44 +288,60 @@ def num_tokens_from_messages(messages, model="gpt-3.5-turbo"):
         return 0
     if type(messages[0]) == str:
         messages = format_communication(messages) # change to standardize chat history later.
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model in {
-        "gpt-3.5-turbo-0613",
-        "gpt-3.5-turbo-16k-0613",
-        "gpt-4-0314",
-        "gpt-4-32k-0314",
-        "gpt-4-0613",
-        "gpt-4-32k-0613",
-        }:
-        tokens_per_message = 3
-        tokens_per_name = 1
-    elif model == "gpt-3.5-turbo-0301":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
-    elif "gpt-3.5-turbo" in model:
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo-0613")
-    elif "gpt-4" in model:
-        print("Warning: gpt-4 may update over time. Returning num tokens assuming gpt-4-0613.")
-        return num_tokens_from_messages(messages, model="gpt-4-0613")
-    else:
-        raise NotImplementedError(
-            f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
-        )
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
+    num_tokens = sum(num_tokens_from_message(message, model) for message in messages)
     num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
     return num_tokens
 
 
+def add_to_chat_history(user_state: dict, messages: List[dict]) -> int:
+    """
+    Append messages to the chat history of a user state and keep its running token total up to date. Every append
+    to a chat history goes through here (and every removal through drop_from_chat_history), so the total stays exact.
+
+    The token count of each new message is computed once and stored on the message (store_token_count), and the
+    total is kept in user_state["history_tokens"], counted for HISTORY_TOKEN_MODEL, so the cost of a history is an
+    O(1) update per turn instead of a re-encode.
+
+    Returns:
+    int: The token total of the chat history.
+    """
+    chat_history = user_state.setdefault("chat_history", [])
+    if "history_tokens" not in user_state:
+        for message in chat_history:
+            store_token_count(message, HISTORY_TOKEN_MODEL)
+        user_state["history_tokens"] = sum(num_tokens_from_message(message, HISTORY_TOKEN_MODEL)
+                                           for message in chat_history)
+
+    for message in messages:
+        store_token_count(message, HISTORY_TOKEN_MODEL)
+        user_state["history_tokens"] += num_tokens_from_message(message, HISTORY_TOKEN_MODEL)
+    chat_history.extend(messages)
+
+    return user_state["history_tokens"]
+
+
+def drop_from_chat_history(user_state: dict, count: int) -> int:
+    """
+    Drop the `count` oldest messages of the chat history of a user state and take them off its running token total.
+
+    Returns:
+    int: The token total of the chat history.
+    """
+    chat_history = user_state.get("chat_history", [])
+    dropped, user_state["chat_history"] = chat_history[:count], chat_history[count:]
+    if "history_tokens" in user_state:
+        user_state["history_tokens"] -= sum(num_tokens_from_message(message, HISTORY_TOKEN_MODEL)
+                                            for message in dropped)
+    return user_state.get("history_tokens", 0)
+
+
+def strip_token_counts(messages: List[dict]) -> List[dict]:
+    """
+    Drop the stored token counts from messages before they are rendered into a prompt.
+    """
+    return [{key: value for key, value in message.items() if key != "tokens"} for message in messages]
+
+
 def stringify(obj):
     """
     Converts a nested dictionary to a string.
@@ -437,6 +517,25 @@ def flatten_list(lst):
     return flattened_list
 
 
+def format_product_list(products: List[dict], limit: int = 5) -> str:
+    """
+    Plain listing of catalogue products, the degraded reply used when there is no time left for the LLM to write one.
+
+    Parameters:
+    - products (List[dict]): Products as returned by get_products.
+    - limit (int): Maximum number of products listed.
+
+    Returns:
+    str: One line per product with its price and stock.
+    """
+    lines = []
+    for product in products[:limit]:
+        stock = product.get("items_left_in_stock")
+        availability = "out of stock" if stock == 0 else f"{stock} in stock" if stock is not None else "available"
+        lines.append(f"- {product['product_name']}: {product['price']:,.2f} ({availability})")
+    return "\n".join(lines)
+
+
 if __name__ == '__main__':
     pass
   
@@ -1,4 +1,5 @@
 from enum import Enum
+import asyncio
 import json
 import os
 from pydantic import BaseModel, Field
@@ -7,13 +8,17 @@ from typing import List
 from dotenv import load_dotenv
 
 from backend.db.db_utils import get_products
+from backend.db.descriptors import HEADER, descriptor_line
+from backend.deadline import DeadlineExceeded
+from ..llm import openai_client, tracked
+from .tools import flatten_list, format_product_list
 from ..prompts.upselling_agent_prompt import UPSELLING_SYSTEM_PROMPT
 
 load_dotenv()
 
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-client = openai.OpenAI()
+client = openai_client()
 
 MODEL = "gpt-4o-mini"
 
@@ -64,7 +69,8 @@ class GetRelatedProducts(BaseModel):
     async def execute(
         self,
     ):  # add context/intent and based on it, the prompt varies e.g customer bought, customer requested for etc.
-        completion = get_parsed_completion(
+        completion = await asyncio.to_thread(
+            get_parsed_completion,
             ProductLists,
             [
                 {"role": "system", "content": instructions[self.instruction]},
@@ -92,7 +98,9 @@ TOOLS_MAP = {
 
 
 def get_parsed_completion(model: BaseModel, messages: list):
-    completion = client.beta.chat.completions.parse(
+    completion = tracked(
+        "upselling_agent",
+        client.beta.chat.completions.parse,
         model="gpt-4o-mini",
         messages=messages,
         response_format=model,
@@ -101,19 +109,27 @@ def get_parsed_completion(model: BaseModel, messages: list):
     return completion.choices[0].message.content
 
 
-async def execute_tool(tool_calls, messages):
+async def execute_tool(tool_calls, messages, found=None):
+    """
+    Run the tool calls and add their results to the messages, the products as their precomputed descriptors.
 
+    Parameters:
+    - found (list): Collects the products the tools returned, for the degraded reply.
+    """
     for tool_call in tool_calls:
         tool_name = tool_call.function.name
         tool_arguments = json.loads(tool_call.function.arguments)
         tool_call_id = tool_call.id
         output = await TOOLS_MAP[tool_name](**tool_arguments).execute()
+        products = flatten_list(output)
+        if found is not None:
+            found.extend(products)
         messages.append(
             {
                 "role": "tool",
                 "name": tool_name,
                 "tool_call_id": tool_call_id,
-                "content": json.dumps(output),
+                "content": "\n".join([HEADER] + [descriptor_line(product) for product in products]) if products else "No products found.",
             }
         )
 
@@ -125,22 +141,40 @@ async def run_upselling_agent(product, intent, chat_history = [], **kwargs):
         
     messages = [{"role": "system", "content": UPSELLING_SYSTEM_PROMPT}]
     messages.extend(chat_history)
+    found = []
+
+    try:
+        while True:
+            # The SDK client is synchronous, keep it off the event loop.
+            response = await asyncio.to_thread(
+                tracked,
+                "upselling_agent",
+                client.chat.completions.create,
+                model=MODEL,
+                messages=messages,
+                temperature=0,
+                tools=TOOLS,
+            )
 
-    while True:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            temperature=0,
-            tools=TOOLS,
-        )
+            if response.choices[0].message.tool_calls:
+                chat_history.extend([response.choices[0].message])
+                messages = await execute_tool(
+                    response.choices[0].message.tool_calls, chat_history, found
+                )
+            else:
+                return response.choices[0].message.content
+    except DeadlineExceeded:
+        return degraded_upselling_reply(product, found)
 
-        if response.choices[0].message.tool_calls:
-            chat_history.extend([response.choices[0].message])
-            messages = await execute_tool(
-                response.choices[0].message.tool_calls, chat_history
-            )
-        else:
-            return response.choices[0].message.content
+
+def degraded_upselling_reply(product, related):
+    """
+    Reply for when the turn's deadline is reached: the alternatives the tools already found, without the pitch.
+    """
+    reply = f"Sorry, {product} is not available at the moment."
+    if related:
+        reply += f" You might like:\n{format_product_list(related)}"
+    return reply
 
 
 if __name__ == "__main__":
@@ -2,24 +2,33 @@
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+from ..llm import chat_model
 from ..prompts.prompt import base_prompt
 from .user_function_args_schema import arg_schema
 from langchain.output_parsers.openai_functions import JsonOutputFunctionsParser
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from .product_agent import run_product_agent
+from .prefetch import CatalogPrefetch
 from .upselling_agent import run_upselling_agent
 from .payment_verification_agent import run_verification_agent
 from .customer_complaint_agent import run_customer_complaint_agent
 from .logistics_agent import run_logistics_agent
+from .conversation_summarizer import needs_summary, prompt_history, summarize_user_state, SUMMARY_JOB_DEADLINE
+from .tools import add_to_chat_history
 from .payment_verification_agent import *
 import json
 from backend.db.cache_utils import get_user_state, modify_user_state, delete_user_state
 from backend.db.db_utils import *
+from backend.jobs.scheduler import scheduler, Priority
+from backend import deadline
+from backend.deadline import DeadlineExceeded, DEADLINE_MESSAGE
+from backend.telemetry.ledger import ledger, BUDGET_EXCEEDED_MESSAGE
+from backend.telemetry.tracing import span
 from fastapi import BackgroundTasks
+from langchain_core.messages import AIMessage
 
 prompt = PromptTemplate.from_template(base_prompt)
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, streaming=True).bind(
+llm = chat_model("router", model="gpt-3.5-turbo", temperature=0, streaming=True).bind(
     tools=[convert_to_openai_tool(func) for func in arg_schema]
 )
 
@@ -42,13 +51,22 @@ agent_functions = {
 # Bank account number,Bank account name,type,date created
 # chat function that interfaces with chatbot
 async def chat(user_request, background_tasks: BackgroundTasks,  reset_user_state=True, debug=False):
+    # The business has spent its LLM budget for the day and asked for customers to be held off until tomorrow.
+    if ledger.budget_status(user_request.vendor_id) == "throttle":
+        return BUDGET_EXCEEDED_MESSAGE
+
+    # Search the catalogue for the message's keywords while the state is loaded and the router decides.
+    prefetch = CatalogPrefetch(user_request.message)
+
     ## If state between user and vendor exists in cache, fetch it:
-    user_state  = await get_user_state(user_request.user_id, user_request.vendor_id)
+    with span("get_user_state"):
+        user_state  = await get_user_state(user_request.user_id, user_request.vendor_id)
     if debug:
         print("Initial user_state: ", user_state)
     if not user_state:
         # else fetch vendor's business info
-        business_information = await get_business_info(user_request.vendor_id)
+        with span("get_business_info"):
+            business_information = await get_business_info(user_request.vendor_id)
         business_information = business_information
         chat_history = []
         user_state = {"chat_history": chat_history , "business_information": business_information}
@@ -61,15 +79,20 @@ async def chat(user_request, background_tasks: BackgroundTasks,  reset_user_stat
         # print("Business informaton (user_state exists): ", business_information)
         
     # Get response from the chain  
-    response =  chain.invoke({"user_message" : user_request.message,
-                              "business_name": business_information["business_name"],
-                              "description": business_information["business_description"],
-                              "facebook_page": business_information["facebook_page"],
-                              "twitter_page": business_information["twitter_page"],
-                              "website": business_information["website"],
-                              "tiktok": business_information["tiktok"],
-                              "ig_page": business_information["ig_page"],
-                              "chat_history": chat_history})
+    try:
+        with span("router"):
+            response = await deadline.within(chain.ainvoke({"user_message" : user_request.message,
+                                      "business_name": business_information["business_name"],
+                                      "description": business_information["business_description"],
+                                      "facebook_page": business_information["facebook_page"],
+                                      "twitter_page": business_information["twitter_page"],
+                                      "website": business_information["website"],
+                                      "tiktok": business_information["tiktok"],
+                                      "ig_page": business_information["ig_page"],
+                                      "chat_history": prompt_history(user_state)}))
+    except DeadlineExceeded:
+        # Out of time before knowing what the customer wants: answer rather than leave them waiting.
+        response = AIMessage(content=DEADLINE_MESSAGE)
     
     # print("user_state before agent calls: ", user_state)
     if response.content == "": # If an agent was called, do the below:
@@ -81,6 +104,8 @@ async def chat(user_request, background_tasks: BackgroundTasks,  reset_user_stat
                          "background_tasks": background_tasks,
                          "customer_message": user_request.message,
                          "business_id": user_request.vendor_id, "customer_id": user_request.user_id})
+            if function_name == "ProductInfo":
+                args["prefetch"] = prefetch
         except:
             pass
         
@@ -89,21 +114,33 @@ async def chat(user_request, background_tasks: BackgroundTasks,  reset_user_stat
         if debug:
             print("Current conversation stage : ", conversation_stage)
         
-        # Call agent and fetch response.
-        response, user_state = await agent_functions[function_name](**args)
+        # Call agent and fetch response. The agents degrade their own replies near the deadline, this catches the rest.
+        try:
+            with span(f"agent:{function_name}", conversation_stage=conversation_stage):
+                response, user_state = await agent_functions[function_name](**args)
+        except DeadlineExceeded:
+            response = DEADLINE_MESSAGE
         
     else:
         # Else, just respond.
         response = str_output_parser.invoke(response)
+    prefetch.discard()
     
         
     # Update the chat history
-    user_state["chat_history"].extend([{"role": "user" , "name": "customer", "content": user_request.message},
+    add_to_chat_history(user_state, [{"role": "user" , "name": "customer", "content": user_request.message},
                             {"role": "assistant", "name": "vendor", "content": response}])
     
     if reset_user_state: # For debug purposes, if reset_user_state
-        await delete_user_state(user_request.user_id, user_request.vendor_id)
+        with span("delete_user_state"):
+            await delete_user_state(user_request.user_id, user_request.vendor_id)
     else: # Modify user state with recent update
-        await modify_user_state(user_request.user_id, user_request.vendor_id, user_state)
+        with span("modify_user_state"):
+            await modify_user_state(user_request.user_id, user_request.vendor_id, user_state)
+        
+        # Fold the oldest turns into the conversation summary in the background.
+        if needs_summary(user_state):
+            scheduler.submit(summarize_user_state, user_request.user_id, user_request.vendor_id,
+                             priority=Priority.HOUSEKEEPING, deadline=SUMMARY_JOB_DEADLINE)
         
     return response
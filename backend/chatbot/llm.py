@@ -0,0 +1,318 @@
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+import asyncio
+import hashlib
+import httpx
+import json
+import logging
+import openai
+import os
+import threading
+import time
+
+from backend import deadline
+from backend.chatbot.resilience import (LLM_CALL_DURATION, LLM_HEDGE_DELAYS, LLM_HEDGE_TOKENS, LLM_REQUEST_TIMEOUT,
+                                        aretrying, hedged, retrying)
+from backend.chatbot.routing import estimate_tokens, model_router, needs_json_schema
+from backend.telemetry.ledger import UsageCallback, ledger, record_completion
+
+"""
+Shared construction of the OpenAI clients used by the agents, with an optional record/replay cassette.
+
+Every agent builds its models with chat_model() (LangChain) or openai_client() (raw OpenAI SDK). With
+LLM_CASSETTE_MODE unset they are plain clients. With a cassette, their HTTP traffic goes through CassetteTransport:
+- record: requests are sent to OpenAI as usual; each request and its response (and how long it took) is saved
+  to LLM_CASSETTE_PATH.
+- replay: nothing is sent; the recorded response of an identical request is returned after the recorded latency,
+  a fixed synthetic latency (LLM_CASSETTE_LATENCY=<milliseconds>) or none (LLM_CASSETTE_LATENCY=none).
+  A request that was never recorded raises CassetteMiss.
+
+Requests are matched on method, path and JSON body, so a replayed conversation must build the same prompts as the
+recorded one. Identical requests recorded several times are replayed in recording order.
+
+Every model is also named after the agent using it (`agent`): its token usage and cost land in the LLM ledger
+(backend/telemetry/ledger.py), and each of its calls goes to the model the router (backend/chatbot/routing.py) picks
+for that agent.
+"""
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "")  # "", "record" or "replay"
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "backend/tests/cassettes/llm_cassette.json")
+LLM_CASSETTE_LATENCY = os.getenv("LLM_CASSETTE_LATENCY", "original")  # "original", "none" or milliseconds
+
+# Response headers that no longer apply once the body is stored decoded.
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def request_key(request: httpx.Request) -> str:
+    body = request.content or b""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True).encode("utf-8")
+    except ValueError:
+        pass
+    return hashlib.sha256(request.method.encode() + b" " + request.url.path.encode() + b"\n" + body).hexdigest()
+
+
+class CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(self, path: str, mode: str, latency: str = "original"):
+        """
+        Parameters:
+        - path (str): Cassette file.
+        - mode (str): "record" or "replay".
+        - latency (str): Replay latency, "original", "none" or milliseconds.
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.entries = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._transport = None
+        self._async_transport = None
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0, "llm_seconds": 0.0}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        elif mode == "replay":
+            raise FileNotFoundError(f"No LLM cassette at {path}, record one with LLM_CASSETTE_MODE=record")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "replay":
+            entry = self._next(request)
+            time.sleep(self._delay(entry))
+            return self._response(entry)
+
+        if self._transport is None:
+            self._transport = httpx.HTTPTransport()
+        start = time.perf_counter()
+        response = self._transport.handle_request(request)
+        content = response.read()
+        response.close()
+        return self._record(request, response, content, time.perf_counter() - start)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "replay":
+            entry = self._next(request)
+            await asyncio.sleep(self._delay(entry))
+            return self._response(entry)
+
+        if self._async_transport is None:
+            self._async_transport = httpx.AsyncHTTPTransport()
+        start = time.perf_counter()
+        response = await self._async_transport.handle_async_request(request)
+        content = await response.aread()
+        await response.aclose()
+        return self._record(request, response, content, time.perf_counter() - start)
+
+    def _next(self, request):
+        key = request_key(request)
+        with self._lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"No recorded response for {request.method} {request.url.path} ({key[:12]})")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.stats["replayed"] += 1
+        return recorded[position % len(recorded)]
+
+    def _delay(self, entry):
+        if self.latency == "original":
+            delay = entry["latency"]
+        elif self.latency == "none":
+            delay = 0.0
+        else:
+            delay = float(self.latency) / 1000
+        self.stats["llm_seconds"] += delay
+        return delay
+
+    def _response(self, entry):
+        return httpx.Response(entry["status_code"], headers=entry["headers"],
+                              content=entry["content"].encode("utf-8"))
+
+    def _record(self, request, response, content, latency):
+        entry = {
+            "request": {"method": request.method, "path": request.url.path,
+                        "body": (request.content or b"").decode("utf-8", "replace")},
+            "status_code": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS},
+            "content": content.decode("utf-8", "replace"),
+            "latency": latency,
+        }
+        with self._lock:
+            self.entries.setdefault(request_key(request), []).append(entry)
+            self.stats["recorded"] += 1
+            self.stats["llm_seconds"] += latency
+            self.save()
+        return self._response(entry)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f, indent=1)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+    async def aclose(self):
+        if self._async_transport is not None:
+            await self._async_transport.aclose()
+
+
+cassette = CassetteTransport(LLM_CASSETTE_PATH, LLM_CASSETTE_MODE, LLM_CASSETTE_LATENCY) if LLM_CASSETTE_MODE else None
+
+
+class RoutedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose calls go to the model picked by the model router, with their latency and errors fed back to it.
+    invoke/ainvoke calls are retried on transient errors and, for the agents in LLM_HEDGE_DELAYS, ainvoke calls are
+    hedged (see resilience.py). Direct stream/astream calls are routed but not retried.
+    """
+    agent: str = "default"
+
+    def _select(self, messages, kwargs) -> str:
+        return model_router.select(
+            self.agent, self.model_name,
+            prompt_tokens=estimate_tokens(messages, {key: kwargs[key] for key in ("tools", "functions") if key in kwargs}),
+            json_schema=needs_json_schema(kwargs.get("response_format")))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if "model" in kwargs:
+            # Already routed: _generate of a streaming model calls _stream.
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        generate = super()._generate
+
+        def attempt():
+            model = self._select(messages, kwargs)
+            request_timeout = deadline.timeout(LLM_REQUEST_TIMEOUT)
+            with model_router.timed(self.agent, model, request_timeout):
+                return generate(messages, stop, run_manager, model=model, timeout=request_timeout, **kwargs)
+
+        with LLM_CALL_DURATION.labels(self.agent, "off").time():
+            return retrying(self.agent, attempt)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if "model" in kwargs:
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        generate = super()._agenerate
+        delay = LLM_HEDGE_DELAYS.get(self.agent)
+
+        async def attempt():
+            model = self._select(messages, kwargs)
+
+            async def start():
+                request_timeout = deadline.timeout(LLM_REQUEST_TIMEOUT)
+                with model_router.timed(self.agent, model, request_timeout):
+                    return await generate(messages, stop, run_manager, model=model, timeout=request_timeout, **kwargs)
+
+            if delay is None:
+                return await start()
+            return await hedged(self.agent, start, delay, on_fire=lambda: record_hedge(self.agent, model, messages))
+
+        with LLM_CALL_DURATION.labels(self.agent, "off" if delay is None else "on").time():
+            return await aretrying(self.agent, attempt)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if "model" in kwargs:
+            yield from super()._stream(messages, stop, run_manager, **kwargs)
+            return
+        model = self._select(messages, kwargs)
+        request_timeout = deadline.timeout(LLM_REQUEST_TIMEOUT)
+        with model_router.timed(self.agent, model, request_timeout):
+            yield from super()._stream(messages, stop, run_manager, model=model, timeout=request_timeout, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if "model" in kwargs:
+            async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+        model = self._select(messages, kwargs)
+        request_timeout = deadline.timeout(LLM_REQUEST_TIMEOUT)
+        with model_router.timed(self.agent, model, request_timeout):
+            async for chunk in super()._astream(messages, stop, run_manager, model=model, timeout=request_timeout,
+                                                **kwargs):
+                yield chunk
+
+
+def record_hedge(agent: str, model: str, messages):
+    """
+    Count the prompt of a fired hedge as the extra cost of hedging. Its completion is cancelled with the losing request
+    and not counted.
+    """
+    prompt_tokens = estimate_tokens(messages)
+    LLM_HEDGE_TOKENS.labels(agent).inc(prompt_tokens)
+    ledger.record(f"{agent}:hedge", model, prompt_tokens, 0)
+
+
+def chat_model(agent: str, **kwargs) -> ChatOpenAI:
+    """
+    Build a ChatOpenAI model whose usage is recorded in the LLM ledger.
+
+    Parameters:
+    - agent (str): Agent using the model, the `agent` of its ledger records.
+    - kwargs: The ChatOpenAI arguments (model, temperature, streaming, ...). `model` is the agent's preferred model,
+      the router may pick an alternate per call.
+    """
+    if cassette is not None:
+        kwargs.setdefault("http_client", httpx.Client(transport=cassette))
+        kwargs.setdefault("http_async_client", httpx.AsyncClient(transport=cassette))
+    # Streamed responses only report their token usage when asked to.
+    kwargs.setdefault("stream_usage", True)
+    kwargs.setdefault("timeout", LLM_REQUEST_TIMEOUT)
+    # Retried by RoutedChatOpenAI, so each attempt can go to another model.
+    kwargs.setdefault("max_retries", 0)
+    kwargs["callbacks"] = [*kwargs.get("callbacks", []), UsageCallback(agent)]
+    return RoutedChatOpenAI(agent=agent, **kwargs)
+
+
+def openai_client(**kwargs) -> openai.OpenAI:
+    """
+    Build an OpenAI SDK client. Takes the openai.OpenAI arguments. Make its calls with `tracked`.
+    """
+    if cassette is not None:
+        kwargs.setdefault("http_client", httpx.Client(transport=cassette))
+    kwargs.setdefault("timeout", LLM_REQUEST_TIMEOUT)
+    kwargs.setdefault("max_retries", 0)
+    return openai.OpenAI(**kwargs)
+
+
+def tracked(agent: str, create, **kwargs):
+    """
+    Call an OpenAI SDK completion method on the model picked by the model router, retrying transient errors, and
+    record its usage in the LLM ledger.
+
+    Parameters:
+    - agent (str): Agent making the call.
+    - create: The SDK method, e.g. client.chat.completions.create.
+    - kwargs: Its arguments, `model` being the agent's preferred model.
+
+    Returns:
+    The completion.
+    """
+    preferred = kwargs.pop("model")
+
+    def attempt():
+        model = model_router.select(
+            agent, preferred,
+            prompt_tokens=estimate_tokens(kwargs["messages"], {key: kwargs[key] for key in ("tools",) if key in kwargs}),
+            json_schema=needs_json_schema(kwargs.get("response_format")))
+        request_timeout = deadline.timeout(LLM_REQUEST_TIMEOUT)
+        started = time.perf_counter()
+        with model_router.timed(agent, model, request_timeout):
+            completion = create(model=model, timeout=request_timeout, **kwargs)
+        record_completion(agent, completion, started)
+        return completion
+
+    with LLM_CALL_DURATION.labels(agent, "off").time():
+        return retrying(agent, attempt)
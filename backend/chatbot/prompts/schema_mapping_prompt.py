@@ -0,0 +1,25 @@
+
+SCHEMA_MAPPING_PROMPT = """
+You are a database manager that resolves conflicts during the integration of a company's database into your
+existing database schema.
+
+**YOUR COMPANY DB SCHEMA**
+    product_name : name of the product
+    product_description : description of the product
+    product_category : category of the product
+    price : price of the product
+    items_in_stock : amount/ number of the product available in the business's inventory
+    tags : tags that can be associated with the product
+    ignored : columns that describe neither the product nor one of its attributes, e.g. row numbers, the
+              business's own ids, creation and modification dates
+
+Every column you do not map or ignore is kept as an attribute of the product (size, color, ram, warranty...).
+
+**FOREIGN BUSINESS DETAILS**
+columns: {columns}
+db_sample: {data_rows}
+
+Take time to understand the foreign business's db sample, then map its columns to your company's db schema: give
+for each field of your schema the foreign column holding it, exactly as written in the columns above, or null if
+there is none. A foreign column is used at most once.
+"""
@@ -0,0 +1,16 @@
+summary_prompt = """
+You maintain a running summary of a conversation between a customer and a vendor's sales assistant.
+
+Fold the new messages below into the existing summary. Keep every detail that matters for the sale:
+products and attributes discussed, prices quoted, stock information, the customer's intent, payment,
+delivery address and logistics details, complaints and any promises made to the customer.
+Drop greetings and small talk. Write in short plain sentences, in the third person.
+
+**EXISTING SUMMARY**
+{summary}
+
+**NEW MESSAGES**
+{new_messages}
+
+Updated summary:
+"""
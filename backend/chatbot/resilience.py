@@ -0,0 +1,198 @@
+from prometheus_client import Counter, Gauge, Histogram
+from typing import Awaitable, Callable, Dict
+import asyncio
+import json
+import logging
+import openai
+import os
+import random
+import threading
+import time
+
+from backend import deadline
+from backend.deadline import DeadlineExceeded
+from backend.telemetry.tracing import LATENCY_BUCKETS
+
+"""
+Timeouts, jittered retries, per-model circuit breakers and hedged requests for the LLM calls.
+
+- Every call times out after LLM_REQUEST_TIMEOUT seconds, or earlier at the turn's deadline (backend/deadline.py).
+- Transient failures (connection errors, timeouts, 408/409/429 and 5xx) are retried up to LLM_MAX_RETRIES times with
+  full-jitter exponential backoff, each attempt routed again so it can fail over to an alternate model. A retry that
+  would run past the turn's deadline is not made, DeadlineExceeded is raised instead.
+- Each model has a circuit breaker: LLM_BREAKER_FAILURES consecutive failures open it, the router then skips the
+  model for LLM_BREAKER_RESET_SECONDS, after which a single trial call decides whether it closes again.
+- Hedging is opt-in per agent: LLM_HEDGE_DELAYS='{"router": 2.5}' fires a duplicate of a router call that has not
+  answered within 2.5 seconds; the first response wins and the other is cancelled. Only ainvoke calls are hedged.
+
+LLM_CALL_DURATION, labelled by whether hedging was on, shows the tail latency with and without hedging; the prompt
+tokens of every fired hedge are counted in LLM_HEDGE_TOKENS and in the LLM ledger (agent "<agent>:hedge"), the cost
+of hedging. backend/tests/benchmarks/bench_hedging.py measures both against the mock OpenAI server.
+"""
+
+logger = logging.getLogger(__name__)
+
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 30))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", 0.5))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", 8))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+# Seconds after which a duplicate request is fired, per agent. Agents not listed are not hedged.
+LLM_HEDGE_DELAYS: Dict[str, float] = json.loads(os.getenv("LLM_HEDGE_DELAYS", "{}"))
+
+LLM_CALL_DURATION = Histogram("autobiz_llm_call_duration_seconds",
+                              "Duration of LLM calls including retries and hedges.", ["agent", "hedging"],
+                              buckets=LATENCY_BUCKETS)
+LLM_RETRIES = Counter("autobiz_llm_retries", "LLM calls retried after a transient error.", ["agent", "error"])
+LLM_HEDGES = Counter("autobiz_llm_hedges", "Hedged LLM requests fired, and which request answered first.",
+                     ["agent", "outcome"])
+LLM_HEDGE_TOKENS = Counter("autobiz_llm_hedge_prompt_tokens", "Estimated prompt tokens sent by hedged requests.",
+                           ["agent"])
+BREAKER_STATE = Gauge("autobiz_llm_breaker_open", "1 while the circuit breaker of a model is open.", ["model"])
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_retriable(error: BaseException) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        # A replay cassette miss will not be recorded by trying again.
+        return type(error.__cause__).__name__ != "CassetteMiss"
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def backoff(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped.
+    """
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, model: str, failures: int = LLM_BREAKER_FAILURES,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.model = model
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go to the model. Once the reset time has passed, lets a single trial call through; a trial
+        that never reports (cancelled) is replaced after another reset period.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = "half_open"
+            self.opened_at = time.monotonic()
+            return True
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                if self.state != "closed":
+                    logger.warning(f"Circuit of {self.model} closed")
+                self.state = "closed"
+                self.consecutive_failures = 0
+                BREAKER_STATE.labels(self.model).set(0)
+                return
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failures:
+                if self.state == "closed":
+                    logger.warning(f"Circuit of {self.model} opened after {self.consecutive_failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                BREAKER_STATE.labels(self.model).set(1)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(model)
+    return _breakers[model]
+
+
+async def hedged(agent: str, start: Callable[[], Awaitable], delay: float, on_fire: Callable = None):
+    """
+    Run start(), and a second start() if the first has not finished after `delay` seconds. Returns the first
+    successful result and cancels the other; raises only if both fail.
+
+    Parameters:
+    - agent (str): Agent making the call, for the metrics.
+    - start: Starts the request, returns an awaitable.
+    - delay (float): Seconds to wait before hedging.
+    - on_fire: Called when the hedge is fired.
+    """
+    primary = asyncio.ensure_future(start())
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(start())
+        tasks.add(hedge)
+        LLM_HEDGES.labels(agent, "fired").inc()
+        if on_fire:
+            on_fire()
+
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [task for task in done if not task.cancelled() and task.exception() is None]
+            if winners:
+                winner = primary if primary in winners else winners[0]
+                LLM_HEDGES.labels(agent, "hedge_won" if winner is hedge else "primary_won").inc()
+                return winner.result()
+            error = next(task.exception() for task in done if not task.cancelled())
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def retrying(agent: str, attempt: Callable):
+    """
+    Call attempt() until it succeeds, retrying transient errors with jittered backoff.
+    """
+    for n in range(LLM_MAX_RETRIES + 1):
+        try:
+            return attempt()
+        except Exception as e:
+            if n == LLM_MAX_RETRIES or not is_retriable(e):
+                raise
+            wait = backoff(n)
+            if not deadline.allows(wait):
+                raise DeadlineExceeded(f"No time left to retry {agent} after {type(e).__name__}") from e
+            LLM_RETRIES.labels(agent, type(e).__name__).inc()
+            time.sleep(wait)
+
+
+async def aretrying(agent: str, attempt: Callable[[], Awaitable]):
+    """
+    Async version of `retrying`.
+    """
+    for n in range(LLM_MAX_RETRIES + 1):
+        try:
+            return await attempt()
+        except Exception as e:
+            if n == LLM_MAX_RETRIES or not is_retriable(e):
+                raise
+            wait = backoff(n)
+            if not deadline.allows(wait):
+                raise DeadlineExceeded(f"No time left to retry {agent} after {type(e).__name__}") from e
+            LLM_RETRIES.labels(agent, type(e).__name__).inc()
+            await asyncio.sleep(wait)
@@ -0,0 +1,251 @@
+from collections import deque
+from contextlib import contextmanager
+from prometheus_client import Counter
+from typing import Dict, List, Optional
+import json
+import logging
+import openai
+import os
+import threading
+import time
+
+from backend.chatbot.resilience import LLM_REQUEST_TIMEOUT, CircuitOpenError, breaker, is_retriable
+from backend.telemetry.ledger import ledger
+from backend.telemetry.tracing import current_trace
+
+"""
+Per-call model selection for the agents.
+
+Each agent keeps the model it was built with as its preferred model, followed by alternates (LLM_MODEL_ALTERNATES,
+or the agent's own list in LLM_ROUTING). Before every call the router skips the candidates that cannot serve it:
+- the prompt does not fit the model's context window (MODEL_CONTEXT_TOKENS),
+- the call asks for a JSON schema response_format and the model does not support it (JSON_SCHEMA_MODELS),
+- the model is degraded: its error rate over the last LLM_ROUTING_WINDOW_SECONDS is above LLM_ROUTING_MAX_ERROR_RATE,
+  or its p95 latency for this agent is above the agent's target (LLM_LATENCY_TARGETS).
+and uses the first remaining one whose circuit breaker (resilience.py) is not open. A degraded model gets a probe call
+every LLM_ROUTING_PROBE_SECONDS so it is picked again once it recovers. When every candidate is degraded, the one
+with the lowest p95 is used; when every circuit is open, CircuitOpenError is raised without calling OpenAI.
+
+A business close to its daily LLM budget (see backend/telemetry/ledger.py) gets LLM_BUDGET_MODEL first.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Cheaper model preferred by every agent while its business is close to its daily LLM budget.
+LLM_BUDGET_MODEL = os.getenv("LLM_BUDGET_MODEL", "gpt-4o-mini")
+LLM_ROUTING_WINDOW_SECONDS = float(os.getenv("LLM_ROUTING_WINDOW_SECONDS", 300))
+LLM_ROUTING_MIN_SAMPLES = int(os.getenv("LLM_ROUTING_MIN_SAMPLES", 5))
+LLM_ROUTING_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTING_MAX_ERROR_RATE", 0.25))
+LLM_ROUTING_PROBE_SECONDS = float(os.getenv("LLM_ROUTING_PROBE_SECONDS", 30))
+
+LLM_MODEL_ALTERNATES = {
+    "gpt-3.5-turbo": ["gpt-4o-mini"],
+    "gpt-4o-mini": ["gpt-3.5-turbo"],
+    "gpt-4o": ["gpt-4o-mini"],
+    **json.loads(os.getenv("LLM_MODEL_ALTERNATES", "{}")),
+}
+# Full candidate list of an agent, replaces its model and alternates, e.g. '{"router": ["gpt-4o-mini"]}'.
+LLM_ROUTING = json.loads(os.getenv("LLM_ROUTING", "{}"))
+# p95 seconds per agent above which its model is considered degraded.
+LLM_LATENCY_TARGETS = {
+    "router": 3.0,
+    "business_router": 4.0,
+    "product_evaluator": 4.0,
+    "product_agent": 6.0,
+    "upselling_agent": 6.0,
+    "central_agent": 8.0,
+    "tools": 8.0,
+    "summarizer": 30.0,
+    **json.loads(os.getenv("LLM_LATENCY_TARGETS", "{}")),
+}
+DEFAULT_LATENCY_TARGET = float(os.getenv("LLM_DEFAULT_LATENCY_TARGET", 10))
+
+MODEL_CONTEXT_TOKENS = {"gpt-3.5-turbo": 16_385, "gpt-4o-mini": 128_000, "gpt-4o": 128_000, "gpt-4": 8_192}
+JSON_SCHEMA_MODELS = ("gpt-4o-mini", "gpt-4o")
+# Tokens kept free in the context window for the completion.
+COMPLETION_RESERVE_TOKENS = 1_000
+
+ROUTED_CALLS = Counter("autobiz_llm_routed_calls", "LLM calls per agent and the model the router picked.",
+                       ["agent", "model", "reason"])
+
+
+def estimate_tokens(messages, extra=None) -> int:
+    """
+    Rough token count of a prompt (4 characters per token), enough to compare against context windows.
+
+    Parameters:
+    - messages: LangChain messages or OpenAI message dicts.
+    - extra: Other request arguments sent with the prompt (tools, response_format), counted by their JSON size.
+    """
+    chars = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", message)
+        chars += len(content) if isinstance(content, str) else len(json.dumps(content, default=str))
+    if extra:
+        chars += len(json.dumps(extra, default=str))
+    return chars // 4
+
+
+def needs_json_schema(response_format) -> bool:
+    if response_format is None:
+        return False
+    if isinstance(response_format, dict):
+        return response_format.get("type") == "json_schema"
+    # A pydantic model, as given to client.beta.chat.completions.parse.
+    return isinstance(response_format, type)
+
+
+def _matches(model: str, names) -> bool:
+    return any(model.startswith(name) for name in names)
+
+
+def _context_tokens(model: str) -> int:
+    for name in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_TOKENS[name]
+    return MODEL_CONTEXT_TOKENS["gpt-4o"]
+
+
+class ModelRouter:
+    def __init__(self):
+        # model -> deque of (time, ok), shared by all agents: an outage shows up whichever agent hits it.
+        self._outcomes: Dict[str, deque] = {}
+        # (agent, model) -> deque of (time, latency), latency depends on the agent's prompts.
+        self._latencies: Dict[tuple, deque] = {}
+        self._last_probe: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, agent: str, model: str) -> List[str]:
+        models = LLM_ROUTING.get(agent) or [model, *LLM_MODEL_ALTERNATES.get(model, [])]
+        if ledger.budget_status(current_trace().get("business")) == "degrade":
+            models = [LLM_BUDGET_MODEL, *models]
+        return list(dict.fromkeys(models))
+
+    def select(self, agent: str, model: str, prompt_tokens: int = 0, json_schema: bool = False) -> str:
+        """
+        Pick the model of a call.
+
+        Parameters:
+        - agent (str): Agent making the call.
+        - model (str): Model the agent was built with.
+        - prompt_tokens (int): Estimated size of the prompt.
+        - json_schema (bool): Whether the call needs JSON schema structured output.
+
+        Returns:
+        str: The model to call.
+        """
+        candidates = self.candidates(agent, model)
+        capable = [candidate for candidate in candidates
+                   if prompt_tokens + COMPLETION_RESERVE_TOKENS <= _context_tokens(candidate)
+                   and (not json_schema or _matches(candidate, JSON_SCHEMA_MODELS))]
+        if not capable:
+            # Nothing fits, let the API report it rather than guessing.
+            return self._routed(agent, model, "incapable")
+
+        now = time.monotonic()
+        degraded = []
+        for candidate in capable:
+            if self.degraded(agent, candidate, now) is None:
+                reason = "preferred" if candidate == capable[0] else "failover"
+            elif self._probe(candidate, now):
+                reason = "probe"
+            else:
+                degraded.append((self.p95(agent, candidate, now) or 0.0, candidate))
+                continue
+            # Checked last: letting a call through an open circuit makes it the circuit's trial call.
+            if breaker(candidate).allow():
+                return self._routed(agent, candidate, reason)
+        for _, candidate in sorted(degraded):
+            if breaker(candidate).allow():
+                return self._routed(agent, candidate, "all_degraded")
+        raise CircuitOpenError(f"Circuit open for every model {agent} can use: {', '.join(capable)}")
+
+    def degraded(self, agent: str, model: str, now: float = None) -> Optional[str]:
+        """
+        Returns:
+        Optional[str]: Why the model is degraded for this agent, None if it is healthy.
+        """
+        now = now or time.monotonic()
+        outcomes = self._recent(self._outcomes.get(model), now)
+        if len(outcomes) >= LLM_ROUTING_MIN_SAMPLES:
+            error_rate = sum(1 for ok in outcomes if not ok) / len(outcomes)
+            if error_rate > LLM_ROUTING_MAX_ERROR_RATE:
+                return f"error rate {error_rate:.0%}"
+        p95 = self.p95(agent, model, now)
+        target = LLM_LATENCY_TARGETS.get(agent, DEFAULT_LATENCY_TARGET)
+        if p95 is not None and p95 > target:
+            return f"p95 {p95:.1f}s above {target:.1f}s"
+        return None
+
+    def p95(self, agent: str, model: str, now: float = None) -> Optional[float]:
+        latencies = sorted(self._recent(self._latencies.get((agent, model)), now or time.monotonic()))
+        if len(latencies) < LLM_ROUTING_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def observe(self, agent: str, model: str, latency: float, ok: bool):
+        """
+        Record the outcome of a call. Failed calls only count towards the error rate, not the latency.
+        """
+        breaker(model).record(ok)
+        now = time.monotonic()
+        with self._lock:
+            self._outcomes.setdefault(model, deque(maxlen=500)).append((now, ok))
+            if ok:
+                self._latencies.setdefault((agent, model), deque(maxlen=200)).append((now, latency))
+
+    @contextmanager
+    def timed(self, agent: str, model: str, timeout: float = None):
+        """
+        Time a call and record its outcome. Only failures of the model count against it: errors caused by the
+        request (non-retriable 4xx) and timeouts of a call the turn's deadline had shortened are not recorded.
+
+        Parameters:
+        - timeout (float): Timeout the call was made with.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            cut_short = isinstance(e, openai.APITimeoutError) and timeout is not None and timeout < LLM_REQUEST_TIMEOUT
+            if is_retriable(e) and not cut_short:
+                self.observe(agent, model, time.perf_counter() - start, ok=False)
+            raise
+        self.observe(agent, model, time.perf_counter() - start, ok=True)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        agents = {}
+        for agent, model in list(self._latencies):
+            agents.setdefault(agent, {})[model] = {"p95": self.p95(agent, model, now),
+                                                   "target": LLM_LATENCY_TARGETS.get(agent, DEFAULT_LATENCY_TARGET),
+                                                   "degraded": self.degraded(agent, model, now)}
+        models = {}
+        for model, outcomes in list(self._outcomes.items()):
+            recent = self._recent(outcomes, now)
+            models[model] = {"calls": len(recent), "errors": sum(1 for ok in recent if not ok),
+                             "circuit": breaker(model).state}
+        return {"models": models, "agents": agents}
+
+    def _recent(self, samples, now):
+        if not samples:
+            return []
+        with self._lock:
+            return [value for at, value in samples if now - at <= LLM_ROUTING_WINDOW_SECONDS]
+
+    def _probe(self, model, now):
+        with self._lock:
+            # The first probe waits a full interval after the model is found degraded.
+            if now - self._last_probe.setdefault(model, now) < LLM_ROUTING_PROBE_SECONDS:
+                return False
+            self._last_probe[model] = now
+            return True
+
+    def _routed(self, agent, model, reason):
+        ROUTED_CALLS.labels(agent, model, reason).inc()
+        if reason not in ("preferred", "probe"):
+            logger.info(f"Routing {agent} to {model}: {reason}")
+        return model
+
+
+model_router = ModelRouter()
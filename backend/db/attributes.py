@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional
+import re
+
+"""
+Structured product attributes (size, colour, RAM, storage...), kept in the attributes JSONB column of products.
+
+Attributes are stored and compared normalized, so the router's {"Colour": "Blue "} finds {"color": "blue"}:
+- keys are lowercased snake_case, with the usual synonyms folded into one name (ATTRIBUTE_KEY_ALIASES);
+- values are lowercased strings with single spaces, and a number's unit is written against it ("16 GB" -> "16gb");
+- empty values, and the router's "any"-like values, are dropped.
+get_products filters with JSONB containment (`attributes @> {...}`), which the GIN index on the column answers;
+`filter_products` applies the same filter to rows already fetched.
+"""
+
+ATTRIBUTE_KEY_ALIASES = {
+    "colour": "color",
+    "colors": "color",
+    "colours": "color",
+    "sizes": "size",
+    "memory": "ram",
+    "storage_space": "storage",
+    "storage_capacity": "storage",
+    "scent": "fragrance",
+}
+
+# A number and its unit, written together once normalized.
+UNIT_PATTERN = r"(\d)\s+([a-z]{1,3}\b)"
+
+# Values meaning the customer has no preference.
+ANY_VALUES = frozenset({"any", "anything", "none", "null", "n/a", "na", "not specified", "unspecified"})
+
+
+def normalize_key(key) -> str:
+    key = re.sub(r"[^a-z0-9]+", "_", str(key).strip().lower()).strip("_")
+    return ATTRIBUTE_KEY_ALIASES.get(key, key)
+
+
+def normalize_value(value) -> str:
+    value = " ".join(str(value).lower().split())
+    return re.sub(UNIT_PATTERN, r"\1\2", value)
+
+
+def normalize_attributes(attributes) -> Dict[str, str]:
+    """
+    Normalized, non-empty attributes, {} for anything that is not a dict (the router sometimes sends a string).
+    """
+    if not isinstance(attributes, dict):
+        return {}
+    normalized = {}
+    for key, value in attributes.items():
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        key, value = normalize_key(key), normalize_value(value)
+        if key and value and value not in ANY_VALUES:
+            normalized[key] = value
+    return normalized
+
+
+def matches(product_attributes: Optional[dict], wanted: Dict[str, str]) -> bool:
+    """
+    Whether a product has every wanted attribute, as `attributes @> wanted` does in Postgres.
+    """
+    product_attributes = product_attributes or {}
+    return all(product_attributes.get(key) == value for key, value in wanted.items())
+
+
+def filter_products(products: List[dict], attributes) -> List[dict]:
+    """
+    The products (as returned by Product.to_dict()) having the given attributes.
+    """
+    wanted = normalize_attributes(attributes)
+    if not wanted:
+        return products
+    return [product for product in products if matches(product.get("attributes"), wanted)]
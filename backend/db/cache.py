@@ -7,6 +7,8 @@ from redis import Redis
 import os
 import json
 
+from .config import REDIS_SOCKET_TIMEOUT
+
 # load_dotenv()
 DEBUG = os.getenv("DEBUG")
 REDIS_URL = os.getenv("REDIS_URL")
@@ -19,19 +21,35 @@ class Cache:
             host=host,
             port=port,
             password=password,
-            decode_responses=True)
+            decode_responses=True,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT)
         else:
             if REDIS_URL:
-                self._client = Redis.from_url(REDIS_URL)
+                # Bounded, so a stalled Redis fails the turn instead of holding it.
+                self._client = Redis.from_url(REDIS_URL, socket_timeout=REDIS_SOCKET_TIMEOUT,
+                                              socket_connect_timeout=REDIS_SOCKET_TIMEOUT)
             else:
                 self._client = RedisCluster(
                     host=host,
                     port=port,
                     password=password,
-                    decode_responses=True)
+                    decode_responses=True,
+                    socket_timeout=REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=REDIS_SOCKET_TIMEOUT)
+
+    @property
+    def client(self):
+        return self._client
+
+    def set(self, key: str, val: dict) -> int:
+        """Store a value as JSON. Returns the size in bytes of the stored value."""
+        data = json.dumps(val)
+        self._client.set(key, data)
+        return len(data)
 
-    def set(self, key: str, val: dict) -> None: 
-        self._client.set(key, json.dumps(val))
+    def set_if_absent(self, key: str, val, ttl: int = None) -> bool:
+        return bool(self._client.set(key, json.dumps(val), nx=True, ex=ttl))
 
     def get(self, key: str) -> dict:
         value = self._client.get(key)
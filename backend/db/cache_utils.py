@@ -1,4 +1,5 @@
 from .cache import Cache
+from backend.telemetry.tracing import record_state_size
 from .config import (
     REDIS_SERVER_HOST,
     REDIS_SERVER_PORT,
@@ -25,7 +26,8 @@ async def get_user_state(user_id, vendor_id, session_id= None):
 
 async def modify_user_state(user_id, vendor_id, user_state,  session_id=None):
     # Rewrite history to redis.
-    redis_conn.set(f"{user_id}:{vendor_id}", user_state)
+    key = f"{user_id}:{vendor_id}"
+    record_state_size(key, redis_conn.set(key, user_state))
     # redis_conn.set_chat_history(session_id, chat_history)
 
     return
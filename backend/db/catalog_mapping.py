@@ -0,0 +1,162 @@
+from pydantic import BaseModel
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+
+import pandas as pd
+
+from .attributes import ANY_VALUES, normalize_key, normalize_value
+from .descriptors import descriptor_encoding, details, render_descriptor
+
+"""
+Mapping of a vendor's catalogue file onto the products table, and the vectorized transform that applies it.
+
+A SchemaMapping names, for each products field, the file column holding it (columns are referred to by their
+normalized header: stripped and lowercased). Columns the mapping ignores (row numbers, the vendor's own ids,
+timestamps) are dropped, every other column becomes a product attribute (backend/db/attributes.py). Files are
+recognised by their header signature, so a mapping is worked out once per layout: backend/db/ingest.py keeps the
+mappings and loads the rows, nothing here touches the database or an LLM.
+"""
+
+PRODUCT_FIELDS = ("product_name", "product_description", "product_category", "price", "items_in_stock", "tags")
+REQUIRED_FIELDS = ("product_name", "price")
+
+
+class SchemaMapping(BaseModel):
+    """File column of each products field, None when the file has no such column."""
+    product_name: Optional[str] = None
+    product_description: Optional[str] = None
+    product_category: Optional[str] = None
+    price: Optional[str] = None
+    items_in_stock: Optional[str] = None
+    tags: Optional[str] = None
+    # Columns that are neither a products field nor a product attribute.
+    ignored: List[str] = []
+
+
+# Layouts we know without asking: the catalogue files of dummy_data/.
+BUILTIN_MAPPINGS = [
+    SchemaMapping(product_name="product", product_description="description", product_category="product category",
+                  price="price", items_in_stock="available amount",
+                  ignored=["id", "date created", "date modified"]),
+]
+
+
+def normalize_header(columns: Iterable[str]) -> List[str]:
+    return [str(column).strip().lower() for column in columns]
+
+
+def header_signature(columns: Iterable[str]) -> str:
+    """
+    Signature of a file layout: the same columns in any order and case give the same signature.
+    """
+    return hashlib.sha1("\x1f".join(sorted(normalize_header(columns))).encode("utf-8")).hexdigest()
+
+
+def builtin_mapping(columns: Iterable[str]) -> Optional[SchemaMapping]:
+    header = set(normalize_header(columns))
+    for mapping in BUILTIN_MAPPINGS:
+        used = {getattr(mapping, field) for field in PRODUCT_FIELDS if getattr(mapping, field)} | set(mapping.ignored)
+        if used == header:
+            return mapping
+    return None
+
+
+def validate_mapping(mapping: SchemaMapping, columns: Iterable[str]) -> SchemaMapping:
+    """
+    The mapping with its column names normalized and the columns the file does not have dropped.
+
+    Raises:
+    ValueError: If the product name or price column is missing.
+    """
+    header = set(normalize_header(columns))
+    fields = {}
+    for field in PRODUCT_FIELDS:
+        column = getattr(mapping, field)
+        column = str(column).strip().lower() if column else None
+        fields[field] = column if column in header else None
+    missing = [field for field in REQUIRED_FIELDS if fields[field] is None]
+    if missing:
+        raise ValueError(f"No column for {', '.join(missing)} in {sorted(header)}")
+    ignored = [column for column in normalize_header(mapping.ignored) if column in header]
+    return SchemaMapping(**fields, ignored=ignored)
+
+
+def _normalized_values(values: pd.Series) -> pd.Series:
+    # Attribute columns take few distinct values: each is normalized once.
+    normalized = {value: normalize_value(value) for value in values.unique()}
+    normalized = {value: result for value, result in normalized.items() if result and result not in ANY_VALUES}
+    return values.map(normalized)
+
+
+def transform(frame: pd.DataFrame, mapping: SchemaMapping, business_id: int,
+              lengths: Dict[str, int] = None) -> Tuple[List[dict], int]:
+    """
+    Rows of the products table for a chunk of a catalogue file.
+
+    Parameters:
+    - frame (pd.DataFrame): Rows of the file, read as strings without NA conversion.
+    - mapping (SchemaMapping): A mapping validated against the file.
+    - business_id (int): Business the products belong to.
+    - lengths (Dict[str, int]): Maximum length of the string fields, longer values are cut.
+
+    Returns:
+    Tuple[List[dict], int]: The rows, with their attributes and descriptor, and the number of rows skipped for
+    having no product name or no readable price.
+    """
+    frame = frame.set_axis(normalize_header(frame.columns), axis=1)
+    lengths = lengths or {}
+    empty = pd.Series("", index=frame.index)
+
+    def text(field):
+        values = frame[getattr(mapping, field)].str.strip() if getattr(mapping, field) else empty
+        return values.str.slice(0, lengths[field]) if field in lengths else values
+
+    def number(field):
+        if not getattr(mapping, field):
+            return pd.Series(float("nan"), index=frame.index)
+        return pd.to_numeric(frame[getattr(mapping, field)].str.replace(r"[^0-9.\-]", "", regex=True),
+                             errors="coerce")
+
+    rows = pd.DataFrame({
+        "business_id": business_id,
+        "product_name": text("product_name"),
+        "product_description": text("product_description"),
+        "product_category": text("product_category"),
+        "price": number("price"),
+        "items_in_stock": number("items_in_stock").round().astype("Int64"),
+        "tags": text("tags"),
+    })
+
+    mapped = {getattr(mapping, field) for field in PRODUCT_FIELDS} | set(mapping.ignored)
+    attributes: Dict[str, pd.Series] = {}
+    for column in frame.columns:
+        if column in mapped:
+            continue
+        key, values = normalize_key(column), _normalized_values(frame[column])
+        if key:
+            attributes[key] = attributes[key].fillna(values) if key in attributes else values
+
+    keep = (rows["product_name"] != "") & rows["price"].notna()
+    rows = rows[keep]
+    columns = {field: rows[field].astype(object).where(rows[field].notna(), None).tolist() for field in rows.columns}
+    keys = list(attributes)
+    attribute_values = [attributes[key][keep].astype(object).where(attributes[key][keep].notna(), None).tolist()
+                        for key in keys]
+
+    records = []
+    details_cache: Dict[tuple, str] = {}
+    for i, values in enumerate(zip(*columns.values())):
+        record = dict(zip(columns, values))
+        record["attributes"] = {key: key_values[i] for key, key_values in zip(keys, attribute_values)
+                                if key_values[i] is not None}
+        # Rows with the same attributes and tags share their details.
+        signature = (tuple(record["attributes"].items()), record["tags"])
+        if signature not in details_cache:
+            details_cache[signature] = details([record])
+        record["descriptor"] = render_descriptor({**record, "items_left_in_stock": record["items_in_stock"]},
+                                                 details_cache[signature])
+        records.append(record)
+    tokens = descriptor_encoding().encode_batch([record["descriptor"] for record in records])
+    for record, descriptor_tokens in zip(records, tokens):
+        record["descriptor_tokens"] = len(descriptor_tokens)
+    return records, int((~keep).sum())
@@ -1,28 +1,53 @@
-from sqlalchemy import create_engine
+from psycopg2.errors import QueryCanceled
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from contextlib import contextmanager
 
+from backend import deadline
 from .config import (
     DATABASE_USERNAME,
     DATABASE_PASSWORD,
     DATABASE_HOST,
-    DATABASE_NAME
+    DATABASE_NAME,
+    DATABASE_CONNECT_TIMEOUT
 )
 
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWORD}@{DATABASE_HOST}/{DATABASE_NAME}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"connect_timeout": DATABASE_CONNECT_TIMEOUT},
+                       pool_timeout=DATABASE_CONNECT_TIMEOUT)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+@event.listens_for(SessionLocal, "after_begin")
+def apply_deadline(session, transaction, connection):
+    """
+    Inside a turn with a deadline, make Postgres cancel statements that run past it. Runs at the start of every
+    transaction of a session, so statements after a commit are covered too.
+    """
+    if deadline.remaining() is not None:
+        # Scoped to the transaction, so pooled connections do not keep it.
+        milliseconds = int(deadline.timeout(float("inf"), reserve=0) * 1000)
+        connection.execute(text("SELECT set_config('statement_timeout', :ms, true)"), {"ms": str(max(milliseconds, 1))})
+
+
 @contextmanager
 def get_db():
+    """
+    Session for a unit of work. Inside a turn with a deadline, Postgres cancels statements that run past it
+    (see apply_deadline).
+    """
     db = SessionLocal()
     try:
         yield db
+    except OperationalError as e:
+        if isinstance(e.orig, QueryCanceled) and deadline.remaining() is not None:
+            raise deadline.DeadlineExceeded("Database statement cancelled at the turn deadline") from e
+        raise
     finally:
         db.close()
@@ -2,15 +2,31 @@ from sqlalchemy import or_
 # from sqlalchemy.orm import sessionmaker
 from .models import Product, Business, Transaction #, engine
 from .database import engine, Base, get_db 
+from .product_cache import product_cache
+from .attributes import normalize_attributes
+from .descriptors import render_descriptor
+from .popularity import (
+    CONVERSION_WEIGHT,
+    POPULARITY_HALF_LIFE_DAYS,
+    POPULARITY_WEIGHT,
+    POPULARITY_WINDOW_DAYS,
+    score_products,
+)
+from datetime import datetime, timedelta
 from typing import List
 from sqlalchemy.inspection import inspect
 from sqlalchemy import text
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, case, func, update
 from typing import List
 from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm.attributes import flag_modified
 
 Base.metadata.create_all(bind=engine)
 
+# Product columns get_products filters on when passed as keyword arguments. Not business_id: the agents' context
+# carries the vendor's handle under that name.
+PRODUCT_FILTER_COLUMNS = ("product_description", "product_category", "tags", "items_in_stock")
+
 ## POSTGRES DATABASE FUNCTIONS
 
 
@@ -19,8 +35,22 @@ async def get_products(
     category: str = None,
     min_price: float = None,
     max_price: float = None,
+    attributes: dict = None,
     **kwargs
 ):
+    """
+    Parameters:
+    - name (str): Text the product name, description or tags contain.
+    - category (str): Product category (not filtered on yet).
+    - min_price (float), max_price (float): Price bounds.
+    - attributes (dict): Attributes the products must have, e.g. {"colour": "blue", "size": "M"}, compared
+      normalized (see backend/db/attributes.py).
+    - kwargs: Other product columns to filter on, e.g. product_category="Shoes". Unknown keys are ignored, callers pass
+      their whole context.
+
+    Returns:
+    List[dict]: Products, as returned by Product.to_dict().
+    """
     with get_db() as db:
         products_query = db.query(Product)
 
@@ -43,15 +73,27 @@ async def get_products(
         if max_price is not None:
             products_query = products_query.filter(Product.price <= max_price)
 
+        # Variant narrowing in the database, answered by the GIN index on attributes.
+        wanted = normalize_attributes(attributes)
+        if wanted:
+            products_query = products_query.filter(Product.attributes.contains(wanted))
+
         # Dynamically add filters based on kwargs
-        # for key, value in kwargs.items():
-        #     column_attr = getattr(Product, key, None)
-        #     if column_attr is not None:
-        #         if isinstance(value, str):
-        #             value = f"%{value}%"
-        #             products_query = products_query.filter(column_attr.ilike(value))
-        #         else:
-        #             products_query = products_query.filter(column_attr == value)
+        for key, value in kwargs.items():
+            if key not in PRODUCT_FILTER_COLUMNS or value is None:
+                continue
+            column_attr = getattr(Product, key)
+            if isinstance(value, str):
+                value = f"%{value}%"
+                products_query = products_query.filter(column_attr.ilike(value))
+            else:
+                products_query = products_query.filter(column_attr == value)
+
+        # Most likely to sell first (see backend/db/popularity.py), so a broad search is not in table order.
+        products_query = products_query.order_by(
+            (POPULARITY_WEIGHT * Product.popularity_score + CONVERSION_WEIGHT * Product.conversion_score).desc(),
+            Product.id,
+        )
 
         products = products_query.all()
 
@@ -60,6 +102,103 @@ async def get_products(
     return products
 
 
+def get_products_by_keywords(keywords: List[str], limit: int = 200):
+    """
+    Products whose name, description or tags contain any of the keywords, i.e. a superset of what get_products would
+    return for any name containing one of them.
+
+    Parameters:
+    - keywords (List[str]): Lowercase alphanumeric keywords.
+    - limit (int): Maximum number of products to fetch.
+
+    Returns:
+    List[tuple]: (lowercase name, description and tags, product dict) pairs, or None if more than `limit` products
+    matched.
+    """
+    with get_db() as db:
+        columns = (Product.product_name, Product.product_description, Product.tags)
+        products = db.query(Product).filter(
+            or_(*[column.ilike(f"%{keyword}%") for keyword in keywords for column in columns])
+        ).limit(limit + 1).all()
+        if len(products) > limit:
+            return None
+        return [(tuple((getattr(product, column.key) or "").lower() for column in columns), product.to_dict())
+                for product in products]
+
+
+def refresh_product_scores() -> int:
+    """
+    Recompute the popularity and conversion scores of every product from its recent transactions (the product_scores
+    job). Only changed scores are written, and the product cache of each business with changes is invalidated once.
+
+    Returns:
+    int: Number of products whose scores changed.
+    """
+    with get_db() as db:
+        age_days = func.extract("epoch", func.now() - Transaction.date) / 86400
+        verified = Transaction.payment_status == "verified"
+        stats = db.query(
+            Transaction.product_id,
+            func.coalesce(func.sum(case(
+                (verified, Transaction.items_bought * func.power(0.5, age_days / POPULARITY_HALF_LIFE_DAYS)),
+                else_=0,
+            )), 0),
+            func.count().filter(verified),
+            func.count(),
+        ).filter(
+            Transaction.date >= datetime.now() - timedelta(days=POPULARITY_WINDOW_DAYS)
+        ).group_by(Transaction.product_id).all()
+
+        current = db.query(Product.id, Product.business_id, Product.popularity_score, Product.conversion_score).all()
+        scores = score_products([(row.id, row.business_id) for row in current],
+                                {product_id: (float(units), verified_count, total)
+                                 for product_id, units, verified_count, total in stats})
+
+        now = datetime.now()
+        changes, businesses = [], set()
+        for row in current:
+            popularity, conversion = scores[row.id]
+            if (popularity, conversion) != (row.popularity_score, row.conversion_score):
+                changes.append({"id": row.id, "popularity_score": popularity, "conversion_score": conversion,
+                                "scores_updated_at": now})
+                businesses.add(row.business_id)
+        if changes:
+            # Bulk update by primary key: no ORM events, the caches are invalidated once per business below.
+            db.execute(update(Product), changes)
+            db.commit()
+
+    for business_id in businesses:
+        product_cache.invalidate(business_id)
+    return len(changes)
+
+
+def refresh_product_descriptors(batch_size: int = 1000) -> int:
+    """
+    Describe again the products whose descriptor is missing or no longer matches the row, i.e. products written
+    outside the ORM (raw SQL, bulk inserts), the product_descriptors job. The Product events fill the descriptors
+    in and the commits invalidate the product caches.
+
+    Returns:
+    int: Number of products described.
+    """
+    described, last_id = 0, 0
+    with get_db() as db:
+        while True:
+            products = db.query(Product).filter(Product.id > last_id).order_by(Product.id).limit(batch_size).all()
+            if not products:
+                break
+            last_id = products[-1].id
+            stale = [product for product in products
+                     if product.descriptor != render_descriptor(product.to_dict())]
+            for product in stale:
+                flag_modified(product, "descriptor")
+            if stale:
+                db.commit()
+                described += len(stale)
+            db.expunge_all()
+    return described
+
+
 # async def get_products(
 #     name: str = None,
 #     category: str = None,
@@ -139,12 +278,15 @@ def search_products(query: str, limit: int = 10, offset: int = 0) -> List[Produc
                 SELECT *
                 FROM products
                 WHERE ts_vector @@ to_tsquery('english', :query)
-                ORDER BY ts_rank(ts_vector, to_tsquery('english', :query)) DESC
+                ORDER BY ts_rank(ts_vector, to_tsquery('english', :query))
+                    * (1 + :popularity_weight * popularity_score + :conversion_weight * conversion_score) DESC
                 LIMIT :limit OFFSET :offset
             """)
             
             results = db.execute(sql_query, {
                 "query": formatted_query,
+                "popularity_weight": POPULARITY_WEIGHT,
+                "conversion_weight": CONVERSION_WEIGHT,
                 "limit": limit,
                 "offset": offset
             })
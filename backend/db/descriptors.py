@@ -0,0 +1,88 @@
+from functools import lru_cache
+from typing import Dict, List
+import os
+
+import tiktoken
+
+"""
+Product descriptors: the one line a prompt shows for a product, "name | price | stock | details", where the details
+are its attributes and tags, e.g. "Shirt | 29.99 | 50 | color: red, size: l; cotton, casual".
+
+The descriptor and its token count (measured with the encoding of DESCRIPTOR_TOKEN_MODEL) are computed when a
+product is written and stored on its row (see the Product events in models.py), so prompts paste them as they are:
+the per-product prompt cost is known in advance instead of re-rendered and re-counted on every request. Prompts must
+not show a stale price or stock though: readers use the stored line only while it starts with the row's current name,
+price and stock (descriptor_line), and render it again otherwise. Rows written outside the ORM (raw SQL, bulk
+inserts), which the events never see, are described again by the product_descriptors job (refresh_product_descriptors
+in db_utils.py).
+"""
+
+DESCRIPTOR_TOKEN_MODEL = os.getenv("DESCRIPTOR_TOKEN_MODEL", "gpt-4o-mini")
+DESCRIPTOR_MAX_CHARS = 300
+TAGS_MAX_CHARS = 80
+ATTRIBUTES_MAX_CHARS = 120
+
+HEADER = "product | price | stock | details"
+
+
+def format_price(value) -> str:
+    return f"{value:,.2f}" if isinstance(value, (int, float)) else str(value)
+
+
+def details(products: List[dict]) -> str:
+    """
+    Attributes (the values of all the products, for variants shown on one line) and tags of the first product.
+    """
+    values: Dict[str, List[str]] = {}
+    for product in products:
+        for key, value in (product.get("attributes") or {}).items():
+            if value not in values.setdefault(key, []):
+                values[key].append(value)
+    attributes = ", ".join(f"{key}: {'/'.join(map(str, key_values))}" for key, key_values in values.items())
+    tags = str(products[0].get("tags") or "")[:TAGS_MAX_CHARS]
+    return "; ".join(part for part in (attributes[:ATTRIBUTES_MAX_CHARS], tags) if part)
+
+
+def _live_fields(product: dict) -> str:
+    stock = product.get("items_left_in_stock")
+    return f"{product['product_name']} | {format_price(product.get('price'))} | {'' if stock is None else stock} | "
+
+
+def render_descriptor(product: dict, product_details: str = None) -> str:
+    """
+    Descriptor of a product, as returned by Product.to_dict().
+
+    Parameters:
+    - product (dict): The product.
+    - product_details (str): Its details() when already known, e.g. shared by the rows of a file with the same
+      attributes and tags.
+    """
+    if product_details is None:
+        product_details = details([product])
+    return (_live_fields(product) + product_details)[:DESCRIPTOR_MAX_CHARS]
+
+
+def is_current(product: dict) -> bool:
+    """
+    Whether a product's stored descriptor shows its current name, price and stock.
+    """
+    return bool(product.get("descriptor")) and product["descriptor"].startswith(_live_fields(product))
+
+
+def descriptor_line(product: dict) -> str:
+    """
+    The stored descriptor of a product, rendered again when its price or stock has changed since it was stored.
+    """
+    return product["descriptor"] if is_current(product) else render_descriptor(product)
+
+
+@lru_cache(maxsize=None)
+def descriptor_encoding():
+    try:
+        return tiktoken.encoding_for_model(DESCRIPTOR_TOKEN_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(descriptor: str) -> int:
+    return len(descriptor_encoding().encode(descriptor))
@@ -1,8 +1,11 @@
 from datetime import datetime
 
 import pandas as pd
-from backend.db.models import Business, Product, Transaction
+from backend.db.models import Business, Product, ProductAlias, Transaction
 from backend.db.database import engine
+from backend.db import product_cache  # keeps the shared product cache current with the rows loaded here
+from backend.db.fuzzy_catalog import fuzzy_catalog
+from backend.db.attributes import normalize_attributes
 from sqlalchemy.orm import sessionmaker
 
 Session = sessionmaker(bind=engine)
@@ -11,7 +14,16 @@ session = Session()
 Session = sessionmaker(bind=engine)
 
 
-def load_csv_to_db(csv_file_path, table_name):
+def load_csv_to_db(csv_file_path, table_name, business_id=None):
+    """
+    Parameters:
+    - csv_file_path (str): CSV file to load.
+    - table_name (str): businesses, products, product_aliases or transactions.
+    - business_id (int): Business the products belong to, for product files whose id column numbers the rows
+      (kemi_surprises.csv, tesla_tech.csv) instead of holding the business id.
+
+    Catalogue files in other layouts, or large ones, go through backend/db/ingest.py.
+    """
     df = pd.read_csv(csv_file_path)
     df = df.fillna("")
     df = df.astype(str)
@@ -46,28 +58,39 @@ def load_csv_to_db(csv_file_path, table_name):
                 session.add(business)
 
         elif table_name == "products":
+            # Columns other than these are the products' attributes (size, color, ram...).
+            core_columns = {"id", "Product", "Description", "Product details", "Price", "price", "Available amount",
+                            "amount in stock", "Product category", "category of product", "Date created",
+                            "Date modified"}
+            attribute_columns = [column for column in df.columns if column not in core_columns]
             for index, row in df.iterrows():
                 print(row)  # Print each row for debugging
+                stock = row.get("Available amount", row.get("amount in stock", ""))
                 product = Product(
-                    business_id=row["id"],
+                    business_id=business_id if business_id is not None else row["id"],
                     product_name=row["Product"],
-                    product_description=row["Description"],
-                    product_category=row["Product category"],
-                    price=float(row["Price"]),
-                    items_in_stock=int(row["Available amount"]),
+                    product_description=row.get("Description", row.get("Product details", "")),
+                    product_category=row.get("Product category", row.get("category of product", "")),
+                    price=float(row.get("Price", row.get("price"))),
+                    items_in_stock=int(stock) if stock else None,
+                    attributes=normalize_attributes({column: row[column] for column in attribute_columns}),
                     date_created=(
                         datetime.strptime(row["Date created"], "%Y-%m-%d")
-                        if row["Date created"]
+                        if row.get("Date created")
                         else datetime.now()
                     ),
                     date_modified=(
                         datetime.strptime(row["Date modified"], "%Y-%m-%d")
-                        if row["Date modified"]
+                        if row.get("Date modified")
                         else datetime.now()
                     ),
                 )
                 session.add(product)
 
+        elif table_name == "product_aliases":
+            for index, row in df.iterrows():
+                session.add(ProductAlias(business_id=row["id"], alias=row["Alias"], product_name=row["Product"]))
+
         elif table_name == "transactions":
             for index, row in df.iterrows():
                 transaction = Transaction(
@@ -95,6 +118,12 @@ def load_csv_to_db(csv_file_path, table_name):
         # Commit the transaction
         session.commit()
 
+        # Build the fuzzy search index of the catalogues just loaded, rather than on their first search.
+        if table_name in ("products", "product_aliases"):
+            business_ids = [business_id] if business_id is not None else df["id"].unique()
+            for catalog_id in business_ids:
+                fuzzy_catalog.index(int(catalog_id))
+
     except Exception as e:
         # Rollback the transaction in case of an error
         session.rollback()
@@ -0,0 +1,73 @@
+from prometheus_client import Counter, Histogram
+from typing import Dict, List, Tuple
+import logging
+import threading
+import time
+
+from .database import get_db
+from .fuzzy_index import FUZZY_MAX_RESULTS, FuzzyIndex
+from .models import Product, ProductAlias
+from .product_cache import product_cache
+
+"""
+Fuzzy product search per business (see backend/db/fuzzy_index.py), used by the product agent when the `%name%` search
+of get_products finds nothing.
+
+Each business's index is built from its products and product_aliases rows and kept in memory per catalogue version
+(backend/db/product_cache.py): a product or alias change bumps the version and the next search rebuilds the index.
+load_csv_to_db builds the indexes of the catalogues it ingests.
+"""
+
+logger = logging.getLogger(__name__)
+
+FUZZY_SEARCHES = Counter("autobiz_fuzzy_searches", "Fuzzy product searches, by whether they found products.",
+                         ["result"])
+FUZZY_INDEX_BUILD = Histogram("autobiz_fuzzy_index_build_seconds", "Time to build a business's fuzzy product index.",
+                              buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+
+class FuzzyCatalog:
+    def __init__(self):
+        # business id -> (catalogue version, index)
+        self._indexes: Dict[int, Tuple[int, FuzzyIndex]] = {}
+        self._lock = threading.Lock()
+
+    def index(self, business_id: int) -> FuzzyIndex:
+        """
+        The business's index, rebuilt when its catalogue version changed.
+        """
+        version = product_cache.version(business_id)
+        cached = self._indexes.get(business_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        with self._lock:
+            cached = self._indexes.get(business_id)
+            if cached and cached[0] == version:
+                return cached[1]
+            start = time.perf_counter()
+            with get_db() as db:
+                products = db.query(Product.id, Product.product_name, Product.tags) \
+                    .filter(Product.business_id == business_id).all()
+                aliases = db.query(ProductAlias.alias, ProductAlias.product_name) \
+                    .filter(ProductAlias.business_id == business_id).all()
+            index = FuzzyIndex(products, aliases)
+            elapsed = time.perf_counter() - start
+            FUZZY_INDEX_BUILD.observe(elapsed)
+            logger.info(f"Fuzzy index of business {business_id} (catalogue v{version}): {len(products)} products, "
+                        f"{len(aliases)} aliases, {len(index.vocabulary)} words in {elapsed * 1000:.0f}ms")
+            self._indexes[business_id] = (version, index)
+            return index
+
+    def search(self, business_id: int, query: str, limit: int = FUZZY_MAX_RESULTS) -> List[dict]:
+        """
+        Products of the business matching the query despite typos, spacing and aliases.
+
+        Returns:
+        List[dict]: Current product rows (Product.to_dict()), best match first.
+        """
+        matches = self.index(business_id).search(query, limit)
+        FUZZY_SEARCHES.labels("found" if matches else "none").inc()
+        return product_cache.get([[business_id, product_id] for product_id, _ in matches])
+
+
+fuzzy_catalog = FuzzyCatalog()
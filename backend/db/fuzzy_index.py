@@ -0,0 +1,152 @@
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import logging
+import os
+import re
+
+"""
+Typo-tolerant product matching, for the enquiries the `%name%` search of get_products misses ("iphone12",
+"samsng s21", or a business's own word for a product like "snickers").
+
+A FuzzyIndex is built from a catalogue's product names and tags and its aliases:
+- the vocabulary is every word of the names and tags, plus each pair of adjacent name words written together
+  ("iphone12" for "iPhone 12"), plus the aliases, which point to the products of the name they stand for;
+- each vocabulary word has the ids of the products it appears in, and each character trigram the words containing it.
+A query word found in the vocabulary matches directly. Otherwise the words sharing the most trigrams with it are
+verified with a bounded edit distance, and kept when their similarity (1 - distance / length) is at least
+FUZZY_MIN_SIMILARITY. A product matches when it has a match for every query word that matched anything, and products
+are ranked by their mean similarity.
+
+backend/db/fuzzy_catalog.py keeps an index per business; backend/tests/benchmarks/bench_fuzzy_match.py measures
+accuracy and latency.
+"""
+
+logger = logging.getLogger(__name__)
+
+FUZZY_MIN_SIMILARITY = float(os.getenv("FUZZY_MIN_SIMILARITY", 0.75))
+# Vocabulary words verified with the edit distance per query word, by most trigrams shared.
+FUZZY_MAX_CANDIDATES = int(os.getenv("FUZZY_MAX_CANDIDATES", 50))
+FUZZY_MAX_RESULTS = int(os.getenv("FUZZY_MAX_RESULTS", 20))
+
+
+def normalize(text) -> List[str]:
+    return re.findall(r"[a-z0-9]+", str(text or "").lower())
+
+
+def trigrams(word: str) -> set:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Levenshtein distance between a and b, or limit + 1 as soon as it is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    def __init__(self, products: Iterable[Tuple[int, str, str]], aliases: Iterable[Tuple[str, str]] = (),
+                 min_similarity: float = FUZZY_MIN_SIMILARITY):
+        """
+        Parameters:
+        - products: (product id, name, tags) of the catalogue.
+        - aliases: (alias, product name it stands for) pairs.
+        - min_similarity (float): Similarity from which a word matches a vocabulary word.
+        """
+        self.min_similarity = min_similarity
+        self.vocabulary: List[str] = []
+        self._word_ids: Dict[str, int] = {}
+        postings: List[set] = []
+
+        def add(word, product_ids):
+            if word not in self._word_ids:
+                self._word_ids[word] = len(self.vocabulary)
+                self.vocabulary.append(word)
+                postings.append(set())
+            postings[self._word_ids[word]].update(product_ids)
+
+        for product_id, name, tags in products:
+            words = normalize(name)
+            for word in words + normalize(tags):
+                add(word, (product_id,))
+            for first, second in zip(words, words[1:]):
+                add(first + second, (product_id,))
+
+        for alias, target in aliases:
+            target_ids = None
+            for word in normalize(target):
+                word_ids = postings[self._word_ids[word]] if word in self._word_ids else set()
+                target_ids = set(word_ids) if target_ids is None else target_ids & word_ids
+            if not target_ids:
+                logger.warning(f"Alias {alias!r} stands for {target!r}, which matches no product")
+                continue
+            words = normalize(alias)
+            for word in words + [first + second for first, second in zip(words, words[1:])]:
+                add(word, target_ids)
+
+        # Compact, read-only from here on.
+        self.postings = [array("I", sorted(product_ids)) for product_ids in postings]
+        grams: Dict[str, List[int]] = {}
+        for word_id, word in enumerate(self.vocabulary):
+            for gram in trigrams(word):
+                grams.setdefault(gram, []).append(word_id)
+        self.grams = {gram: array("I", word_ids) for gram, word_ids in grams.items()}
+
+    def match_word(self, word: str) -> List[Tuple[int, float]]:
+        """
+        Vocabulary words similar enough to `word`, as (word id, similarity).
+        """
+        if word in self._word_ids:
+            return [(self._word_ids[word], 1.0)]
+        shared = Counter()
+        for gram in trigrams(word):
+            shared.update(self.grams.get(gram, ()))
+        matches = []
+        for word_id, _ in shared.most_common(FUZZY_MAX_CANDIDATES):
+            candidate = self.vocabulary[word_id]
+            longest = max(len(word), len(candidate))
+            limit = int((1 - self.min_similarity) * longest)
+            distance = edit_distance(word, candidate, limit)
+            if distance <= limit:
+                matches.append((word_id, 1 - distance / longest))
+        return matches
+
+    def search(self, query: str, limit: int = FUZZY_MAX_RESULTS) -> List[Tuple[int, float]]:
+        """
+        Products matching the query despite typos, spacing and aliases.
+
+        Returns:
+        List[Tuple[int, float]]: (product id, score between 0 and 1), best first.
+        """
+        words = normalize(query)
+        candidates = None
+        scores: Dict[int, float] = {}
+        for word in words:
+            best: Dict[int, float] = {}
+            for word_id, similarity in self.match_word(word):
+                for product_id in self.postings[word_id]:
+                    if similarity > best.get(product_id, 0):
+                        best[product_id] = similarity
+            if not best:
+                # A word the catalogue does not know ("the", "original") does not rule products out.
+                continue
+            candidates = set(best) if candidates is None else candidates & set(best)
+            for product_id in candidates:
+                scores[product_id] = scores.get(product_id, 0) + best[product_id]
+        if not candidates:
+            return []
+        ranked = sorted(((product_id, scores[product_id] / len(words)) for product_id in candidates),
+                        key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
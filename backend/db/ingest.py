@@ -0,0 +1,179 @@
+from prometheus_client import Counter, Histogram
+from pydantic import BaseModel
+from sqlalchemy import insert
+from typing import Dict, List, Tuple
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from backend.chatbot.llm import openai_client, tracked
+from backend.chatbot.prompts.schema_mapping_prompt import SCHEMA_MAPPING_PROMPT
+from .cache_utils import redis_conn
+from .catalog_mapping import SchemaMapping, builtin_mapping, header_signature, transform, validate_mapping
+from .database import get_db
+from .fuzzy_catalog import fuzzy_catalog
+from .models import Product
+from .product_cache import product_cache
+
+"""
+Ingestion of vendors' own catalogue files (any CSV layout) into the products table.
+
+    python -m backend.db.ingest dummy_data/tesla_tech.csv --business-id 6
+
+The file's layout is mapped onto the products schema once per header signature (backend/db/catalog_mapping.py):
+a built-in layout, else a mapping already worked out for that signature (kept in process and in the Redis hash
+INGEST_MAPPINGS_KEY, shared by every process), else one inferred by an LLM from the header and a few sample rows, then
+cached. A file whose layout is known is therefore imported without any LLM call. The file is then streamed in
+INGEST_CHUNK_ROWS chunks, each transformed with pandas column operations and bulk inserted (with its attributes and
+descriptors), in a single transaction. Bulk inserts skip the ORM events, so the business's product cache and fuzzy
+index are refreshed once the file is committed.
+"""
+
+logger = logging.getLogger(__name__)
+
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", 5_000))
+INGEST_SAMPLE_ROWS = 5
+INGEST_MAPPING_MODEL = os.getenv("INGEST_MAPPING_MODEL", "gpt-4o-mini")
+INGEST_MAPPINGS_KEY = "ingest:schema_mappings"
+
+INGEST_ROWS = Counter("autobiz_ingest_rows", "Catalogue file rows ingested, by result.", ["result"])
+INGEST_MAPPINGS = Counter("autobiz_ingest_mappings", "Catalogue file layouts resolved, by where the mapping came from.",
+                          ["source"])
+INGEST_DURATION = Histogram("autobiz_ingest_seconds", "Time to ingest a catalogue file.",
+                            buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300))
+
+client = openai_client()
+
+
+class IngestResult(BaseModel):
+    business_id: int
+    signature: str
+    mapping: SchemaMapping
+    mapping_source: str  # builtin, memory, redis or llm
+    rows_loaded: int
+    rows_skipped: int
+    seconds: float
+
+
+class MappingStore:
+    def __init__(self, cache=redis_conn):
+        self._client = cache.client
+        self._mappings: Dict[str, SchemaMapping] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, columns: List[str], sample: List[dict]) -> Tuple[SchemaMapping, str]:
+        """
+        The mapping of a file layout, and where it came from.
+
+        Parameters:
+        - columns (List[str]): The file's header.
+        - sample (List[dict]): A few rows of the file, for the LLM when the layout is new.
+
+        Raises:
+        ValueError: If no usable mapping (one with the product name and price) could be worked out.
+        """
+        mapping = builtin_mapping(columns)
+        if mapping is not None:
+            return validate_mapping(mapping, columns), "builtin"
+        signature = header_signature(columns)
+        if signature in self._mappings:
+            return self._mappings[signature], "memory"
+        # One inference per layout, even when several files of a new layout are ingested at once.
+        with self._lock:
+            if signature in self._mappings:
+                return self._mappings[signature], "memory"
+            cached = self._client.hget(INGEST_MAPPINGS_KEY, signature)
+            if cached is not None:
+                mapping, source = validate_mapping(SchemaMapping.model_validate_json(cached), columns), "redis"
+            else:
+                mapping, source = validate_mapping(infer_mapping(columns, sample), columns), "llm"
+                self._client.hset(INGEST_MAPPINGS_KEY, signature, mapping.model_dump_json())
+                logger.info(f"Mapping of catalogue layout {signature} inferred: {mapping.model_dump_json()}")
+            self._mappings[signature] = mapping
+        return mapping, source
+
+    def forget(self, columns: List[str]):
+        """
+        Drop a layout's mapping (e.g. a wrong inference) so the next file of that layout infers it again.
+        """
+        signature = header_signature(columns)
+        self._mappings.pop(signature, None)
+        self._client.hdel(INGEST_MAPPINGS_KEY, signature)
+
+
+mapping_store = MappingStore()
+
+
+def infer_mapping(columns: List[str], sample: List[dict]) -> SchemaMapping:
+    """
+    Ask the LLM how a file layout maps onto the products schema.
+    """
+    completion = tracked(
+        "schema_mapper",
+        client.beta.chat.completions.parse,
+        model=INGEST_MAPPING_MODEL,
+        messages=[{"role": "user", "content": SCHEMA_MAPPING_PROMPT.format(
+            columns=json.dumps(columns), data_rows=json.dumps(sample, default=str))}],
+        response_format=SchemaMapping,
+        temperature=0,
+    )
+    return completion.choices[0].message.parsed
+
+
+def ingest_catalog(csv_file_path: str, business_id: int, chunk_rows: int = INGEST_CHUNK_ROWS) -> IngestResult:
+    """
+    Load a vendor's catalogue file into the products table.
+
+    Parameters:
+    - csv_file_path (str): The CSV file, in any layout with a product name and a price column.
+    - business_id (int): Business the products belong to.
+    - chunk_rows (int): Rows transformed and inserted at a time.
+
+    Returns:
+    IngestResult: The mapping used and the rows loaded and skipped.
+    """
+    started = time.perf_counter()
+    lengths = {column.key: column.type.length for column in Product.__table__.columns
+               if getattr(column.type, "length", None)}
+    chunks = pd.read_csv(csv_file_path, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError(f"{csv_file_path} is empty")
+    columns = list(first.columns)
+    mapping, source = mapping_store.resolve(columns, first.head(INGEST_SAMPLE_ROWS).to_dict("records"))
+    INGEST_MAPPINGS.labels(source).inc()
+
+    loaded = skipped = 0
+    with get_db() as db:
+        for frames in ([first], chunks):
+            for frame in frames:
+                rows, chunk_skipped = transform(frame, mapping, business_id, lengths)
+                if rows:
+                    db.execute(insert(Product), rows)
+                loaded += len(rows)
+                skipped += chunk_skipped
+        db.commit()
+
+    product_cache.invalidate(business_id)
+    fuzzy_catalog.index(business_id)
+    INGEST_ROWS.labels("loaded").inc(loaded)
+    INGEST_ROWS.labels("skipped").inc(skipped)
+    seconds = time.perf_counter() - started
+    INGEST_DURATION.observe(seconds)
+    if skipped:
+        logger.warning(f"{csv_file_path}: {skipped} rows skipped for a missing product name or price")
+    return IngestResult(business_id=business_id, signature=header_signature(columns), mapping=mapping,
+                        mapping_source=source, rows_loaded=loaded, rows_skipped=skipped, seconds=round(seconds, 3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_file_path")
+    parser.add_argument("--business-id", type=int, required=True)
+    args = parser.parse_args()
+    print(ingest_catalog(args.csv_file_path, args.business_id).model_dump_json(indent=2))
@@ -6,14 +6,18 @@ from sqlalchemy import (
     Boolean,
     ForeignKey,
     DateTime,
+    Index,
+    text,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 # from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 from dotenv import load_dotenv
 from .database import Base, engine
+from .descriptors import DESCRIPTOR_MAX_CHARS, count_tokens, render_descriptor
 load_dotenv()
 
 class Business(Base):
@@ -76,20 +80,59 @@ class Product(Base):
     price = Column(Float, nullable=False)
     items_in_stock = Column(Integer)
     tags = Column(String(200))
+    # Normalized attributes (size, color, ram...), see backend/db/attributes.py.
+    attributes = Column(JSONB, nullable=False, default=dict, server_default=text("'{}'::jsonb"))
+    # Set by the product_scores job, see backend/db/popularity.py.
+    popularity_score = Column(Float, nullable=False, default=0, server_default=text("0"))
+    conversion_score = Column(Float, nullable=False, default=0, server_default=text("0"))
+    scores_updated_at = Column(DateTime)
+    # Prompt line of the product and its token count, kept current by the events below.
+    descriptor = Column(String(DESCRIPTOR_MAX_CHARS))
+    descriptor_tokens = Column(Integer)
     date_created = Column(DateTime, default=datetime.now)
     date_modified = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     business = relationship("Business", back_populates="products")
 
+    __table_args__ = (
+        # Answers the `attributes @> {...}` filters of get_products.
+        Index("ix_products_attributes", "attributes", postgresql_using="gin",
+              postgresql_ops={"attributes": "jsonb_path_ops"}),
+    )
+
     def to_dict(self):
         return {
+            "id": self.id,
+            "business_id": self.business_id,
             "product_name": self.product_name,
             "price": self.price,
             "items_left_in_stock": self.items_in_stock,
-            "tags": self.tags
+            "tags": self.tags,
+            "attributes": self.attributes or {},
+            "popularity": self.popularity_score or 0,
+            "conversion": self.conversion_score or 0,
+            "descriptor": self.descriptor,
+            "descriptor_tokens": self.descriptor_tokens,
         }
 
 
+@event.listens_for(Product, "before_insert")
+@event.listens_for(Product, "before_update")
+def _describe_product(mapper, connection, target):
+    target.descriptor = render_descriptor(target.to_dict())
+    target.descriptor_tokens = count_tokens(target.descriptor)
+
+
+class ProductAlias(Base):
+    """A business's own name for one of its products (e.g. "snickers" for "sneakers"), used by the fuzzy search."""
+    __tablename__ = "product_aliases"
+    id = Column(Integer, primary_key=True)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False, index=True)
+    alias = Column(String(100), nullable=False)
+    product_name = Column(String(100), nullable=False)  # product name, or words of the names it stands for
+    date_created = Column(DateTime, default=datetime.now)
+
+
 class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True)
@@ -107,5 +150,31 @@ class Transaction(Base):
     product = relationship("Product")
     business = relationship("Business", back_populates="transactions")
 
+
+class LLMUsage(Base):
+    """One LLM call: who it was made for, which agent made it, tokens used and what it cost (USD)."""
+    __tablename__ = "llm_usage"
+    id = Column(Integer, primary_key=True)
+    business_id = Column(String(100), index=True)  # vendor id the conversation belongs to
+    agent = Column(String(100), nullable=False)
+    model = Column(String(100), nullable=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)
+    latency_seconds = Column(Float)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
 # Create all tables in the engine
 Base.metadata.create_all(engine)
+
+# create_all does not alter existing tables: columns added since they were created.
+with engine.begin() as connection:
+    connection.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS attributes JSONB NOT NULL "
+                            "DEFAULT '{}'::jsonb"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_products_attributes ON products "
+                            "USING gin (attributes jsonb_path_ops)"))
+    connection.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS popularity_score FLOAT NOT NULL DEFAULT 0, "
+                            "ADD COLUMN IF NOT EXISTS conversion_score FLOAT NOT NULL DEFAULT 0, "
+                            "ADD COLUMN IF NOT EXISTS scores_updated_at TIMESTAMP"))
+    connection.execute(text(f"ALTER TABLE products ADD COLUMN IF NOT EXISTS descriptor VARCHAR({DESCRIPTOR_MAX_CHARS}), "
+                            "ADD COLUMN IF NOT EXISTS descriptor_tokens INTEGER"))
@@ -0,0 +1,64 @@
+from typing import Dict, Iterable, Tuple
+import math
+import os
+
+"""
+Popularity prior of products, so that when many products match an enquiry equally well ("shirt"), the ones most
+likely to sell reach the limited product context first.
+
+Two scores per product, between 0 and 1, computed from the transactions of the last POPULARITY_WINDOW_DAYS by the
+product_scores job (see refresh_product_scores in db_utils.py) and stored on the products rows:
+- popularity: units bought in verified transactions, each decayed by its age (halved every
+  POPULARITY_HALF_LIFE_DAYS), on a log scale relative to the business's best seller;
+- conversion: share of the product's transactions whose payment was verified, smoothed towards the business's own
+  rate with CONVERSION_PRIOR_STRENGTH transactions' worth of weight, so one lucky sale is not a 100% conversion.
+`prior` blends them; get_products orders by it and rank_products uses it to break ties between equally relevant
+products. Stock is applied live at ranking time (an out-of-stock product ranks after the others), not baked into the
+scores, so a restocked product does not wait for the next job run.
+"""
+
+POPULARITY_WINDOW_DAYS = int(os.getenv("POPULARITY_WINDOW_DAYS", 90))
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", 14))
+CONVERSION_PRIOR_STRENGTH = float(os.getenv("CONVERSION_PRIOR_STRENGTH", 5))
+POPULARITY_WEIGHT = float(os.getenv("POPULARITY_WEIGHT", 0.6))
+CONVERSION_WEIGHT = float(os.getenv("CONVERSION_WEIGHT", 0.4))
+
+
+def prior(product: dict) -> float:
+    """
+    Blended popularity prior of a product, as returned by Product.to_dict().
+    """
+    return POPULARITY_WEIGHT * (product.get("popularity") or 0) + CONVERSION_WEIGHT * (product.get("conversion") or 0)
+
+
+def score_products(products: Iterable[Tuple[int, int]],
+                   stats: Dict[int, Tuple[float, int, int]]) -> Dict[int, Tuple[float, float]]:
+    """
+    Popularity and conversion scores of a catalogue.
+
+    Parameters:
+    - products: (product id, business id) of every product to score.
+    - stats: Per product id with transactions in the window, (decayed units bought, verified transactions,
+      transactions).
+
+    Returns:
+    Dict[int, Tuple[float, float]]: (popularity, conversion) per product id, rounded to 4 decimals.
+    """
+    by_business: Dict[int, list] = {}
+    for product_id, business_id in products:
+        by_business.setdefault(business_id, []).append(product_id)
+
+    scores = {}
+    for business_id, product_ids in by_business.items():
+        business_stats = [stats[product_id] for product_id in product_ids if product_id in stats]
+        best = max((math.log1p(units) for units, _, _ in business_stats), default=0)
+        verified = sum(count for _, count, _ in business_stats)
+        total = sum(count for _, _, count in business_stats)
+        business_rate = verified / total if total else 0
+        for product_id in product_ids:
+            units, product_verified, product_total = stats.get(product_id, (0, 0, 0))
+            popularity = math.log1p(units) / best if best else 0.0
+            conversion = (product_verified + CONVERSION_PRIOR_STRENGTH * business_rate) / \
+                (product_total + CONVERSION_PRIOR_STRENGTH)
+            scores[product_id] = (round(popularity, 4), round(conversion, 4))
+    return scores
@@ -0,0 +1,137 @@
+from prometheus_client import Counter
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List
+import json
+import logging
+import os
+
+from .cache_utils import redis_conn
+from .database import get_db
+from .models import Product, ProductAlias
+
+"""
+Shared product cache, one per business, so conversation states only keep references to catalogue rows.
+
+A conversation's user_state["products"] holds, per product enquired about, the [business_id, product_id] references
+of the rows retrieved (see refs()) and the evaluator's verdict. The rows themselves are read with get(), from a Redis
+hash per business shared by every conversation, and loaded from Postgres on a miss.
+
+The hash is versioned: its key is catalog:<business_id>:v<version>, the version being a counter in
+catalog:<business_id>:version. Any insert, update or delete of a business's products (or product aliases) through
+the ORM bumps the version once the transaction commits, so the next read goes to a new, empty hash and sees the new
+prices and stock; a reader that loaded rows from the database before the change can only write them to the old hash.
+Old hashes expire after PRODUCT_CACHE_TTL, which also bounds how long a change made outside the ORM (raw SQL) can go
+unnoticed; call invalidate() after such changes.
+"""
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_CACHE_TTL = int(os.getenv("PRODUCT_CACHE_TTL", 3600))
+
+PRODUCT_CACHE = Counter("autobiz_product_cache", "Product rows read from the shared product cache.", ["result"])
+
+
+def _version_key(business_id) -> str:
+    return f"catalog:{business_id}:version"
+
+
+def _rows_key(business_id, version) -> str:
+    return f"catalog:{business_id}:v{version}"
+
+
+def refs(products: Iterable[dict]) -> List[list]:
+    """
+    References of product rows, as kept in the conversation state.
+    """
+    return [[product["business_id"], product["id"]] for product in products]
+
+
+class ProductCache:
+    def __init__(self, cache=redis_conn, ttl: int = PRODUCT_CACHE_TTL):
+        self._client = cache.client
+        self.ttl = ttl
+
+    def version(self, business_id) -> int:
+        return int(self._client.get(_version_key(business_id)) or 0)
+
+    def get(self, product_refs: List[list]) -> List[dict]:
+        """
+        Current rows of the referenced products, in reference order. Products deleted since are left out.
+
+        Parameters:
+        - product_refs (List[list]): [business_id, product_id] pairs, see refs().
+
+        Returns:
+        List[dict]: Rows as returned by Product.to_dict().
+        """
+        by_business: Dict[int, List[int]] = {}
+        for business_id, product_id in product_refs:
+            by_business.setdefault(business_id, []).append(product_id)
+
+        rows = {}
+        for business_id, product_ids in by_business.items():
+            # Read before the database, so rows loaded across a change are written to the outdated hash.
+            key = _rows_key(business_id, self.version(business_id))
+            cached = self._client.hmget(key, product_ids) if product_ids else []
+            missing = []
+            for product_id, value in zip(product_ids, cached):
+                if value is None:
+                    missing.append(product_id)
+                else:
+                    rows[(business_id, product_id)] = json.loads(value)
+            PRODUCT_CACHE.labels("hit").inc(len(product_ids) - len(missing))
+            if missing:
+                PRODUCT_CACHE.labels("miss").inc(len(missing))
+                loaded = self._load(missing)
+                rows.update({(business_id, row["id"]): row for row in loaded})
+                if loaded:
+                    pipeline = self._client.pipeline(transaction=False)
+                    pipeline.hset(key, mapping={row["id"]: json.dumps(row) for row in loaded})
+                    pipeline.expire(key, self.ttl)
+                    pipeline.execute()
+
+        return [rows[(business_id, product_id)] for business_id, product_id in product_refs
+                if (business_id, product_id) in rows]
+
+    def invalidate(self, business_id):
+        """
+        Make the next reads of the business's products go to the database.
+        """
+        self._client.incr(_version_key(business_id))
+
+    def _load(self, product_ids):
+        with get_db() as db:
+            return [product.to_dict() for product in db.query(Product).filter(Product.id.in_(product_ids)).all()]
+
+
+product_cache = ProductCache()
+
+
+# Versions are bumped after commit: bumping at flush time would let a reader cache the rows the
+# transaction is about to replace in the new hash.
+
+def _product_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_catalogs", set()).add(target.business_id)
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(Product, _event, _product_changed)
+    # Aliases are part of the catalogue's fuzzy index, which is rebuilt per version.
+    event.listen(ProductAlias, _event, _product_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_versions(session):
+    for business_id in session.info.pop("changed_catalogs", ()):
+        try:
+            product_cache.invalidate(business_id)
+        except Exception as e:
+            logger.warning(f"Could not invalidate the product cache of business {business_id}: {e!r}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session):
+    session.info.pop("changed_catalogs", None)
@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import asyncio
+import os
+import time
+
+"""
+Per-turn deadlines.
+
+Each entry point opens a deadline (`with deadline(TURN_DEADLINE_SECONDS):`) that every call made for the turn can
+read, including in the agents, tasks and threads it awaits:
+- LLM calls time out at the deadline minus DEADLINE_RESERVE_SECONDS (`timeout`) and are not retried past it.
+- Database statements are cancelled by Postgres at the deadline (statement_timeout, set on every transaction).
+- Awaited steps can be bounded with `within`, which raises DeadlineExceeded.
+The reserve is left for the agents to answer with a degraded reply (e.g. the product list without the LLM pitch)
+rather than an error. Nested deadlines only ever shorten the current one.
+"""
+
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", 25))
+# Seconds kept back at the end of a turn's budget to build and send the degraded reply.
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", 1.5))
+# Reply of a turn that ran out of time before any agent could answer.
+DEADLINE_MESSAGE = os.getenv("DEADLINE_MESSAGE", "Sorry, this is taking longer than expected. "
+                                                 "Could you send your message again in a moment?")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Give the block `seconds` to complete, or keep the current deadline if it is sooner.
+    """
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Returns:
+    Optional[float]: Seconds left before the deadline (negative once passed), None without a deadline.
+    """
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def timeout(cap: float, reserve: float = DEADLINE_RESERVE_SECONDS) -> float:
+    """
+    Timeout for a call: `cap`, shortened to end `reserve` seconds before the deadline.
+
+    Raises:
+    DeadlineExceeded: if that leaves no time.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left - reserve <= 0:
+        raise DeadlineExceeded(f"Turn deadline reached ({left:.2f}s left, {reserve:.2f}s reserved)")
+    return min(cap, left - reserve)
+
+
+def allows(seconds: float, reserve: float = DEADLINE_RESERVE_SECONDS) -> bool:
+    """
+    Whether waiting `seconds` (e.g. a retry backoff) still leaves time before the deadline.
+    """
+    left = remaining()
+    return left is None or left - reserve > seconds
+
+
+async def within(awaitable, reserve: float = DEADLINE_RESERVE_SECONDS):
+    """
+    Await `awaitable`, cancelling it `reserve` seconds before the deadline.
+
+    Raises:
+    DeadlineExceeded: if it did not complete in time.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        seconds = timeout(left, reserve)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except DeadlineExceeded:
+        raise
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Turn deadline reached, step cancelled after {left - reserve:.2f}s")
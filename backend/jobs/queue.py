@@ -0,0 +1,236 @@
+from pydantic import BaseModel
+from redis.exceptions import ResponseError
+from typing import Dict, List, Optional
+import json
+import logging
+import random
+import time
+
+"""
+Durable job queue on top of Redis Streams.
+
+Jobs are appended to a stream and consumed through a consumer group, so any number of worker processes can share
+the load and a job is only handed to one of them. A job stays in the group's pending list until it is acknowledged:
+if a worker dies mid-job, the job is reclaimed by another worker once it has been idle for `visibility_timeout` seconds.
+Each reclaim counts as a failed attempt, so a job that keeps killing its worker ends up dead-lettered too.
+
+Failed jobs are retried with exponential backoff (with jitter) through a sorted set of delayed jobs, and moved to a
+dead-letter stream once they have used up `max_attempts`.
+
+Keys used for a queue on stream "jobs:central_agent":
+    jobs:central_agent            stream of jobs ready to run
+    {jobs:central_agent}:delayed  sorted set of jobs waiting for a retry, scored by the time they are due
+    jobs:central_agent:dead       stream of jobs that exhausted their retries
+The delayed set is hash-tagged to the stream's cluster slot, so a due job is moved onto the stream by one Lua script.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Move a due job from the delayed set onto the stream, unless another worker already did.
+PROMOTE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('XADD', KEYS[2], '*', 'job', ARGV[2], 'payload', ARGV[3], 'attempts', ARGV[4],
+                      'enqueued_at', ARGV[5])
+end
+return false
+"""
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying the job cannot succeed. The job is dead-lettered right away."""
+
+
+class Job(BaseModel):
+    id: str
+    job: str
+    payload: Dict
+    attempts: int = 0
+    enqueued_at: float
+
+
+def _str(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class JobQueue:
+    def __init__(self, client, stream: str, group: str = "workers", max_attempts: int = 5,
+                 backoff_base: float = 2.0, backoff_max: float = 300.0, visibility_timeout: float = 300.0):
+        self._client = client
+        self.stream = stream
+        self.group = group
+        self.delayed_key = f"{{{stream}}}:delayed"
+        self.dead_letter_stream = f"{stream}:dead"
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.visibility_timeout = visibility_timeout
+        self._promote = client.register_script(PROMOTE_SCRIPT)
+
+    def ensure_group(self) -> None:
+        """Create the consumer group (and the stream) if they do not exist yet."""
+        try:
+            self._client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue(self, job: str, payload: Dict, attempts: int = 0) -> str:
+        """
+        Add a job to the queue.
+
+        Parameters:
+        - job (str): Name of the handler that runs the job.
+        - payload (dict): JSON serializable arguments of the job.
+        - attempts (int): Number of times the job has already been attempted.
+
+        Returns:
+        str: The stream id of the job.
+        """
+        fields = {
+            "job": job,
+            "payload": json.dumps(payload, default=str),
+            "attempts": attempts,
+            "enqueued_at": time.time(),
+        }
+        return _str(self._client.xadd(self.stream, fields))
+
+    def read(self, consumer: str, count: int = 10, block_ms: int = 5000) -> List[Job]:
+        """
+        Fetch up to `count` jobs for a consumer. Jobs abandoned by dead consumers are reclaimed first,
+        then new jobs are read, blocking up to `block_ms` milliseconds if there are none.
+        """
+        _, claimed, *_ = self._client.xautoclaim(self.stream, self.group, consumer,
+                                                  min_idle_time=int(self.visibility_timeout * 1000),
+                                                  start_id="0-0", count=count)
+        jobs = self._reclaimed([entry for entry in claimed if entry and entry[1]])
+        if len(jobs) < count:
+            response = self._client.xreadgroup(self.group, consumer, {self.stream: ">"},
+                                               count=count - len(jobs), block=block_ms)
+            for _, stream_entries in response or []:
+                jobs.extend(self._to_job(entry_id, fields) for entry_id, fields in stream_entries)
+
+        return jobs
+
+    def _reclaimed(self, entries) -> List[Job]:
+        """
+        Jobs reclaimed from dead consumers, with every earlier delivery counted as an attempt. Jobs out of attempts
+        are dead-lettered instead of being run again.
+        """
+        jobs = []
+        for entry_id, fields in entries:
+            job = self._to_job(entry_id, fields)
+            pending = self._client.xpending_range(self.stream, self.group, min=job.id, max=job.id, count=1)
+            # XAUTOCLAIM has already counted this delivery.
+            abandoned = pending[0]["times_delivered"] - 1 if pending else 0
+            job.attempts += abandoned
+            if job.attempts >= self.max_attempts:
+                self.dead_letter(job.model_copy(update={"attempts": job.attempts - 1}),
+                                 f"Abandoned by its worker {abandoned} times")
+                continue
+            jobs.append(job)
+        return jobs
+
+    def ack(self, job: Job) -> None:
+        """Mark a job as done and remove it from the stream."""
+        self._client.xack(self.stream, self.group, job.id)
+        self._client.xdel(self.stream, job.id)
+
+    def retry(self, job: Job, error: Optional[str] = None) -> None:
+        """Schedule a failed job for another attempt, or dead-letter it once it has used up its attempts."""
+        attempts = job.attempts + 1
+        if attempts >= self.max_attempts:
+            self.dead_letter(job, error)
+            return
+
+        delayed_job = json.dumps({"job": job.job, "payload": job.payload, "attempts": attempts,
+                                  "id": job.id, "error": error}, default=str)
+        self._client.zadd(self.delayed_key, {delayed_job: time.time() + self.backoff(attempts)})
+        self.ack(job)
+
+    def dead_letter(self, job: Job, error: Optional[str] = None) -> None:
+        """Move a job to the dead-letter stream."""
+        self._client.xadd(self.dead_letter_stream, {
+            "job": job.job,
+            "payload": json.dumps(job.payload, default=str),
+            "attempts": job.attempts + 1,
+            "original_id": job.id,
+            "error": error or "",
+            "failed_at": time.time(),
+        })
+        self.ack(job)
+        logger.error(f"Job {job.id} ({job.job}) moved to {self.dead_letter_stream}: {error}")
+
+    def promote_due(self, limit: int = 100) -> int:
+        """
+        Move delayed jobs whose retry time has come back onto the stream.
+        Safe to run from several workers, and atomic: a job is removed from the delayed set and added to the stream
+        by the same script, so a crash in between cannot lose it.
+
+        Returns:
+        int: The number of jobs moved.
+        """
+        due = self._client.zrangebyscore(self.delayed_key, "-inf", time.time(), start=0, num=limit)
+        promoted = 0
+        for item in due:
+            delayed_job = json.loads(_str(item))
+            if self._promote(keys=[self.delayed_key, self.stream],
+                             args=[item, delayed_job["job"], json.dumps(delayed_job["payload"], default=str),
+                                   delayed_job["attempts"], time.time()]):
+                promoted += 1
+        return promoted
+
+    def backoff(self, attempts: int) -> float:
+        """Exponential backoff with full jitter, in seconds."""
+        delay = min(self.backoff_max, self.backoff_base ** attempts)
+        return delay * (0.5 + random.random() / 2)
+
+    def stats(self) -> Dict:
+        """
+        Queue depth and lag metrics.
+
+        Returns:
+        dict: depth (jobs in the stream, including ones being processed), pending (delivered but not acknowledged),
+        lag (jobs not yet delivered to any consumer), delayed (waiting for a retry), dead (dead-lettered jobs),
+        oldest_age_seconds (age of the oldest job in the stream) and consumers.
+        """
+        stats = {
+            "stream": self.stream,
+            "depth": self._client.xlen(self.stream),
+            "pending": 0,
+            "lag": 0,
+            "delayed": self._client.zcard(self.delayed_key),
+            "dead": self._client.xlen(self.dead_letter_stream),
+            "oldest_age_seconds": 0.0,
+            "consumers": 0,
+        }
+
+        try:
+            groups = self._client.xinfo_groups(self.stream)
+        except ResponseError:  # stream does not exist yet
+            return stats
+
+        for group in groups:
+            group = {_str(key): value for key, value in group.items()}
+            if _str(group.get("name")) == self.group:
+                stats["pending"] = group.get("pending", 0)
+                stats["consumers"] = group.get("consumers", 0)
+                # "lag" is reported by Redis >= 7.0, fall back to depth minus pending on older servers.
+                lag = group.get("lag")
+                stats["lag"] = lag if lag is not None else max(stats["depth"] - stats["pending"], 0)
+
+        oldest = self._client.xrange(self.stream, count=1)
+        if oldest:
+            oldest_ms = int(_str(oldest[0][0]).split("-")[0])
+            stats["oldest_age_seconds"] = round(max(time.time() - oldest_ms / 1000, 0.0), 3)
+
+        return stats
+
+    def _to_job(self, entry_id, fields) -> Job:
+        fields = {_str(key): _str(value) for key, value in fields.items()}
+        return Job(
+            id=_str(entry_id),
+            job=fields["job"],
+            payload=json.loads(fields["payload"]),
+            attempts=int(fields.get("attempts", 0)),
+            enqueued_at=float(fields.get("enqueued_at", time.time())),
+        )
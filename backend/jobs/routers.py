@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+
+from backend.jobs.tasks import QUEUES, inbound_queue
+from backend.jobs.scheduler import scheduler
+from backend.whatsapp.utils import whatsapp
+
+
+router = APIRouter(tags=["jobs"])
+
+
+@router.get("/jobs/metrics")
+def queue_metrics():
+    return {"queues": [queue.stats() for queue in [*QUEUES, inbound_queue]], "scheduler": scheduler.stats(),
+            "conversations": whatsapp.dispatcher.stats()}
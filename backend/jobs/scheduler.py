@@ -0,0 +1,171 @@
+from collections import deque
+from enum import IntEnum
+from typing import Callable, Dict, Optional
+import asyncio
+import logging
+import math
+import os
+import time
+
+"""
+In-process scheduler for background work on a web node.
+
+Work is submitted with a priority class and runs on a bounded number of concurrent slots:
+
+    CUSTOMER      customer-facing replies (webhook turns, messages to customers)
+    VENDOR        vendor/logistics notifications and central agent processes
+    HOUSEKEEPING  conversation summaries, cache refreshes and other maintenance
+
+The highest priority waiting task always starts first, and lower classes can only take a share of the slots
+(SCHEDULER_VENDOR_SHARE / SCHEDULER_HOUSEKEEPING_SHARE), so a burst of low priority work cannot hold every slot
+while customers are waiting. A task that has not started by its deadline is dropped as stale, and a task that runs
+past its timeout is cancelled.
+"""
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", 8))
+SCHEDULER_VENDOR_SHARE = float(os.getenv("SCHEDULER_VENDOR_SHARE", 0.5))
+SCHEDULER_HOUSEKEEPING_SHARE = float(os.getenv("SCHEDULER_HOUSEKEEPING_SHARE", 0.25))
+
+
+class Priority(IntEnum):
+    CUSTOMER = 0
+    VENDOR = 1
+    HOUSEKEEPING = 2
+
+
+class ScheduledTask:
+    def __init__(self, func: Callable, args, kwargs, priority: Priority, name: str,
+                 deadline: Optional[float], timeout: Optional[float]):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.name = name
+        self.submitted_at = time.monotonic()
+        self.deadline = self.submitted_at + deadline if deadline is not None else None
+        self.timeout = timeout
+
+    def is_stale(self, now):
+        return self.deadline is not None and now > self.deadline
+
+
+class Scheduler:
+    def __init__(self, concurrency: int = SCHEDULER_CONCURRENCY, limits: Optional[Dict[Priority, int]] = None):
+        self.concurrency = concurrency
+        self.limits = limits or {
+            Priority.CUSTOMER: concurrency,
+            Priority.VENDOR: max(1, math.ceil(concurrency * SCHEDULER_VENDOR_SHARE)),
+            Priority.HOUSEKEEPING: max(1, math.floor(concurrency * SCHEDULER_HOUSEKEEPING_SHARE)),
+        }
+        self._queues = {priority: deque() for priority in Priority}
+        self._running = {priority: 0 for priority in Priority}
+        self._tasks = set()
+        self._changed = None
+        self._dispatcher = None
+        self._metrics = {priority: {"submitted": 0, "completed": 0, "failed": 0, "dropped_stale": 0,
+                                    "timed_out": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+                         for priority in Priority}
+
+    def submit(self, func: Callable, *args, priority: Priority = Priority.HOUSEKEEPING, deadline: float = None,
+               timeout: float = None, name: str = None, **kwargs) -> ScheduledTask:
+        """
+        Schedule a coroutine function to run in the background.
+
+        Parameters:
+        - func: Coroutine function to run.
+        - priority (Priority): Priority class of the task.
+        - deadline (float): Seconds from now by which the task must have started, otherwise it is dropped.
+        - timeout (float): Maximum number of seconds the task may run before it is cancelled.
+        - name (str): Name used in logs, defaults to the function name.
+
+        Returns:
+        ScheduledTask: The scheduled task.
+        """
+        self.start()
+        task = ScheduledTask(func, args, kwargs, Priority(priority), name or getattr(func, "__name__", "task"),
+                             deadline, timeout)
+        self._queues[task.priority].append(task)
+        self._metrics[task.priority]["submitted"] += 1
+        self._changed.set()
+        return task
+
+    def start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._changed = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop dispatching new tasks and wait up to `timeout` seconds for running ones to finish."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+    def stats(self) -> Dict:
+        """Queue depth, running tasks and counters per priority class."""
+        stats = {"concurrency": self.concurrency, "running": sum(self._running.values()), "priorities": {}}
+        for priority in Priority:
+            metrics = dict(self._metrics[priority])
+            started = metrics["completed"] + metrics["failed"] + metrics["timed_out"]
+            wait_seconds_total = metrics.pop("wait_seconds_total")
+            metrics["wait_seconds_avg"] = round(wait_seconds_total / started, 4) if started else 0.0
+            metrics["wait_seconds_max"] = round(metrics["wait_seconds_max"], 4)
+            metrics.update({"queued": len(self._queues[priority]), "running": self._running[priority],
+                            "limit": self.limits[priority]})
+            stats["priorities"][priority.name.lower()] = metrics
+        return stats
+
+    async def _dispatch(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+
+            self._running[task.priority] += 1
+            running = asyncio.create_task(self._run(task))
+            self._tasks.add(running)
+            running.add_done_callback(self._tasks.discard)
+
+    def _next_task(self) -> Optional[ScheduledTask]:
+        if sum(self._running.values()) >= self.concurrency:
+            return None
+
+        now = time.monotonic()
+        for priority in Priority:
+            queue = self._queues[priority]
+            while queue and queue[0].is_stale(now):
+                stale = queue.popleft()
+                self._metrics[priority]["dropped_stale"] += 1
+                logger.warning(f"Dropped stale {priority.name.lower()} task {stale.name} "
+                               f"after {now - stale.submitted_at:.1f}s in queue")
+            if queue and self._running[priority] < self.limits[priority]:
+                return queue.popleft()
+        return None
+
+    async def _run(self, task: ScheduledTask):
+        metrics = self._metrics[task.priority]
+        waited = time.monotonic() - task.submitted_at
+        metrics["wait_seconds_total"] += waited
+        metrics["wait_seconds_max"] = max(metrics["wait_seconds_max"], waited)
+
+        try:
+            await asyncio.wait_for(task.func(*task.args, **task.kwargs), timeout=task.timeout)
+        except asyncio.TimeoutError:
+            metrics["timed_out"] += 1
+            logger.error(f"Task {task.name} timed out after {task.timeout}s")
+        except Exception:
+            metrics["failed"] += 1
+            logger.exception(f"Task {task.name} failed")
+        else:
+            metrics["completed"] += 1
+        finally:
+            self._running[task.priority] -= 1
+            self._changed.set()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,141 @@
+from backend.db.cache_utils import redis_conn
+from .queue import JobQueue, PermanentJobError
+from .scheduler import scheduler, Priority
+from backend.deadline import deadline
+from backend.telemetry.tracing import turn
+import asyncio
+import logging
+import os
+import socket
+
+"""
+Jobs handed off from the web tier to the worker processes (see worker.py).
+
+Central agent processes (logistics planning, payment verification, customer feedback and unavailable products) run
+in the worker, not in the web process. The web tier only enqueues them once the response has been sent:
+
+    background_tasks.add_task(enqueue_central_agent, agent_input)
+
+The WhatsApp outbox holds outbound messages that could not be delivered right away (see backend/whatsapp/sender.py);
+the workers keep retrying them with backoff. Inbound WhatsApp messages are written to the inbound stream before the
+webhook is acknowledged and consumed by the web processes, which run the customer turns (see backend/whatsapp/utils.py):
+a message whose turn was lost to a crash or a restart is picked up again by another consumer.
+
+Periodic jobs (PERIODIC_JOBS, e.g. the product popularity scores) run from `run_periodic_jobs`, started by every
+worker: a Redis key per job, set for the job's interval by the first worker to take it, makes them run once per
+interval across all workers.
+
+Setting JOB_QUEUE_BACKEND=inline runs jobs on the web process's scheduler instead (as vendor priority work), which is
+handy in development when no worker is running. The web process then also drains the WhatsApp outbox itself.
+"""
+
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "redis")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+INBOUND_MAX_ATTEMPTS = int(os.getenv("INBOUND_MAX_ATTEMPTS", 3))
+# Seconds before a message taken by a web process that stopped responding is handed to another one. Longer than a
+# coalesce window plus a turn.
+INBOUND_VISIBILITY_TIMEOUT = float(os.getenv("INBOUND_VISIBILITY_TIMEOUT", 120))
+# Seconds a central agent job may run before its LLM and database calls are cut off and it is retried.
+CENTRAL_AGENT_JOB_DEADLINE = float(os.getenv("CENTRAL_AGENT_JOB_DEADLINE", 120))
+PRODUCT_SCORES_INTERVAL = int(os.getenv("PRODUCT_SCORES_INTERVAL", 3600))
+PERIODIC_JOB_DEADLINE = float(os.getenv("PERIODIC_JOB_DEADLINE", 300))
+PRODUCT_DESCRIPTORS_INTERVAL = int(os.getenv("PRODUCT_DESCRIPTORS_INTERVAL", 600))
+PERIODIC_JOBS_POLL_SECONDS = float(os.getenv("PERIODIC_JOBS_POLL_SECONDS", 60))
+
+logger = logging.getLogger(__name__)
+
+central_agent_queue = JobQueue(redis_conn.client, stream="jobs:central_agent", max_attempts=JOB_MAX_ATTEMPTS)
+outbox_queue = JobQueue(redis_conn.client, stream="whatsapp:outbox", max_attempts=OUTBOX_MAX_ATTEMPTS,
+                        backoff_base=3.0, backoff_max=900.0)
+inbound_queue = JobQueue(redis_conn.client, stream="whatsapp:inbound", max_attempts=INBOUND_MAX_ATTEMPTS,
+                         backoff_max=30.0, visibility_timeout=INBOUND_VISIBILITY_TIMEOUT)
+
+
+async def run_central_agent_job(payload):
+    from backend.chatbot.agents.central_agent import run_central_agent
+    from backend.chatbot.agents.central_agent_utils import Input
+
+    event_message = payload["event_message"]
+    with turn("central_agent", conversation=f"{event_message.get('customer_id')}:{event_message.get('business_id')}",
+              business=event_message.get("business_id")), deadline(CENTRAL_AGENT_JOB_DEADLINE):
+        # The state is read when the job runs: a snapshot taken when it was queued would overwrite later turns.
+        await run_central_agent(Input(**event_message), None, vendor_only=payload.get("vendor_only", False))
+
+
+async def deliver_whatsapp_message(payload):
+    from backend.whatsapp.utils import whatsapp
+
+    result = await whatsapp.sender.send(payload["phone_number_id"], payload["payload"], max_retries=0)
+    if not result.ok:
+        if not result.retryable:
+            raise PermanentJobError(f"{result.status_code}: {result.error}")
+        raise RuntimeError(f"WhatsApp message not delivered: {result.status_code} {result.error}")
+
+
+async def refresh_product_scores_job():
+    from backend.db.db_utils import refresh_product_scores
+
+    with deadline(PERIODIC_JOB_DEADLINE):
+        changed = await asyncio.to_thread(refresh_product_scores)
+    logger.info(f"Product scores refreshed, {changed} products changed")
+
+
+async def refresh_product_descriptors_job():
+    from backend.db.db_utils import refresh_product_descriptors
+
+    with deadline(PERIODIC_JOB_DEADLINE):
+        described = await asyncio.to_thread(refresh_product_descriptors)
+    if described:
+        logger.info(f"Descriptors computed for {described} products")
+
+
+# Map each job name to the coroutine that runs it
+JOB_HANDLERS = {
+    "central_agent": run_central_agent_job,
+    "whatsapp_message": deliver_whatsapp_message,
+}
+
+QUEUES = [central_agent_queue, outbox_queue]
+
+# Periodic job name -> (interval in seconds, coroutine that runs it)
+PERIODIC_JOBS = {
+    "product_scores": (PRODUCT_SCORES_INTERVAL, refresh_product_scores_job),
+    "product_descriptors": (PRODUCT_DESCRIPTORS_INTERVAL, refresh_product_descriptors_job),
+}
+
+
+async def run_periodic_jobs(jobs=PERIODIC_JOBS):
+    """
+    Run each periodic job once per interval, on whichever worker claims it first. A failed run waits for the next
+    interval.
+    """
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    while True:
+        for name, (interval, handler) in jobs.items():
+            if not redis_conn.client.set(f"jobs:periodic:{name}", consumer, nx=True, ex=interval):
+                continue
+            try:
+                await handler()
+            except Exception:
+                logger.exception(f"Periodic job {name} failed")
+        await asyncio.sleep(PERIODIC_JOBS_POLL_SECONDS)
+
+
+async def enqueue_central_agent(event_message, vendor_only=False):
+    """
+    Hand a central agent process off to the workers.
+
+    Parameters:
+    - event_message (dict | Input): Structured input for the central agent (see create_structured_input).
+    - vendor_only (bool): True if only the vendor/logistics company is involved in the chat.
+    """
+    if not isinstance(event_message, dict):
+        event_message = event_message.to_dict()
+
+    payload = {"event_message": event_message, "vendor_only": vendor_only}
+
+    if JOB_QUEUE_BACKEND == "inline":
+        scheduler.submit(run_central_agent_job, payload, priority=Priority.VENDOR, name="central_agent")
+    else:
+        central_agent_queue.enqueue("central_agent", payload)
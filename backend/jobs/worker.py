@@ -0,0 +1,76 @@
+from .queue import Job, JobQueue, PermanentJobError
+from typing import Callable, Dict
+import asyncio
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
+WORKER_BLOCK_MS = int(os.getenv("WORKER_BLOCK_MS", 2000))
+
+
+class Worker:
+    """
+    Consumes jobs from a JobQueue and runs them with bounded concurrency.
+
+    Several workers (processes or hosts) can consume the same queue: each one joins the queue's consumer group
+    under its own consumer name.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable], consumer: str = None,
+                 concurrency: int = WORKER_CONCURRENCY, block_ms: int = WORKER_BLOCK_MS):
+        self.queue = queue
+        self.handlers = handlers
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self.block_ms = block_ms
+        self._running = set()
+        self._stopping = False
+
+    async def run(self):
+        self.queue.ensure_group()
+        logger.info(f"Worker {self.consumer} consuming {self.queue.stream}")
+
+        while not self._stopping:
+            self.queue.promote_due()
+
+            free_slots = self.concurrency - len(self._running)
+            if free_slots <= 0:
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            # Blocking stream reads run in a thread so running jobs keep the event loop.
+            jobs = await asyncio.to_thread(self.queue.read, self.consumer, free_slots, self.block_ms)
+            for job in jobs:
+                task = asyncio.create_task(self.handle(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+        if self._running:
+            await asyncio.wait(self._running)
+
+    def stop(self):
+        self._stopping = True
+
+    async def handle(self, job: Job):
+        handler = self.handlers.get(job.job)
+        if handler is None:
+            self.queue.dead_letter(job, f"No handler for job {job.job}")
+            return
+
+        try:
+            await handler(job.payload)
+        except PermanentJobError as e:
+            self.queue.dead_letter(job, repr(e))
+        except Exception as e:
+            logger.exception(f"Job {job.id} ({job.job}) failed on attempt {job.attempts + 1}")
+            self.queue.retry(job, repr(e))
+        else:
+            self.queue.ack(job)
+
+
+async def run_workers(queues, handlers, concurrency=WORKER_CONCURRENCY):
+    workers = [Worker(queue, handlers, concurrency=concurrency) for queue in queues]
+    await asyncio.gather(*(worker.run() for worker in workers))
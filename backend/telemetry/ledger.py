@@ -0,0 +1,303 @@
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Counter
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+
+from backend.db.cache_utils import redis_conn
+from backend.telemetry.tracing import current_trace
+
+"""
+Token and cost ledger of every LLM call, attributed to business, agent and model.
+
+LangChain models built with chat_model() report through UsageCallback; raw OpenAI SDK calls go through
+record_completion(). Both only append to an in-memory buffer. The ledger's writer task (started with the app and the
+workers) bulk-inserts the buffer into the llm_usage table every LEDGER_FLUSH_SECONDS, and adds each business's cost
+to its daily spend in Redis, shared by all processes. rollup() aggregates the table per hour or day.
+
+Budgets: LLM_DAILY_BUDGET_USD applies to every business (0 disables it), LLM_BUDGETS='{"<business_id>": 5.0}'
+overrides it per business. budget_status() returns:
+- "ok": under LLM_BUDGET_DEGRADE_AT of the budget.
+- "degrade": above it; the model router prefers the cheaper LLM_BUDGET_MODEL.
+- "throttle": budget spent and LLM_BUDGET_THROTTLE=true; customers get BUDGET_EXCEEDED_MESSAGE instead of the agents.
+"""
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FLUSH_SECONDS = float(os.getenv("LEDGER_FLUSH_SECONDS", 5))
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", 500))
+# Records kept in memory while the database is unavailable, the oldest are dropped beyond this.
+LEDGER_MAX_BUFFER = int(os.getenv("LEDGER_MAX_BUFFER", 50_000))
+
+LLM_DAILY_BUDGET_USD = float(os.getenv("LLM_DAILY_BUDGET_USD", 0))
+LLM_BUDGETS = json.loads(os.getenv("LLM_BUDGETS", "{}"))
+LLM_BUDGET_DEGRADE_AT = float(os.getenv("LLM_BUDGET_DEGRADE_AT", 0.8))
+LLM_BUDGET_THROTTLE = os.getenv("LLM_BUDGET_THROTTLE", "false") == "true"
+# Seconds a business's spend is cached before Redis is read again.
+LLM_BUDGET_CACHE_SECONDS = float(os.getenv("LLM_BUDGET_CACHE_SECONDS", 10))
+BUDGET_EXCEEDED_MESSAGE = os.getenv("BUDGET_EXCEEDED_MESSAGE",
+                                    "Thanks for your message! We are experiencing high demand right now, "
+                                    "a member of our team will get back to you shortly.")
+
+# USD per million (prompt, completion) tokens, matched on the longest model name prefix.
+LLM_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    **{model: tuple(price) for model, price in json.loads(os.getenv("LLM_PRICES", "{}")).items()},
+}
+
+LLM_TOKENS = Counter("autobiz_llm_tokens", "Tokens used by LLM calls.", ["agent", "model", "kind"])
+LLM_COST = Counter("autobiz_llm_cost_usd", "Estimated cost of LLM calls in USD.", ["agent", "model"])
+
+
+def price(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimated cost in USD of an LLM call. Unknown models cost 0 and are logged once.
+    """
+    for name in sorted(LLM_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            prompt_price, completion_price = LLM_PRICES[name]
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+    if model not in _unpriced:
+        _unpriced.add(model)
+        logger.warning(f"No price for model {model}, its calls are recorded at no cost")
+    return 0.0
+
+
+_unpriced = set()
+
+
+def _spend_key(business_id, day=None):
+    day = day or datetime.now(timezone.utc).strftime("%Y%m%d")
+    return f"llm:spend:{business_id}:{day}"
+
+
+class UsageLedger:
+    def __init__(self, flush_seconds: float = LEDGER_FLUSH_SECONDS, batch_size: int = LEDGER_BATCH_SIZE,
+                 max_buffer: int = LEDGER_MAX_BUFFER):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._buffer = deque(maxlen=max_buffer)
+        self._task = None
+        self._stopping = False
+        self._spend_cache = {}
+        # Spend of committed records not yet added to Redis, by spend key.
+        self._unsent_spend: Dict[str, float] = {}
+        self.metrics = {"recorded": 0, "written": 0, "write_errors": 0, "spend_errors": 0}
+
+    def record(self, agent: str, model: str, prompt_tokens: int, completion_tokens: int, latency: float = None,
+               business_id: str = None):
+        """
+        Add an LLM call to the ledger. Never blocks: the call is written by the flush task.
+
+        Parameters:
+        - agent (str): Agent or chain that made the call.
+        - model (str): Model that served the call.
+        - prompt_tokens (int), completion_tokens (int): Token usage reported by the API.
+        - latency (float): Seconds the call took.
+        - business_id (str): Business the call was made for, defaults to the business of the current turn.
+        """
+        if business_id is None:
+            business_id = current_trace().get("business")
+        cost = price(model, prompt_tokens, completion_tokens)
+        self._buffer.append({"business_id": business_id, "agent": agent, "model": model,
+                             "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                             "cost": cost, "latency_seconds": latency, "created_at": datetime.now()})
+        self.metrics["recorded"] += 1
+        LLM_TOKENS.labels(agent, model, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(agent, model, "completion").inc(completion_tokens)
+        LLM_COST.labels(agent, model).inc(cost)
+        if len(self._buffer) >= self.batch_size and self._task is not None:
+            self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._wake.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            if self._stopping:
+                return
+
+    async def flush(self):
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                await asyncio.to_thread(self._insert, batch)
+            except Exception as e:
+                # Keep the records for the next flush, unless the buffer has filled up meanwhile.
+                self._buffer.extendleft(reversed(batch))
+                self.metrics["write_errors"] += 1
+                logger.warning(f"Could not write {len(batch)} LLM usage records: {e!r}")
+                break
+            self.metrics["written"] += len(batch)
+            # The rows are committed: from here on only their spend is retried, never the rows.
+            for key, cost in self._spend(batch).items():
+                self._unsent_spend[key] = self._unsent_spend.get(key, 0.0) + cost
+
+        if self._unsent_spend:
+            try:
+                await asyncio.to_thread(self._add_spend)
+            except Exception as e:
+                self.metrics["spend_errors"] += 1
+                logger.warning(f"Could not add the LLM spend of {len(self._unsent_spend)} businesses: {e!r}")
+
+    def _insert(self, batch: List[Dict]):
+        from backend.db.database import get_db
+        from backend.db.models import LLMUsage
+        from sqlalchemy import insert
+
+        with get_db() as db:
+            db.execute(insert(LLMUsage), batch)
+            db.commit()
+
+    @staticmethod
+    def _spend(batch: List[Dict]) -> Dict[str, float]:
+        spend = {}
+        for row in batch:
+            if row["business_id"]:
+                key = _spend_key(row["business_id"], row["created_at"].astimezone(timezone.utc).strftime("%Y%m%d"))
+                spend[key] = spend.get(key, 0.0) + row["cost"]
+        return spend
+
+    def _add_spend(self):
+        # Key by key, each one dropped once added: a retry only adds what is still missing.
+        for key, cost in list(self._unsent_spend.items()):
+            redis_conn.client.incrbyfloat(key, cost)
+            del self._unsent_spend[key]
+            redis_conn.client.expire(key, 2 * 24 * 3600)
+
+    def daily_spend(self, business_id: str) -> float:
+        """Today's (UTC) LLM spend of a business in USD, as flushed by all processes."""
+        cached = self._spend_cache.get(business_id)
+        if cached and time.monotonic() - cached[1] < LLM_BUDGET_CACHE_SECONDS:
+            return cached[0]
+        try:
+            spend = float(redis_conn.client.get(_spend_key(business_id)) or 0)
+        except Exception as e:
+            logger.warning(f"Could not read LLM spend of {business_id}: {e!r}")
+            spend = cached[0] if cached else 0.0
+        self._spend_cache[business_id] = (spend, time.monotonic())
+        return spend
+
+    def budget_status(self, business_id: Optional[str]) -> str:
+        """
+        Returns:
+        str: "ok", "degrade" or "throttle" (see module docstring).
+        """
+        budget = LLM_BUDGETS.get(str(business_id), LLM_DAILY_BUDGET_USD) if business_id else 0
+        if not budget:
+            return "ok"
+        spend = self.daily_spend(business_id)
+        if spend >= budget and LLM_BUDGET_THROTTLE:
+            return "throttle"
+        if spend >= LLM_BUDGET_DEGRADE_AT * budget:
+            return "degrade"
+        return "ok"
+
+    def rollup(self, period: str = "hour", business_id: str = None, since: datetime = None) -> List[Dict]:
+        """
+        Aggregate the ledger per hour or day, business, agent and model.
+
+        Parameters:
+        - period (str): "hour" or "day".
+        - business_id (str): Only this business.
+        - since (datetime): Start of the window, defaults to the last 24 hours (hourly) or 30 days (daily).
+        """
+        from backend.db.database import get_db
+        from backend.db.models import LLMUsage
+        from sqlalchemy import func
+
+        if period not in ("hour", "day"):
+            raise ValueError(f"Unknown period: {period}")
+        since = since or datetime.now() - (timedelta(days=1) if period == "hour" else timedelta(days=30))
+        bucket = func.date_trunc(period, LLMUsage.created_at).label("period")
+
+        with get_db() as db:
+            query = (db.query(bucket, LLMUsage.business_id, LLMUsage.agent, LLMUsage.model,
+                              func.count(LLMUsage.id).label("calls"),
+                              func.sum(LLMUsage.prompt_tokens).label("prompt_tokens"),
+                              func.sum(LLMUsage.completion_tokens).label("completion_tokens"),
+                              func.sum(LLMUsage.cost).label("cost"),
+                              func.avg(LLMUsage.latency_seconds).label("latency_avg"))
+                     .filter(LLMUsage.created_at >= since))
+            if business_id:
+                query = query.filter(LLMUsage.business_id == business_id)
+            rows = query.group_by(bucket, LLMUsage.business_id, LLMUsage.agent, LLMUsage.model).order_by(bucket).all()
+        return [row._asdict() for row in rows]
+
+
+ledger = UsageLedger()
+
+
+class UsageCallback(BaseCallbackHandler):
+    """
+    Records the token usage of every call of the LangChain model it is attached to.
+    """
+    # Recording only appends to a buffer, no need for a thread per event.
+    run_inline = True
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, **kwargs):
+        params = invocation_params or {}
+        self._runs[run_id] = (time.perf_counter(), current_trace().get("business"),
+                              params.get("model") or params.get("model_name") or "unknown")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started, business_id, model = self._runs.pop(run_id, (None, None, "unknown"))
+        usage = {}
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        if message is not None and getattr(message, "usage_metadata", None):
+            usage = {"prompt_tokens": message.usage_metadata["input_tokens"],
+                     "completion_tokens": message.usage_metadata["output_tokens"]}
+            model = message.response_metadata.get("model_name") or model
+        elif response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            model = response.llm_output.get("model_name") or model
+
+        ledger.record(self.agent, model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                      time.perf_counter() - started if started else None, business_id=business_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._runs.pop(run_id, None)
+
+
+def record_completion(agent: str, completion, started: float):
+    """
+    Record a raw OpenAI SDK chat completion.
+
+    Parameters:
+    - agent (str): Agent that made the call.
+    - completion: The ChatCompletion returned by the SDK.
+    - started (float): time.perf_counter() when the call was made.
+    """
+    usage = completion.usage
+    ledger.record(agent, completion.model, usage.prompt_tokens if usage else 0,
+                  usage.completion_tokens if usage else 0, time.perf_counter() - started)
@@ -0,0 +1,94 @@
+from fastapi import APIRouter, HTTPException, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+import logging
+
+from backend.chatbot.routing import model_router
+from backend.jobs.tasks import QUEUES, inbound_queue
+from backend.jobs.scheduler import scheduler
+from backend.telemetry.ledger import LLM_BUDGETS, LLM_DAILY_BUDGET_USD, ledger
+from backend.telemetry.tracing import conversation_hash, largest_states
+from backend.whatsapp.utils import whatsapp
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["telemetry"])
+
+
+class BackgroundCollector:
+    """
+    Reads the background queues and state sizes when /metrics is scraped, so nothing has to keep them updated.
+    """
+
+    def describe(self):
+        # Registering would otherwise call collect(), and with it Redis, at import time.
+        return []
+
+    def collect(self):
+        queued = GaugeMetricFamily("autobiz_scheduler_queued_tasks", "Tasks waiting on the in-process scheduler.",
+                                   labels=["priority"])
+        running = GaugeMetricFamily("autobiz_scheduler_running_tasks", "Tasks running on the in-process scheduler.",
+                                    labels=["priority"])
+        for priority, stats in scheduler.stats()["priorities"].items():
+            queued.add_metric([priority], stats["queued"])
+            running.add_metric([priority], stats["running"])
+        yield queued
+        yield running
+
+        dispatcher = whatsapp.dispatcher.stats()
+        yield GaugeMetricFamily("autobiz_whatsapp_pending_messages", "WhatsApp messages waiting for their turn.",
+                                value=dispatcher["pending_messages"])
+        yield GaugeMetricFamily("autobiz_whatsapp_active_conversations",
+                                "WhatsApp conversations with messages being processed.",
+                                value=dispatcher["active_conversations"])
+
+        jobs = GaugeMetricFamily("autobiz_job_queue_jobs", "Jobs in the Redis job queues.", labels=["stream", "state"])
+        try:
+            for stats in (queue.stats() for queue in [*QUEUES, inbound_queue]):
+                for state in ("depth", "pending", "lag", "delayed", "dead"):
+                    jobs.add_metric([stats["stream"], state], stats[state])
+        except Exception as e:
+            logger.warning(f"Could not read job queue stats: {e!r}")
+        yield jobs
+
+        # Keys hold the customer's phone number: they are exported hashed, the logs have the keys of large states.
+        state_size = GaugeMetricFamily("autobiz_user_state_size_bytes",
+                                       "Last written size of the largest conversation states in Redis.",
+                                       labels=["business", "conversation"])
+        for key, size in largest_states().items():
+            state_size.add_metric([key.rpartition(":")[2], conversation_hash(key)], size)
+        yield state_size
+
+
+REGISTRY.register(BackgroundCollector())
+
+
+@router.get("/metrics")
+def metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/usage")
+def usage(period: str = "hour", business_id: str = None):
+    """
+    LLM calls, tokens and cost per hour or day, business, agent and model.
+    """
+    if period not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="period must be hour or day")
+    return {"period": period, "rollup": ledger.rollup(period, business_id), "ledger": ledger.metrics}
+
+
+@router.get("/usage/budgets/{business_id}")
+def usage_budget(business_id: str):
+    return {"business_id": business_id,
+            "budget": LLM_BUDGETS.get(business_id, LLM_DAILY_BUDGET_USD),
+            "spent_today": ledger.daily_spend(business_id),
+            "status": ledger.budget_status(business_id)}
+
+
+@router.get("/usage/routing")
+def usage_routing():
+    """
+    Recent calls, errors and p95 latency per model and agent, as seen by the model router.
+    """
+    return model_router.stats()
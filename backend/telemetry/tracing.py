@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Gauge, Histogram
+from typing import Dict
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+import uuid
+
+"""
+Per-stage latency tracing of conversation turns.
+
+A turn (see `turn`) opens a trace carrying the conversation and business ids. Every `span` inside it, including in
+agents and tasks it awaits, records its duration in the stage histogram and inherits those attributes, so a slow
+turn can be broken down into state I/O, router, database, evaluator, agent and WhatsApp time:
+
+    with turn("chat", conversation=f"{user_id}:{vendor_id}", business=vendor_id):
+        with span("get_user_state"):
+            ...
+
+Spans slower than TRACE_SLOW_SPAN_SECONDS are logged with their attributes; TRACE_LOG_SPANS=true logs all of them.
+Histograms and gauges are exported on GET /metrics (backend/telemetry/routers.py).
+"""
+
+logger = logging.getLogger(__name__)
+
+TRACE_SLOW_SPAN_SECONDS = float(os.getenv("TRACE_SLOW_SPAN_SECONDS", 5))
+TRACE_LOG_SPANS = os.getenv("TRACE_LOG_SPANS", "false") == "true"
+# Number of largest conversation states exported individually on /metrics.
+STATE_SIZE_TOP_KEYS = int(os.getenv("STATE_SIZE_TOP_KEYS", 20))
+# Conversation states at least this large are logged with their key.
+STATE_SIZE_LOG_BYTES = int(os.getenv("STATE_SIZE_LOG_BYTES", 256_000))
+# Key of the conversation pseudonyms. Without it they are only stable for the life of the process.
+METRICS_HASH_SECRET = (os.getenv("METRICS_HASH_SECRET") or secrets.token_hex(32)).encode("utf-8")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+STAGE_DURATION = Histogram("autobiz_stage_duration_seconds", "Duration of each stage of a conversation turn.",
+                           ["stage", "status"], buckets=LATENCY_BUCKETS)
+TURN_DURATION = Histogram("autobiz_turn_duration_seconds", "Duration of a whole conversation turn.",
+                          ["channel", "status"], buckets=LATENCY_BUCKETS)
+TURNS_IN_FLIGHT = Gauge("autobiz_turns_in_flight", "Conversation turns currently being processed.", ["channel"])
+STATE_SIZE = Histogram("autobiz_user_state_bytes", "Size of the conversation states written to Redis.",
+                       buckets=(1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000, 4_000_000))
+
+_trace: ContextVar[Dict] = ContextVar("trace", default={})
+# Last written size of the largest conversation states, exported per key by the metrics collector.
+_state_sizes: Dict[str, int] = {}
+
+
+def current_trace() -> Dict:
+    return _trace.get()
+
+
+@contextmanager
+def turn(channel: str, **attributes):
+    """
+    Trace a conversation turn.
+
+    Parameters:
+    - channel (str): Entry point of the turn, e.g. "chat", "business_chat", "whatsapp".
+    - attributes: Attributes carried by every span of the turn, e.g. conversation and business.
+    """
+    token = _trace.set({"trace_id": uuid.uuid4().hex[:16], "channel": channel, **attributes})
+    TURNS_IN_FLIGHT.labels(channel).inc()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        TURNS_IN_FLIGHT.labels(channel).dec()
+        TURN_DURATION.labels(channel, status).observe(elapsed)
+        _log("turn", elapsed, status)
+        _trace.reset(token)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Time a stage of the current turn.
+
+    Parameters:
+    - stage (str): Stage name, the `stage` label of the histogram. Keep it low-cardinality.
+    - attributes: Extra attributes logged with the span.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.labels(stage, status).observe(elapsed)
+        _log(stage, elapsed, status, attributes)
+
+
+def record_state_size(key: str, size: int):
+    """
+    Record the size in bytes of a conversation state written to Redis.
+    """
+    STATE_SIZE.observe(size)
+    if size >= STATE_SIZE_LOG_BYTES:
+        logger.info(f"Conversation state {key} (conversation {conversation_hash(key)}) is {size} bytes")
+    _state_sizes[key] = size
+    if len(_state_sizes) > 2 * STATE_SIZE_TOP_KEYS:
+        for stale, _ in sorted(_state_sizes.items(), key=lambda item: item[1])[:-STATE_SIZE_TOP_KEYS]:
+            del _state_sizes[stale]
+
+
+def conversation_hash(key: str) -> str:
+    """
+    Stable pseudonym of a conversation key ("<customer phone>:<business>"), for metric labels. Keyed with
+    METRICS_HASH_SECRET: phone numbers are few enough that a plain hash is reversed by trying them all.
+    """
+    return hmac.new(METRICS_HASH_SECRET, key.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+
+def largest_states() -> Dict[str, int]:
+    return dict(sorted(_state_sizes.items(), key=lambda item: item[1], reverse=True)[:STATE_SIZE_TOP_KEYS])
+
+
+def _log(stage, elapsed, status, attributes=None):
+    if not TRACE_LOG_SPANS and elapsed < TRACE_SLOW_SPAN_SECONDS:
+        return
+    fields = {**current_trace(), **(attributes or {})}
+    level = logging.WARNING if elapsed >= TRACE_SLOW_SPAN_SECONDS else logging.INFO
+    logger.log(level, f"span {stage} {status} {elapsed * 1000:.1f}ms " +
+               " ".join(f"{key}={value}" for key, value in fields.items()))
@@ -0,0 +1,109 @@
+"""
+Replays a scripted customer conversation through chat() with the LLM calls served from a cassette, to time the
+code around the LLM calls (state I/O, database queries, prompt building, serialization).
+
+Usage:
+    # once, against OpenAI (or the mock in backend/tests/mocks/openai_api.py):
+    LLM_CASSETTE_MODE=record python -m backend.tests.benchmarks.bench_agent_pipeline
+    # then, offline and repeatably:
+    python -m backend.tests.benchmarks.bench_agent_pipeline --repeat 5 --latency none
+    python -m backend.tests.benchmarks.bench_agent_pipeline --max-overhead-ms 150    # fails above the threshold
+
+Needs the Redis and Postgres the app uses (with the dummy data loaded). Every turn reports its wall time, the time
+spent in (replayed) LLM calls and the difference: our own overhead. --profile adds a cProfile of our modules.
+Background hand-offs queued by the agents are not run.
+"""
+import argparse
+import asyncio
+import cProfile
+import os
+import pstats
+import statistics
+import sys
+import time
+
+os.environ.setdefault("LLM_CASSETTE_MODE", "replay")
+os.environ.setdefault("LLM_CASSETTE_PATH", "backend/tests/cassettes/agent_pipeline.json")
+
+from fastapi import BackgroundTasks
+
+from backend.chatbot import llm
+from backend.chatbot.agents.user_chat_interface import chat
+from backend.db.cache_utils import delete_user_state
+from backend.struct import UserRequest
+
+CONVERSATION = [
+    "Hi, good afternoon",
+    "Do you have iPhone 12?",
+    "How much is it?",
+    "Is it brand new?",
+    "Okay, I want to buy one. How do I pay?",
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run_conversation(user_id, vendor_id):
+    """
+    Returns:
+    List[tuple]: (wall seconds, LLM seconds) of each turn.
+    """
+    await delete_user_state(user_id, vendor_id)
+    turns = []
+    for i, message in enumerate(CONVERSATION):
+        request = UserRequest(user_id=user_id, vendor_id=vendor_id, session_id="bench", message=message)
+        llm_before = llm.cassette.stats["llm_seconds"]
+        start = time.perf_counter()
+        await chat(request, BackgroundTasks(), reset_user_state=False)
+        turns.append((time.perf_counter() - start, llm.cassette.stats["llm_seconds"] - llm_before))
+    await delete_user_state(user_id, vendor_id)
+    return turns
+
+
+async def main(repeat, user_id, vendor_id, profile, max_overhead_ms):
+    profiler = cProfile.Profile() if profile else None
+    overheads, walls = [], []
+    for run in range(repeat):
+        if profiler:
+            profiler.enable()
+        turns = await run_conversation(user_id, vendor_id)
+        if profiler:
+            profiler.disable()
+        for turn, (wall, llm_seconds) in enumerate(turns):
+            walls.append(wall)
+            overheads.append(wall - llm_seconds)
+            print(f"run {run} turn {turn}: wall={wall * 1000:8.1f}ms  llm={llm_seconds * 1000:8.1f}ms  "
+                  f"overhead={(wall - llm_seconds) * 1000:7.1f}ms")
+
+    print(f"\n{llm.cassette.mode} mode, latency={llm.cassette.latency}, {len(walls)} turns")
+    print(f"wall:     p50={statistics.median(walls) * 1000:.1f}ms  p95={percentile(walls, 95) * 1000:.1f}ms")
+    print(f"overhead: p50={statistics.median(overheads) * 1000:.1f}ms  p95={percentile(overheads, 95) * 1000:.1f}ms")
+    print(f"cassette: {llm.cassette.stats}")
+
+    if profiler:
+        stats = pstats.Stats(profiler).sort_stats("cumulative")
+        stats.print_stats(r"backend[/\\](chatbot|db|jobs|whatsapp)", 25)
+
+    if max_overhead_ms and percentile(overheads, 95) * 1000 > max_overhead_ms:
+        print(f"FAIL: p95 overhead above {max_overhead_ms}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--user-id", default="bench-customer")
+    parser.add_argument("--vendor-id", default="manny_gadgets_ig")
+    parser.add_argument("--latency", help="replay latency: original, none or milliseconds")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--max-overhead-ms", type=float, default=0)
+    args = parser.parse_args()
+    if args.latency:
+        llm.cassette.latency = args.latency
+    if llm.LLM_CASSETTE_MODE == "record":
+        args.repeat = 1
+    sys.exit(asyncio.run(main(args.repeat, args.user_id, args.vendor_id, args.profile, args.max_overhead_ms)))
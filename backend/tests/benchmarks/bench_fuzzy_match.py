@@ -0,0 +1,129 @@
+"""
+Accuracy and latency of the fuzzy product search against the `%name%` search it backs up.
+
+Usage:
+    python -m backend.tests.benchmarks.bench_fuzzy_match --products 5000 --queries 2000
+
+A synthetic catalogue (brands x models x variants, with tags) is indexed with FuzzyIndex, then queried with product
+names the way customers misspell them: a dropped, swapped or substituted letter, words run together, or a business
+alias. Each query has one intended product. For both searches, the report gives the share of queries where that
+product was found at all, was first (top-1), and was in the first 5, and the fuzzy search's latency percentiles and
+index build time. Nothing touches Postgres or Redis.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from backend.db.fuzzy_index import FuzzyIndex
+
+BRANDS = ["Samsung", "Apple", "Tecno", "Infinix", "Nike", "Adidas", "Puma", "Zara", "Gucci", "Lenovo", "Hisense",
+          "Oraimo", "Itel", "Xiaomi", "Sony", "Canon", "Dell", "Binatone", "Nivea", "Fenty"]
+KINDS = ["phone", "sneakers", "jersey", "laptop", "television", "earbuds", "handbag", "camera", "blender", "lotion"]
+VARIANTS = ["black", "white", "blue", "red", "128gb", "256gb", "xl", "large", "small", "pro"]
+# Business aliases: what customers call a product -> the name it stands for.
+ALIASES = {"snickers": "sneakers", "telly": "television", "tv": "television", "buds": "earbuds", "cream": "lotion"}
+KEYBOARD = "qwertyuiopasdfghjklzxcvbnm"
+
+
+def make_catalogue(n_products, rng):
+    products = []
+    for product_id in range(1, n_products + 1):
+        brand, kind = rng.choice(BRANDS), rng.choice(KINDS)
+        model = f"{rng.choice('ASXGM')}{rng.randint(1, 60)}"
+        name = f"{brand} {kind} {model} {rng.choice(VARIANTS)}"
+        products.append((product_id, name, f"{kind}, {brand.lower()}, {rng.choice(VARIANTS)}"))
+    return products
+
+
+def misspell(name, rng):
+    """
+    A customer's version of a product name, and the kind of mistake made.
+    """
+    words = name.lower().split()[:3]
+    kind = rng.choice(["delete", "swap", "substitute", "join", "alias", "exact"])
+    if kind == "join":
+        return "".join(words[1:3]) if rng.random() < 0.5 else words[0] + " " + "".join(words[1:3]), kind
+    if kind == "alias":
+        aliases = [alias for alias, target in ALIASES.items() if target == words[1]]
+        if aliases:
+            words[1] = rng.choice(aliases)
+            return " ".join(words), kind
+        kind = "exact"
+    if kind != "exact":
+        # Typos land in the longest word, the brand or kind, never in short model numbers.
+        i = max(range(len(words)), key=lambda k: len(words[k]))
+        word, pos = words[i], rng.randrange(1, len(words[i]) - 1)
+        if kind == "delete":
+            words[i] = word[:pos] + word[pos + 1:]
+        elif kind == "swap":
+            words[i] = word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:]
+        else:
+            words[i] = word[:pos] + rng.choice(KEYBOARD) + word[pos + 1:]
+    return " ".join(words), kind
+
+
+def ilike_search(products, query):
+    """
+    What get_products does: the whole query as a substring of the name or tags.
+    """
+    query = query.lower()
+    return [product_id for product_id, name, tags in products if query in name.lower() or query in tags.lower()]
+
+
+def report(name, ranks, total):
+    found = sum(1 for rank in ranks if rank is not None)
+    top1 = sum(1 for rank in ranks if rank == 0)
+    top5 = sum(1 for rank in ranks if rank is not None and rank < 5)
+    print(f"{name:<8} found={found / total:>6.1%}  top1={top1 / total:>6.1%}  top5={top5 / total:>6.1%}")
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    products = make_catalogue(args.products, rng)
+    names = {product_id: name for product_id, name, _ in products}
+    aliases = [(alias, target) for alias, target in ALIASES.items()]
+
+    start = time.perf_counter()
+    index = FuzzyIndex(products, aliases)
+    build = time.perf_counter() - start
+    print(f"{args.products} products: index built in {build * 1000:.0f}ms, {len(index.vocabulary)} words, "
+          f"{len(index.grams)} trigrams")
+
+    queries = []
+    for _ in range(args.queries):
+        product_id = rng.choice(products)[0]
+        query, kind = misspell(names[product_id], rng)
+        queries.append((product_id, query, kind))
+
+    def rank(results, product_id):
+        return results.index(product_id) if product_id in results else None
+
+    ilike_ranks, fuzzy_ranks, latencies = [], [], []
+    by_kind = {}
+    for product_id, query, kind in queries:
+        ilike_ranks.append(rank(ilike_search(products, query), product_id))
+        start = time.perf_counter()
+        results = [result for result, _ in index.search(query, limit=args.limit)]
+        latencies.append(time.perf_counter() - start)
+        fuzzy_ranks.append(rank(results, product_id))
+        by_kind.setdefault(kind, []).append(fuzzy_ranks[-1] is not None)
+
+    print(f"\n{args.queries} queries, the intended product among --limit={args.limit} results")
+    report("ilike", ilike_ranks, len(queries))
+    report("fuzzy", fuzzy_ranks, len(queries))
+    print("fuzzy found by mistake: " + ", ".join(f"{kind}={sum(hits) / len(hits):.0%}"
+                                                 for kind, hits in sorted(by_kind.items())))
+    latencies.sort()
+    print(f"fuzzy latency p50={statistics.median(latencies) * 1000:.2f}ms  "
+          f"p95={latencies[int(0.95 * (len(latencies) - 1))] * 1000:.2f}ms  "
+          f"p99={latencies[int(0.99 * (len(latencies) - 1))] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20, help="results returned per search")
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
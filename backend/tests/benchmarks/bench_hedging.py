@@ -0,0 +1,106 @@
+"""
+Tail latency of LLM calls with and without hedging, against the mock OpenAI server with a slow tail.
+
+Usage:
+    python -m backend.tests.benchmarks.bench_hedging --calls 400 --tail-rate 0.05 --tail-latency-ms 8000 --delay 1.0
+
+The same calls are made twice through chat_model(): without hedging, then with a hedge fired after --delay seconds.
+Each run reports p50/p95/p99 and the requests the mock received, so the p99 improvement can be weighed against the
+extra requests and prompt tokens hedging costs. The mock server is started in-process; nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+import uvicorn
+from prometheus_client import REGISTRY
+
+from backend.chatbot import resilience
+from backend.chatbot.llm import chat_model
+from backend.tests.mocks.openai_api import create_app
+
+AGENT = "bench_hedging"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run(model, n_calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def call(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await model.ainvoke(f"Benchmark question {i}: do you have the iPhone 12 in stock?")
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(call(i) for i in range(n_calls)))
+    return latencies, failures
+
+
+async def main(args):
+    port = free_port()
+    app = create_app(latency_ms=args.latency_ms, stream_delay_ms=0, tail_rate=args.tail_rate,
+                     tail_latency_ms=args.tail_latency_ms)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    model = chat_model(AGENT, model="gpt-4o-mini", temperature=0, base_url=f"http://127.0.0.1:{port}/v1")
+    print(f"{args.calls} calls, mock latency={args.latency_ms}ms, {args.tail_rate:.0%} at {args.tail_latency_ms}ms, "
+          f"concurrency={args.concurrency}")
+
+    results = {}
+    for name, delay in (("no hedging", None), (f"hedge@{args.delay}s", args.delay)):
+        resilience.LLM_HEDGE_DELAYS.pop(AGENT, None)
+        if delay is not None:
+            resilience.LLM_HEDGE_DELAYS[AGENT] = delay
+        before = dict(app.state.stats)
+        latencies, failures = await run(model, args.calls, args.concurrency)
+        requests = app.state.stats["requests"] - before["requests"]
+        results[name] = (percentile(latencies, 99), requests)
+        print(f"{name:<12} p50={statistics.median(latencies) * 1000:>7.1f}ms  "
+              f"p95={percentile(latencies, 95) * 1000:>7.1f}ms  p99={percentile(latencies, 99) * 1000:>7.1f}ms  "
+              f"requests={requests}  failed={failures}")
+
+    (p99_off, requests_off), (p99_on, requests_on) = results.values()
+    hedge_tokens = REGISTRY.get_sample_value("autobiz_llm_hedge_prompt_tokens_total", {"agent": AGENT}) or 0
+    print(f"\np99 {p99_off * 1000:.0f}ms -> {p99_on * 1000:.0f}ms ({p99_on / p99_off - 1:+.0%}), "
+          f"extra requests {requests_on / requests_off - 1:+.1%} (~{hedge_tokens:.0f} extra prompt tokens)")
+    print("Each hedge resends the prompt; the completion of the cancelled request may be partly billed too.")
+
+    server.should_exit = True
+    await serving
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--tail-latency-ms", type=float, default=8000)
+    parser.add_argument("--delay", type=float, default=1.0, help="seconds before the hedge is fired")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""
+Throughput of the catalogue ingestion transform against reading the file alone and against a row-by-row transform.
+
+Usage:
+    python -m backend.tests.benchmarks.bench_ingest --rows 100000 --chunk-rows 5000
+
+A synthetic catalogue in a foreign layout (name, price with a currency sign, stock, and size, colour, RAM and
+warranty columns) is written to a temporary CSV, then:
+- read:        streamed with pandas in chunks, nothing else, the floor for any ingestion;
+- vectorized:  streamed and transformed with backend/db/catalog_mapping.py (prices parsed, attributes normalized,
+               descriptors rendered and token-counted), what ingest_catalog does before its bulk inserts;
+- row-by-row:  the same rows built one at a time with iterrows, as load_csv_to_db does.
+The mapping is given, as for a layout already known: no LLM call, and nothing touches Postgres or Redis.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from backend.db.attributes import normalize_attributes
+from backend.db.catalog_mapping import SchemaMapping, transform
+from backend.db.descriptors import count_tokens, render_descriptor
+
+MAPPING = SchemaMapping(product_name="item", price="unit price", items_in_stock="qty", product_category="section",
+                        ignored=["sku"])
+NAMES = ["Shirt", "Trousers", "Sneakers", "Laptop", "Phone", "Perfume", "Handbag", "Blender", "Earbuds", "Jacket"]
+
+
+def write_catalogue(path, rows, rng):
+    frame = pd.DataFrame({
+        "SKU": [f"SKU-{i}" for i in range(rows)],
+        "Item": [f"{rng.choice(NAMES)} {rng.randint(1, 500)}" for _ in range(rows)],
+        "Unit Price": [f"₦{rng.randint(1_000, 900_000):,}" for _ in range(rows)],
+        "Qty": [str(rng.randint(0, 200)) for _ in range(rows)],
+        "Section": [rng.choice(["Fashion", "Gadgets", "Beauty", "Home"]) for _ in range(rows)],
+        "Size": [rng.choice(["S", "M", "L", "XL", ""]) for _ in range(rows)],
+        "Colour": [rng.choice(["Red", "Black", "Navy Blue", "", "any"]) for _ in range(rows)],
+        "RAM": [rng.choice(["8 GB", "16 GB", ""]) for _ in range(rows)],
+        "Warranty": [rng.choice(["1 Year", "6 Months", ""]) for _ in range(rows)],
+    })
+    frame.to_csv(path, index=False)
+
+
+def read_only(path, chunk_rows):
+    return sum(len(frame) for frame in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows))
+
+
+def vectorized(path, chunk_rows):
+    return sum(len(transform(frame, MAPPING, 1)[0])
+               for frame in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows))
+
+
+def row_by_row(path, chunk_rows):
+    rows = 0
+    for frame in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        for _, row in frame.iterrows():
+            product = {
+                "business_id": 1,
+                "product_name": row["Item"].strip(),
+                "product_category": row["Section"].strip(),
+                "price": float("".join(char for char in row["Unit Price"] if char.isdigit() or char == ".")),
+                "items_in_stock": int(row["Qty"]) if row["Qty"] else None,
+                "attributes": normalize_attributes({column: row[column] for column in
+                                                    ("Size", "Colour", "RAM", "Warranty")}),
+            }
+            product["descriptor"] = render_descriptor({**product, "items_left_in_stock": product["items_in_stock"]})
+            product["descriptor_tokens"] = count_tokens(product["descriptor"])
+            rows += 1
+    return rows
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalogue.csv")
+        write_catalogue(path, args.rows, rng)
+        print(f"{args.rows} rows, {os.path.getsize(path) / 1e6:.1f} MB, chunks of {args.chunk_rows}")
+        baseline = None
+        for name, run in (("read", read_only), ("vectorized", vectorized), ("row-by-row", row_by_row)):
+            start = time.perf_counter()
+            rows = run(path, args.chunk_rows)
+            seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            print(f"{name:<11} {rows / seconds:>12,.0f} rows/s  {seconds:>7.2f}s  ({seconds / baseline:.1f}x read)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-rows", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
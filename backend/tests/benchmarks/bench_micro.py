@@ -0,0 +1,372 @@
+"""
+Micro-benchmarks of the helpers and queries every turn goes through, with stored baselines and a regression gate.
+
+Usage:
+    python -m backend.tests.benchmarks.bench_micro --save                  # record baselines on the reference machine
+    python -m backend.tests.benchmarks.bench_micro --threshold 0.25        # exit 1 if any case is >25% slower
+    python -m backend.tests.benchmarks.bench_micro --filter tokens cache   # only matching cases
+
+Each case is timed with timeit (auto-ranged to --min-time seconds per sample, --repeat samples) and compared on its
+median time per call with the baseline in --baseline. Database cases (get_products, get_products_by_keywords,
+search_products, load_csv_to_db) run against the Postgres configured by DATABASE_*: they seed a throwaway business and
+delete it afterwards, and are skipped when the database is unreachable (or with --skip-db). Token counting cases are
+skipped when their tiktoken encoding can not be loaded, i.e. it is not in the local cache (TIKTOKEN_CACHE_DIR) and
+cannot be downloaded. Those are the only skips: the gate also fails when a case's setup raises, when a baseline case
+did not run (renamed or removed cases need a new --save), and when there is no baseline at all.
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import tempfile
+import timeit
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+
+CASES = {}
+_cleanups = []
+_loop = asyncio.new_event_loop()
+
+
+class Skip(Exception):
+    pass
+
+
+def case(name, group="cpu", number=None):
+    """
+    Register a benchmark. The decorated function does the setup and returns the zero-argument callable to time.
+
+    Parameters:
+    - name (str): Case name, used as the baseline key.
+    - group (str): "cpu" or "db".
+    - number (int): Calls per sample, auto-ranged when None.
+    """
+    def register(setup):
+        CASES[name] = {"setup": setup, "group": group, "number": number}
+        return setup
+    return register
+
+
+def run_async(coroutine_function, *args):
+    return lambda: _loop.run_until_complete(coroutine_function(*args))
+
+
+def chat_history(n_messages):
+    lines = [("user", "customer", "Hello, do you have the iPhone 12 in stock? I want the 128GB one in blue."),
+             ("assistant", "vendor", "Yes we have the iPhone 12 128GB in blue, 20 units left at 999."),
+             ("user", "customer", "How much is delivery to Lekki Phase 1 and can it come tomorrow?"),
+             ("assistant", "vendor", "Delivery to Lekki Phase 1 is available tomorrow for a small fee.")]
+    return [{"role": role, "name": name, "content": content} for role, name, content in
+            (lines[i % len(lines)] for i in range(n_messages))]
+
+
+def large_user_state(n_messages=200, n_products=20):
+    # Rows live in the shared product cache, the state only references them.
+    products = {f"product {i}": {
+        "product_refs": [[1, i * 10 + j] for j in range(10)],
+        "db_queried": True,
+        "result_match": {"product_match": "GENERIC_MATCH", "product_attribute_enquiry": ["colour", "storage"],
+                         "available_product_refs": [[1, i * 10 + j] for j in range(5)],
+                         "instruction": "Ask the customer which storage size they want."}}
+        for i in range(n_products)}
+    return {"chat_history": chat_history(n_messages), "products": products,
+            "business_information": {"business_name": "Manny_gadgets", "bank_name": "gtbank",
+                                     "bank_account_number": "0123456789", "bank_account_name": "Manny Gadgets Ltd"}}
+
+
+def _encoding(model="gpt-3.5-turbo"):
+    # Loading the encoding is a one-off, not part of the case.
+    from backend.chatbot.agents.tools import get_encoding
+    try:
+        return get_encoding(model)
+    except OSError as e:  # requests' download errors are OSErrors
+        raise Skip(f"tiktoken encoding of {model} is not available offline: {type(e).__name__}")
+
+
+# CPU cases
+
+@case("num_tokens_from_messages[50]")
+def _():
+    from backend.chatbot.agents.tools import num_tokens_from_messages
+    _encoding()
+    history = chat_history(50)
+    return lambda: num_tokens_from_messages(history)
+
+
+@case("num_tokens_from_messages[50, cached]")
+def _():
+    from backend.chatbot.agents.tools import add_to_chat_history, num_tokens_from_messages
+    _encoding()
+    history = chat_history(50)
+    # Messages added to a chat history carry their token counts.
+    add_to_chat_history({"chat_history": []}, history)
+    return lambda: num_tokens_from_messages(history)
+
+
+@case("build_product_context[400]")
+def _():
+    from backend.chatbot.agents.product_context import build_product_context
+    _encoding("gpt-4o-mini")
+    products = [{"product_name": f"Cotton shirt {colour} {size}" if i % 4 else f"Shirt model {i}", "price": 5000.0 + i,
+                 "items_left_in_stock": i % 7, "tags": "shirt, cotton, casual"}
+                for i, (colour, size) in enumerate((c, s) for _ in range(25) for c in ("red", "blue", "black", "white")
+                                                   for s in ("s", "m", "l", "xl"))]
+    return lambda: build_product_context(products, "blue shirt", "Do you have a blue cotton shirt in M?")
+
+
+@case("update_dict")
+def _():
+    from backend.chatbot.agents.tools import update_dict
+    old, new = large_user_state(50, 10), large_user_state(50, 10)
+    new["products"].pop("product 0")
+    return run_async(update_dict, old, new)
+
+
+@case("flatten_list[100x10]")
+def _():
+    from backend.chatbot.agents.tools import flatten_list
+    nested = [[f"message {i}.{j}" for j in range(10)] for i in range(100)]
+    return lambda: flatten_list(nested)
+
+
+@case("map_to_score")
+def _():
+    from backend.chatbot.agents.tools import map_to_score
+    mapping = {"very satisfied": 5, "satisfied": 4, "neutral": 3, "dissatisfied": 2, "very dissatisfied": 1}
+    return lambda: map_to_score("Honestly I am quite dissatisfied with the delivery time", mapping)
+
+
+@case("history_to_db_format[200]")
+def _():
+    from backend.chatbot.agents.tools import history_to_db_format
+    history = chat_history(200)
+    return lambda: history_to_db_format(history, "2348000000001", "manny_gadgets", "session-1")
+
+
+class _MemoryClient:
+    """In-memory stand-in for the Redis client, so the Cache cases time encoding and decoding only."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, **kwargs):
+        self.data[key] = value.encode("utf-8")
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+
+def _memory_cache():
+    from backend.db.cache import Cache
+    cache = Cache.__new__(Cache)
+    cache._client = _MemoryClient()
+    return cache
+
+
+@case("Cache.set[large state]")
+def _():
+    cache, state = _memory_cache(), large_user_state()
+    return lambda: cache.set("customer:vendor", state)
+
+
+@case("Cache.get[large state]")
+def _():
+    cache = _memory_cache()
+    cache.set("customer:vendor", large_user_state())
+    return lambda: cache.get("customer:vendor")
+
+
+# Database cases
+
+BENCH_BUSINESS_NAME = "bench_micro_business"
+
+
+def _database():
+    from backend.db.config import DATABASE_HOST, DATABASE_PORT
+    if not DATABASE_HOST:
+        raise Skip("DATABASE_HOST is not set")
+    try:
+        socket.create_connection((DATABASE_HOST, int(DATABASE_PORT or 5432)), timeout=2).close()
+    except OSError as e:
+        raise Skip(f"Postgres unreachable: {e}")
+
+    # Importing the models creates the tables, only do it once the database is known to be up.
+    from backend.db.database import SessionLocal
+    from backend.db.models import Business, Product
+    return SessionLocal, Business, Product
+
+
+def _write_products_csv(business_id, n_rows):
+    f = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="")
+    writer = csv.writer(f)
+    writer.writerow(["id", "Product", "Description", "Price", "Available amount", "Product category",
+                     "Date created", "Date modified"])
+    for i in range(n_rows):
+        writer.writerow([business_id, f"Bench phone {i}", f"Benchmark smartphone model {i} with 128GB storage",
+                         100 + i, i % 50, "Phone", "2024-06-05", "2024-06-05"])
+    f.close()
+    _cleanups.append(lambda: os.unlink(f.name))
+    return f.name
+
+
+def _bench_business(n_products=500):
+    SessionLocal, Business, Product = _database()
+    with SessionLocal() as session:
+        business = Business(business_name=BENCH_BUSINESS_NAME, email="bench@example.com")
+        session.add(business)
+        session.commit()
+        business_id = business.id
+
+    def cleanup():
+        with SessionLocal() as session:
+            session.query(Product).filter(Product.business_id == business_id).delete()
+            session.query(Business).filter(Business.id == business_id).delete()
+            session.commit()
+    _cleanups.append(cleanup)
+
+    from backend.db.fake_data import load_csv_to_db
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        load_csv_to_db(_write_products_csv(business_id, n_products), "products")
+    return business_id
+
+
+@case("get_products[name]", group="db", number=20)
+def _():
+    _bench_business()
+    from backend.db.db_utils import get_products
+    return run_async(get_products, "Bench phone 4")
+
+
+@case("get_products_by_keywords[prefetch]", group="db", number=20)
+def _():
+    _bench_business(n_products=100)
+    from backend.chatbot.agents.prefetch import CATALOG_PREFETCH_MAX_ROWS, extract_keywords
+    from backend.db.db_utils import get_products_by_keywords
+    keywords = extract_keywords("Hello, do you have the bench phone 4 in stock? How much is it?")
+    return lambda: get_products_by_keywords(keywords, limit=CATALOG_PREFETCH_MAX_ROWS)
+
+
+@case("search_products", group="db", number=20)
+def _():
+    _bench_business()
+    from backend.db.database import engine
+    from sqlalchemy import inspect
+    if "ts_vector" not in {column["name"] for column in inspect(engine).get_columns("products")}:
+        raise RuntimeError("products.ts_vector does not exist")
+    from backend.db.db_utils import search_products
+    return lambda: search_products("bench smartphone 128GB", limit=15)
+
+
+@case("load_csv_to_db[200 rows]", group="db", number=1)
+def _():
+    business_id = _bench_business(n_products=0)
+    from backend.db.fake_data import load_csv_to_db
+    path = _write_products_csv(business_id, 200)
+    return lambda: load_csv_to_db(path, "products")
+
+
+def measure(func, number, repeat, min_time):
+    timer = timeit.Timer(func)
+    if number is None:
+        number, elapsed = timer.autorange()
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"median": statistics.median(samples), "min": min(samples), "number": number}
+
+
+def format_time(seconds):
+    return f"{seconds * 1e6:,.1f}us" if seconds < 1e-3 else f"{seconds * 1e3:,.2f}ms"
+
+
+def main(args):
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["cases"]
+    elif not args.save:
+        print(f"FAIL: no baseline at {args.baseline}, record one with --save")
+        return 1
+
+    def selected(name, group):
+        return (not args.filter or any(term in name for term in args.filter)) and not (args.skip_db and group == "db")
+
+    results, regressions, errors, skipped = {}, [], [], set()
+    print(f"{'case':<40} {'median':>12} {'min':>12} {'baseline':>12} {'change':>8}")
+    try:
+        for name, spec in CASES.items():
+            if not selected(name, spec["group"]):
+                continue
+            try:
+                func = spec["setup"]()
+            except Skip as e:
+                print(f"{name:<40} skipped: {e}")
+                skipped.add(name)
+                continue
+            except Exception as e:
+                print(f"{name:<40} ERROR: setup failed with {type(e).__name__}: {str(e)[:100]}")
+                errors.append(name)
+                continue
+
+            # Some helpers print on every call, keep the report readable.
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                result = measure(func, spec["number"], args.repeat, args.min_time)
+            results[name] = {**result, "group": spec["group"]}
+
+            line = f"{name:<40} {format_time(result['median']):>12} {format_time(result['min']):>12}"
+            if name in baseline:
+                change = result["median"] / baseline[name]["median"] - 1
+                status = "REGRESSION" if change > args.threshold else ""
+                if status:
+                    regressions.append(name)
+                line += f" {format_time(baseline[name]['median']):>12} {change:>+8.1%} {status}"
+            else:
+                line += f" {'none':>12}"
+            print(line)
+    finally:
+        for cleanup in reversed(_cleanups):
+            try:
+                cleanup()
+            except Exception as e:
+                print(f"cleanup failed: {e!r}")
+
+    if errors:
+        print(f"FAIL: setup of {len(errors)} case(s) failed: {', '.join(errors)}")
+        return 1
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": platform.node(), "python": platform.python_version(), "cases": results}, f, indent=2)
+        print(f"saved {len(results)} baselines to {args.baseline}")
+        return 0
+
+    missing = [name for name, spec in baseline.items()
+               if selected(name, spec.get("group", "cpu")) and name not in results and name not in skipped]
+    if missing:
+        print(f"FAIL: {len(missing)} baseline case(s) did not run: {', '.join(missing)}")
+    if regressions:
+        print(f"FAIL: {len(regressions)} case(s) more than {args.threshold:.0%} slower than the baseline: "
+              f"{', '.join(regressions)}")
+    return 1 if missing or regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing, 0.25 = 25%%")
+    parser.add_argument("--filter", nargs="*", help="only run cases whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per sample for auto-ranged cases")
+    parser.add_argument("--skip-db", action="store_true")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""
+Prompt tokens per turn over long conversations, with and without the rolling summary.
+
+Usage:
+    python -m backend.tests.benchmarks.bench_summarization --turns 200
+
+The summarizer LLM is replaced with a bounded extractive summary (the most recent words of the folded text, capped at
+--summary-words) so the benchmark measures the history policy, not the summarizer model. Nothing is sent to Redis or OpenAI.
+"""
+import argparse
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+from langchain_core.runnables import RunnableLambda
+
+from backend.chatbot.agents.conversation_summarizer import (
+    SUMMARY_RECENT_WINDOW,
+    SUMMARY_TRIGGER_MESSAGES,
+    SUMMARY_TRIGGER_TOKENS,
+    fold_history,
+    needs_summary,
+    prompt_history,
+    split_for_summary,
+)
+from backend.chatbot.agents.tools import add_to_chat_history, drop_from_chat_history, num_tokens_from_messages
+
+CUSTOMER_MESSAGES = [
+    "Hello, do you have the iPhone 12 in stock? I want the 128GB one in blue.",
+    "How much is it and can you deliver to Lekki Phase 1 tomorrow?",
+    "Okay, what about the Samsung Galaxy S21, is it cheaper?",
+    "I have paid 899 to your GTBank account, my name is Bode Thomas.",
+    "Please confirm when the rider leaves, I will be home after 4pm.",
+]
+VENDOR_MESSAGES = [
+    "Yes we have the iPhone 12 128GB in blue, 20 units left at 999.",
+    "Delivery to Lekki Phase 1 is available tomorrow for a small fee.",
+    "The Samsung Galaxy S21 is 899 and we have 15 units left.",
+    "Thank you Bode, we are verifying your payment with the vendor now.",
+    "Noted, the logistics company will call you before delivery.",
+]
+
+
+def make_summarizer(summary_words):
+    def summarize(inputs):
+        words = (inputs["summary"] + " " + inputs["new_messages"]).split()
+        return " ".join(words[-summary_words:])
+    return RunnableLambda(summarize)
+
+
+async def simulate(turns, summarize, summary_words):
+    chain = make_summarizer(summary_words)
+    user_state = {"chat_history": []}
+    prompt_tokens = []
+
+    for turn in range(turns):
+        message = CUSTOMER_MESSAGES[turn % len(CUSTOMER_MESSAGES)]
+        reply = VENDOR_MESSAGES[turn % len(VENDOR_MESSAGES)]
+        history = prompt_history(user_state) if summarize else user_state["chat_history"]
+        prompt_tokens.append(num_tokens_from_messages(history + [{"role": "user", "name": "customer", "content": message}]))
+
+        add_to_chat_history(user_state, [{"role": "user", "name": "customer", "content": message},
+                                         {"role": "assistant", "name": "vendor", "content": reply}])
+
+        # The background fold completes between turns.
+        if summarize and needs_summary(user_state):
+            to_fold, _ = split_for_summary(user_state["chat_history"])
+            user_state["summary"] = await fold_history(user_state.get("summary", ""), to_fold, chain)
+            drop_from_chat_history(user_state, len(to_fold))
+
+    return prompt_tokens
+
+
+def report(name, prompt_tokens):
+    checkpoints = [turn for turn in (1, 10, 50, 100, 200, len(prompt_tokens)) if turn <= len(prompt_tokens)]
+    by_turn = ", ".join(f"t{turn}={prompt_tokens[turn - 1]}" for turn in sorted(set(checkpoints)))
+    print(f"{name:<16} total={sum(prompt_tokens):>8}  mean={sum(prompt_tokens) / len(prompt_tokens):>8.1f}  "
+          f"max={max(prompt_tokens):>6}  {by_turn}")
+
+
+async def main(turns, summary_words):
+    print(f"{turns} turns, trigger={SUMMARY_TRIGGER_MESSAGES} messages or {SUMMARY_TRIGGER_TOKENS} tokens, "
+          f"recent window={SUMMARY_RECENT_WINDOW} messages")
+    full = await simulate(turns, summarize=False, summary_words=summary_words)
+    rolling = await simulate(turns, summarize=True, summary_words=summary_words)
+    report("full history", full)
+    report("rolling summary", rolling)
+    print(f"prompt tokens saved: {1 - sum(rolling) / sum(full):.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--summary-words", type=int, default=120)
+    args = parser.parse_args()
+    asyncio.run(main(args.turns, args.summary_words))
@@ -0,0 +1,84 @@
+"""
+Micro-benchmarks for token accounting over long chat histories.
+
+Usage:
+    python -m backend.tests.benchmarks.bench_token_accounting --messages 50 200 1000
+
+Compares, for a whole conversation of N messages:
+- recount:     re-encoding the full history every turn (the previous num_tokens_from_messages behaviour).
+- incremental: add_to_chat_history, which encodes each new message once and keeps a running total.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+import tiktoken
+
+from backend.chatbot.agents.tools import add_to_chat_history, get_encoding, num_tokens_from_messages
+
+MESSAGES = [
+    {"role": "user", "name": "customer", "content": "Hello, do you have the iPhone 12 in stock? I want the 128GB one in blue."},
+    {"role": "assistant", "name": "vendor", "content": "Yes we have the iPhone 12 128GB in blue, 20 units left at 999."},
+    {"role": "user", "name": "customer", "content": "How much is delivery to Lekki Phase 1 and can it come tomorrow?"},
+    {"role": "assistant", "name": "vendor", "content": "Delivery to Lekki Phase 1 is available tomorrow for a small fee."},
+]
+
+
+def conversation(n_messages):
+    return [dict(MESSAGES[i % len(MESSAGES)]) for i in range(n_messages)]
+
+
+def recount(n_messages, model="gpt-3.5-turbo"):
+    # Previous behaviour: resolve the encoding and encode every message of the full history on each turn.
+    history = []
+    for message in conversation(n_messages):
+        history.append(message)
+        encoding = tiktoken.encoding_for_model(model)
+        total = 3
+        for past_message in history:
+            total += 3
+            for key, value in past_message.items():
+                total += len(encoding.encode(value))
+                if key == "name":
+                    total += 1
+    return total
+
+
+def incremental(n_messages):
+    # Counted for HISTORY_TOKEN_MODEL, gpt-3.5-turbo by default.
+    user_state = {"chat_history": []}
+    total = 0
+    for message in conversation(n_messages):
+        total = add_to_chat_history(user_state, [message])
+    return total + 3
+
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    get_encoding("gpt-3.5-turbo")  # load the encoding outside the timed region
+
+    print(f"{'messages':>8} {'recount (ms)':>14} {'incremental (ms)':>17} {'speedup':>8}")
+    for n_messages in sizes:
+        recount_time, recount_total = timeit(recount, n_messages)
+        incremental_time, incremental_total = timeit(incremental, n_messages)
+        assert recount_total == incremental_total == num_tokens_from_messages(conversation(n_messages))
+        print(f"{n_messages:>8} {recount_time * 1000:>14.2f} {incremental_time * 1000:>17.2f} "
+              f"{recount_time / incremental_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, nargs="+", default=[50, 200, 1000])
+    args = parser.parse_args()
+    main(args.messages)
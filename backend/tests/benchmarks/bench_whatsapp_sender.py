@@ -0,0 +1,106 @@
+"""
+Outbound WhatsApp throughput against the local mock Graph API.
+
+Usage:
+    python -m backend.tests.benchmarks.bench_whatsapp_sender --messages 500 --latency-ms 80 --max-rps 300
+
+Compares the previous sender (blocking requests.post, one connection per message, called sequentially since it
+blocks the event loop) with GraphSender (pooled keep-alive connections, concurrent sends, throttling-aware retries).
+The mock server is started in-process; nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import time
+
+import requests
+import uvicorn
+
+from backend.tests.mocks.graph_api import create_app
+from backend.whatsapp.sender import GraphSender
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def payload(i):
+    return {"messaging_product": "whatsapp", "recipient_type": "individual", "to": f"234800000{i:04d}",
+            "type": "text", "text": {"preview_url": True, "body": f"Benchmark message {i}"}}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def report(name, elapsed, latencies, delivered, extra=""):
+    print(f"{name:<10} {delivered:>5} delivered in {elapsed:>6.2f}s  {delivered / elapsed:>8.1f} msg/s  "
+          f"p50={statistics.median(latencies) * 1000:>7.1f}ms  p95={percentile(latencies, 95) * 1000:>7.1f}ms  {extra}")
+
+
+def blocking_send(base_url, n_messages):
+    latencies, delivered = [], 0
+    for i in range(n_messages):
+        start = time.perf_counter()
+        response = requests.post(f"{base_url}/1234/messages", json=payload(i),
+                                 headers={"Authorization": "Bearer benchmark"})
+        latencies.append(time.perf_counter() - start)
+        delivered += response.status_code == 200
+    return latencies, delivered
+
+
+async def pooled_send(base_url, n_messages, concurrency):
+    sender = GraphSender("benchmark", base_url=base_url, max_connections=concurrency, max_concurrency=concurrency,
+                         max_retries=5, backoff_base=0.2)
+    latencies = []
+
+    async def send(i):
+        start = time.perf_counter()
+        result = await sender.send("1234", payload(i))
+        latencies.append(time.perf_counter() - start)
+        return result.ok
+
+    results = await asyncio.gather(*(send(i) for i in range(n_messages)))
+    await sender.aclose()
+    return latencies, sum(results), sender.metrics
+
+
+async def main(n_messages, latency_ms, max_rps, concurrency, skip_blocking):
+    port = free_port()
+    app = create_app(latency_ms=latency_ms, max_rps=max_rps)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}/v15.0"
+
+    print(f"{n_messages} messages, mock latency={latency_ms}ms, max rps={max_rps or 'unlimited'}, "
+          f"concurrency={concurrency}")
+    if not skip_blocking:
+        start = time.perf_counter()
+        latencies, delivered = await asyncio.to_thread(blocking_send, base_url, n_messages)
+        report("blocking", time.perf_counter() - start, latencies, delivered)
+
+    start = time.perf_counter()
+    latencies, delivered, metrics = await pooled_send(base_url, n_messages, concurrency)
+    report("pooled", time.perf_counter() - start, latencies, delivered,
+           f"retries={metrics['retries']} throttled={metrics['throttled']} failed={metrics['failed']}")
+    print(f"mock server: {app.state.stats}")
+
+    server.should_exit = True
+    await serving
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--max-rps", type=float, default=0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--skip-blocking", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.latency_ms, args.max_rps, args.concurrency, args.skip_blocking))
@@ -0,0 +1,241 @@
+"""
+End-to-end load test of the API, with local stand-ins for every external service.
+
+Usage:
+    docker compose up -d redis postgres      # or any local Redis and Postgres
+    python -m backend.tests.load.load_test --requests 200 --concurrency 20 --seed
+
+The mock OpenAI and Graph API servers run in this process. main:app is started with uvicorn in a subprocess,
+pointed at the mocks, the local Redis (--redis-url) and the Postgres database configured by DATABASE_* in the
+environment or .env. API keys are replaced with dummies, so nothing leaves the machine. --seed loads the dummy
+businesses first, the customer and business messages are addressed to --vendor-id.
+
+/chat, /business_chat and /webhook are driven in turn at --concurrency, and each reports p50/p95/p99 latency and
+requests/s. The webhook is acknowledged before the agents run, so its report also waits for the replies to reach
+the mock Graph API. Use --app-url to load an app that is already running (the mocks must be reachable by it).
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import uvicorn
+
+from backend.tests.mocks import graph_api, openai_api
+
+APP_SECRET = "load-test"
+ENDPOINTS = ["chat", "business_chat", "webhook"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def serve(app):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+def app_environment(openai_url, graph_url, args):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "OPENAI_API_BASE": f"{openai_url}/v1",
+        "TAVILY_API_KEY": "load-test",
+        "LANGCHAIN_TRACING_V2": "false",
+        "GRAPH_API_URL": f"{graph_url}/v15.0",
+        "PAGE_ACCESS_TOKEN": "load-test",
+        "APP_SECRET": APP_SECRET,
+        "VERIFY_TOKEN": "load-test",
+        "REDIS_URL": args.redis_url,
+        # No worker process in the load test, run background jobs in the web process.
+        "JOB_QUEUE_BACKEND": "inline",
+        "COALESCE_WINDOW_SECONDS": str(args.coalesce_window),
+    })
+    return env
+
+
+def seed_businesses(env):
+    subprocess.run([sys.executable, "-c", "from backend.db.fake_data import load_csv_to_db; "
+                    "load_csv_to_db('./dummy_data/Business_table.csv', 'businesses')"],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+async def start_app(env, log_path):
+    port = free_port()
+    log = open(log_path, "w")
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                "--port", str(port)], env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient() as client:
+        for _ in range(600):
+            if process.poll() is not None:
+                raise RuntimeError(f"main:app exited with code {process.returncode}, see {log_path}")
+            try:
+                if (await client.get(f"{url}/")).status_code == 200:
+                    return process, url
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"main:app did not start within 60s, see {log_path}")
+
+
+def chat_request(i, args):
+    return "/chat", {"json": {"user_id": f"load-customer-{i % args.users}", "vendor_id": args.vendor_id,
+                              "session_id": f"load-{i}", "message": f"Hi, do you have {openai_api.MOCK_OPENAI_PRODUCT} in stock?"}}
+
+
+def business_chat_request(i, args):
+    return "/business_chat", {"json": {
+        "user_id": f"load-customer-{i % args.users}", "vendor_id": args.vendor_id, "logistic_id": "load-logistics",
+        "session_id": f"load-{i}", "sender": "Vendor", "message": "Payment received, you can proceed with delivery.",
+        "product_name": openai_api.MOCK_OPENAI_PRODUCT, "product_price": "50", "message_type": "Payment verification"}}
+
+
+def webhook_request(i, args):
+    payload = {"object": "whatsapp_business_account", "entry": [{"id": "load-waba", "changes": [{
+        "field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            # The vendor is looked up by the phone number id the message was sent to.
+            "metadata": {"display_phone_number": args.vendor_id, "phone_number_id": args.vendor_id},
+            "messages": [{"from": f"23480{i % args.users:08d}", "id": f"wamid.load.{uuid.uuid4().hex}",
+                          "timestamp": str(int(time.time())), "type": "text",
+                          "text": {"body": f"Hi, do you have {openai_api.MOCK_OPENAI_PRODUCT} in stock?"}}]}}]}]}
+    body = json.dumps(payload).encode("utf-8")
+    signature = hmac.new(APP_SECRET.encode("utf-8"), body, hashlib.sha1).hexdigest()
+    return "/webhook", {"content": body, "headers": {"Content-Type": "application/json",
+                                                     "X-Hub-Signature": f"sha1={signature}"}}
+
+
+REQUESTS = {"chat": chat_request, "business_chat": business_chat_request, "webhook": webhook_request}
+
+
+async def drive(url, endpoint, args):
+    """
+    Send --requests requests to an endpoint, --concurrency at a time.
+
+    Returns:
+    tuple: (latencies in seconds of successful requests, status code counts, elapsed seconds)
+    """
+    latencies, statuses = [], {}
+    requests = iter(range(args.requests))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        async def user():
+            for i in requests:
+                path, kwargs = REQUESTS[endpoint](i, args)
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, **kwargs)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def report(endpoint, latencies, statuses, elapsed, extra=""):
+    if latencies:
+        print(f"{endpoint:<14} {len(latencies):>5} ok in {elapsed:>6.2f}s  {len(latencies) / elapsed:>7.1f} req/s  "
+              f"p50={statistics.median(latencies) * 1000:>7.1f}ms  p95={percentile(latencies, 95) * 1000:>7.1f}ms  "
+              f"p99={percentile(latencies, 99) * 1000:>7.1f}ms  status={statuses}  {extra}")
+    else:
+        print(f"{endpoint:<14} no successful requests  status={statuses}")
+
+
+async def wait_for_replies(graph_app, expected, timeout):
+    start = time.perf_counter()
+    while graph_app.state.stats["delivered"] < expected and time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.05)
+    return graph_app.state.stats["delivered"], time.perf_counter() - start
+
+
+async def main(args):
+    openai_app = openai_api.create_app(args.openai_latency_ms, args.openai_stream_delay_ms, args.tool_call_rate)
+    graph_app = graph_api.create_app(args.graph_latency_ms, args.graph_max_rps)
+    openai_server, openai_task, openai_url = await serve(openai_app)
+    graph_server, graph_task, graph_url = await serve(graph_app)
+
+    process = None
+    try:
+        if args.app_url:
+            url = args.app_url
+        else:
+            env = app_environment(openai_url, graph_url, args)
+            if args.seed:
+                seed_businesses(env)
+            process, url = await start_app(env, args.app_log)
+
+        print(f"{args.requests} requests per endpoint, concurrency={args.concurrency}, "
+              f"openai latency={args.openai_latency_ms}ms, graph latency={args.graph_latency_ms}ms")
+        for endpoint in args.endpoints:
+            delivered_before = graph_app.state.stats["delivered"]
+            latencies, statuses, elapsed = await drive(url, endpoint, args)
+
+            extra = ""
+            if endpoint == "webhook":
+                delivered, waited = await wait_for_replies(graph_app, delivered_before + statuses.get(200, 0),
+                                                           args.reply_timeout)
+                delivered -= delivered_before
+                extra = f"replies={delivered}/{statuses.get(200, 0)} in {elapsed + waited:.2f}s"
+            report(endpoint, latencies, statuses, elapsed, extra)
+
+        print(f"mock openai: {openai_app.state.stats}")
+        print(f"mock graph:  {graph_app.state.stats}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        openai_server.should_exit = graph_server.should_exit = True
+        await asyncio.gather(openai_task, graph_task)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--users", type=int, default=50, help="distinct customers the requests are spread over")
+    parser.add_argument("--vendor-id", default="manny_gadgets_ig")
+    parser.add_argument("--openai-latency-ms", type=float, default=openai_api.MOCK_OPENAI_LATENCY_MS)
+    parser.add_argument("--openai-stream-delay-ms", type=float, default=openai_api.MOCK_OPENAI_STREAM_DELAY_MS)
+    parser.add_argument("--tool-call-rate", type=float, default=openai_api.MOCK_OPENAI_TOOL_CALL_RATE)
+    parser.add_argument("--graph-latency-ms", type=float, default=graph_api.MOCK_GRAPH_LATENCY_MS)
+    parser.add_argument("--graph-max-rps", type=float, default=graph_api.MOCK_GRAPH_MAX_RPS)
+    parser.add_argument("--coalesce-window", type=float, default=0.0)
+    parser.add_argument("--redis-url", default=os.getenv("LOAD_TEST_REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--seed", action="store_true", help="load the dummy businesses before starting")
+    parser.add_argument("--app-url", help="load an already running app instead of starting main:app")
+    parser.add_argument("--app-log", default="load_test_app.log")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--reply-timeout", type=float, default=60)
+    asyncio.run(main(parser.parse_args()))
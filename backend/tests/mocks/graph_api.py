@@ -0,0 +1,94 @@
+"""
+Local stand-in for the WhatsApp Cloud (Graph) API messages endpoint, for throughput and load tests.
+
+Usage:
+    python -m backend.tests.mocks.graph_api --port 9001 --latency-ms 80 --max-rps 200
+
+Then point the app at it with GRAPH_API_URL=http://127.0.0.1:9001/v15.0
+
+Requests above --max-rps (token bucket, per server) get the same throttling response Graph returns:
+HTTP 429 with error code 130429 and a Retry-After header. --error-rate injects random 500s.
+GET /stats returns the request counters.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+MOCK_GRAPH_LATENCY_MS = float(os.getenv("MOCK_GRAPH_LATENCY_MS", 80))
+MOCK_GRAPH_MAX_RPS = float(os.getenv("MOCK_GRAPH_MAX_RPS", 0))  # 0 disables throttling
+MOCK_GRAPH_ERROR_RATE = float(os.getenv("MOCK_GRAPH_ERROR_RATE", 0))
+
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def create_app(latency_ms=MOCK_GRAPH_LATENCY_MS, max_rps=MOCK_GRAPH_MAX_RPS, error_rate=MOCK_GRAPH_ERROR_RATE):
+    app = FastAPI()
+    bucket = TokenBucket(max_rps)
+    app.state.stats = {"requests": 0, "delivered": 0, "throttled": 0, "errors": 0}
+    app.state.messages = []
+
+    @app.post("/{version}/{phone_number_id}/messages")
+    async def send_message(version: str, phone_number_id: str, request: Request):
+        stats = app.state.stats
+        stats["requests"] += 1
+        payload = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+
+        if not bucket.take():
+            stats["throttled"] += 1
+            return JSONResponse(status_code=429, headers={"Retry-After": "1"}, content={
+                "error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}})
+
+        if error_rate and random.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse(status_code=500, content={
+                "error": {"message": "An unknown error occurred", "type": "OAuthException", "code": 1}})
+
+        stats["delivered"] += 1
+        app.state.messages.append({"from": phone_number_id, "to": payload.get("to"), "text": payload.get("text")})
+        return {"messaging_product": "whatsapp",
+                "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+                "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_GRAPH_LATENCY_MS)
+    parser.add_argument("--max-rps", type=float, default=MOCK_GRAPH_MAX_RPS)
+    parser.add_argument("--error-rate", type=float, default=MOCK_GRAPH_ERROR_RATE)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.max_rps, args.error_rate), host="127.0.0.1", port=args.port,
+                log_level="warning")
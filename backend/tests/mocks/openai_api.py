@@ -0,0 +1,270 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests that must not reach the network.
+
+Usage:
+    python -m backend.tests.mocks.openai_api --port 9002 --latency-ms 400 --stream-delay-ms 15
+
+Then point the app at it with OPENAI_BASE_URL=http://127.0.0.1:9002/v1 (and any OPENAI_API_KEY).
+
+Replies are canned but shaped like the real API, so the agents take their normal code paths:
+- A call that forces a tool (with_structured_output, the product evaluator) gets that tool call.
+- A call that offers tools gets a call to one of them (--tool-call-rate of the time), preferring the tools that lead
+  into the agents (ProductInfo, BusinessResponse). A call that follows a tool result gets a text reply.
+- A call with a JSON schema response_format gets JSON matching the schema.
+Tool arguments and JSON are generated from the schemas in the request, with FIELD_VALUES filling the fields the
+agents branch on. Streaming requests get SSE chunks, including the usage chunk when stream_options asks for it.
+--latency-ms is the time to the first token; --stream-delay-ms is added per chunk. To exercise timeouts, hedging and
+retries, --tail-rate of the requests take --tail-latency-ms instead and --error-rate of them fail with a 500.
+GET /stats returns the counters.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_OPENAI_LATENCY_MS = float(os.getenv("MOCK_OPENAI_LATENCY_MS", 400))
+MOCK_OPENAI_STREAM_DELAY_MS = float(os.getenv("MOCK_OPENAI_STREAM_DELAY_MS", 15))
+MOCK_OPENAI_TOOL_CALL_RATE = float(os.getenv("MOCK_OPENAI_TOOL_CALL_RATE", 1.0))
+MOCK_OPENAI_REPLY_WORDS = int(os.getenv("MOCK_OPENAI_REPLY_WORDS", 40))
+MOCK_OPENAI_TAIL_RATE = float(os.getenv("MOCK_OPENAI_TAIL_RATE", 0))
+MOCK_OPENAI_TAIL_LATENCY_MS = float(os.getenv("MOCK_OPENAI_TAIL_LATENCY_MS", 10_000))
+MOCK_OPENAI_ERROR_RATE = float(os.getenv("MOCK_OPENAI_ERROR_RATE", 0))
+# A product from the dummy catalogue main.py loads, so catalogue lookups return rows.
+MOCK_OPENAI_PRODUCT = os.getenv("MOCK_OPENAI_PRODUCT", "Sneakers")
+
+# Tools picked when the model is free to choose, in order of preference.
+PREFERRED_TOOLS = ["ProductInfo", "BusinessResponse", "Product"]
+
+# Values for the fields the agents branch on, everything else is generated from the schema.
+FIELD_VALUES = {
+    "conversation_stage": "Product Enquiry",
+    "product_name": MOCK_OPENAI_PRODUCT,
+    "product": MOCK_OPENAI_PRODUCT,
+    "name": MOCK_OPENAI_PRODUCT,
+    "product_category": "Shoes",
+    "intent": "enquiry",
+    "instruction": "inquired",
+    "product_attributes": {},
+    "product_match": "EXACT_MATCH",
+    "product_attribute_enquiry": None,
+    "available_products": [{"product_name": MOCK_OPENAI_PRODUCT, "price": 50.0, "items_left_in_stock": 100}],
+    "for_central_agent": True,
+    "message_type": "Payment verification",
+    "recipient": "Customer",
+    "sender": "Agent",
+    "finished": True,
+}
+
+WORDS = ("thanks for reaching out we have that item in stock and it comes in several sizes and colours "
+         "let me know which one you would like and I will share the payment details right away").split()
+
+
+def sample_from_schema(schema, root, name=None):
+    """
+    Build a value that validates against a JSON schema.
+
+    Parameters:
+    - schema (dict): Schema of the value.
+    - root (dict): Schema the value belongs to, used to resolve $ref.
+    - name (str): Property name of the value, looked up in FIELD_VALUES.
+    """
+    if name in FIELD_VALUES:
+        return FIELD_VALUES[name]
+
+    if "$ref" in schema:
+        target = root
+        for part in schema["$ref"].lstrip("#/").split("/"):
+            target = target[part]
+        return sample_from_schema(target, root, name)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"] or schema[key]
+            return sample_from_schema(options[0], root, name)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "default" in schema and schema["default"] is not None:
+        return schema["default"]
+
+    kind = schema.get("type", "object")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "string":
+        return f"mock {name or 'value'}"
+    if kind == "boolean":
+        return True
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "array":
+        return [sample_from_schema(schema["items"], root)] if schema.get("items") else []
+    if kind == "null":
+        return None
+    return {key: sample_from_schema(value, root, key) for key, value in schema.get("properties", {}).items()}
+
+
+def count_tokens(text):
+    # Roughly 4 characters per token, good enough for usage figures.
+    return max(1, len(text) // 4)
+
+
+def pick_tool(body, rng, tool_call_rate):
+    tools = [tool["function"] for tool in body.get("tools") or [] if tool.get("type") == "function"]
+    if not tools:
+        return None
+
+    tool_choice = body.get("tool_choice")
+    if isinstance(tool_choice, dict):
+        name = tool_choice["function"]["name"]
+        return next((tool for tool in tools if tool["name"] == name), None)
+    if tool_choice == "none":
+        return None
+
+    messages = body.get("messages") or []
+    # Answer tool results with text, otherwise agents that loop until a text reply never finish.
+    if tool_choice != "required" and (messages and messages[-1].get("role") == "tool" or rng.random() >= tool_call_rate):
+        return None
+
+    by_name = {tool["name"]: tool for tool in tools}
+    return next((by_name[name] for name in PREFERRED_TOOLS if name in by_name), tools[0])
+
+
+def create_app(latency_ms=MOCK_OPENAI_LATENCY_MS, stream_delay_ms=MOCK_OPENAI_STREAM_DELAY_MS,
+               tool_call_rate=MOCK_OPENAI_TOOL_CALL_RATE, reply_words=MOCK_OPENAI_REPLY_WORDS, seed=7,
+               tail_rate=MOCK_OPENAI_TAIL_RATE, tail_latency_ms=MOCK_OPENAI_TAIL_LATENCY_MS,
+               error_rate=MOCK_OPENAI_ERROR_RATE):
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.stats = {"requests": 0, "streamed": 0, "tool_calls": 0, "structured": 0, "text": 0,
+                       "prompt_tokens": 0, "completion_tokens": 0, "models": {}, "slow": 0, "errors": 0}
+
+    def build_reply(body):
+        """Returns the assistant message as (content, tool_call)."""
+        stats = app.state.stats
+        tool = pick_tool(body, rng, tool_call_rate)
+        if tool is not None:
+            stats["tool_calls"] += 1
+            parameters = tool.get("parameters") or {}
+            arguments = json.dumps(sample_from_schema(parameters, parameters))
+            return None, {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                          "function": {"name": tool["name"], "arguments": arguments}}
+
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            stats["structured"] += 1
+            schema = response_format["json_schema"].get("schema") or {}
+            return json.dumps(sample_from_schema(schema, schema)), None
+        if response_format.get("type") == "json_object":
+            stats["structured"] += 1
+            return json.dumps({"message": " ".join(WORDS[:reply_words])}), None
+
+        stats["text"] += 1
+        return " ".join(WORDS[i % len(WORDS)] for i in range(reply_words)), None
+
+    def usage(body, content, tool_call):
+        prompt_tokens = count_tokens(json.dumps(body.get("messages", [])) + json.dumps(body.get("tools", [])))
+        completion_tokens = count_tokens(content or tool_call["function"]["arguments"])
+        app.state.stats["prompt_tokens"] += prompt_tokens
+        app.state.stats["completion_tokens"] += completion_tokens
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def split(text, size=16):
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    async def stream(completion_id, created, body, content, tool_call):
+        model = body.get("model", "gpt-3.5-turbo")
+
+        def chunk(delta, finish_reason=None):
+            return "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}]}) + "\n\n"
+
+        if tool_call is not None:
+            yield chunk({"role": "assistant", "content": None, "tool_calls": [{
+                "index": 0, "id": tool_call["id"], "type": "function",
+                "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+            for piece in split(tool_call["function"]["arguments"]):
+                await asyncio.sleep(stream_delay_ms / 1000)
+                yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": piece}}]})
+            yield chunk({}, "tool_calls")
+        else:
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in split(content):
+                await asyncio.sleep(stream_delay_ms / 1000)
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [], "usage": usage(body, content, tool_call)}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+        model = body.get("model", "gpt-3.5-turbo")
+        stats["models"][model] = stats["models"].get(model, 0) + 1
+
+        if rng.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"message": "The server had an error while processing your request.",
+                                           "type": "server_error", "param": None, "code": None}}, status_code=500)
+
+        content, tool_call = build_reply(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        if rng.random() < tail_rate:
+            stats["slow"] += 1
+            await asyncio.sleep(tail_latency_ms / 1000)
+        else:
+            await asyncio.sleep(latency_ms / 1000)
+
+        if body.get("stream"):
+            stats["streamed"] += 1
+            return StreamingResponse(stream(completion_id, created, body, content, tool_call),
+                                     media_type="text/event-stream")
+
+        await asyncio.sleep(stream_delay_ms * len(split(content or tool_call["function"]["arguments"])) / 1000)
+        message = {"role": "assistant", "content": content, "refusal": None}
+        if tool_call is not None:
+            message["tool_calls"] = [tool_call]
+        return {"id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "logprobs": None,
+                             "finish_reason": "tool_calls" if tool_call else "stop"}],
+                "usage": usage(body, content, tool_call)}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_OPENAI_LATENCY_MS)
+    parser.add_argument("--stream-delay-ms", type=float, default=MOCK_OPENAI_STREAM_DELAY_MS)
+    parser.add_argument("--tool-call-rate", type=float, default=MOCK_OPENAI_TOOL_CALL_RATE)
+    parser.add_argument("--reply-words", type=int, default=MOCK_OPENAI_REPLY_WORDS)
+    parser.add_argument("--tail-rate", type=float, default=MOCK_OPENAI_TAIL_RATE)
+    parser.add_argument("--tail-latency-ms", type=float, default=MOCK_OPENAI_TAIL_LATENCY_MS)
+    parser.add_argument("--error-rate", type=float, default=MOCK_OPENAI_ERROR_RATE)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.stream_delay_ms, args.tool_call_rate, args.reply_words,
+                           tail_rate=args.tail_rate, tail_latency_ms=args.tail_latency_ms, error_rate=args.error_rate),
+                host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+
+from backend.db import catalog_mapping
+from backend.db.catalog_mapping import (SchemaMapping, builtin_mapping, header_signature, transform,
+                                        validate_mapping)
+
+
+class WordEncoding:
+    """One token per word, so the tests do not need tiktoken's BPE files."""
+
+    def encode_batch(self, texts):
+        return [text.split() for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def encoding(monkeypatch):
+    monkeypatch.setattr(catalog_mapping, "descriptor_encoding", WordEncoding)
+
+
+def catalogue(rows, columns=("Item", "Cost", "Qty", "Colour", "Color ", "SKU")):
+    return pd.DataFrame(rows, columns=list(columns), dtype=str)
+
+
+MAPPING = SchemaMapping(product_name="item", price="cost", items_in_stock="qty", ignored=["sku"])
+
+
+def test_header_signature_ignores_order_case_and_spacing():
+    assert header_signature(["Product", "Price "]) == header_signature(["price", "PRODUCT"])
+    assert header_signature(["Product", "Price"]) != header_signature(["Product", "Price", "Stock"])
+
+
+def test_builtin_layout_is_recognised():
+    columns = ["id", "Product", "Description", "Price", "Available amount", "Product category", "Date created",
+               "Date modified"]
+    assert builtin_mapping(columns).product_name == "product"
+    assert builtin_mapping(columns + ["Colour"]) is None
+
+
+def test_validate_mapping_drops_columns_the_file_does_not_have():
+    mapping = validate_mapping(SchemaMapping(product_name=" Item", price="Cost", tags="labels", ignored=["SKU", "x"]),
+                               ["item", "cost", "sku"])
+    assert (mapping.product_name, mapping.price, mapping.tags, mapping.ignored) == ("item", "cost", None, ["sku"])
+
+    with pytest.raises(ValueError):
+        validate_mapping(SchemaMapping(product_name="item", price="amount"), ["item", "cost"])
+
+
+def test_transform_parses_prices_and_stock_and_skips_unusable_rows():
+    rows, skipped = transform(catalogue([
+        ["iPhone 12", "₦1,500.50", "3.6", "Blue", "", "A1"],
+        ["", "200", "1", "", "", "A2"],
+        ["Galaxy S21", "ask us", "1", "", "", "A3"],
+        ["Pixel 7", "900", "", "", "", "A4"],
+    ]), MAPPING, business_id=7)
+
+    assert skipped == 2
+    assert [(row["product_name"], row["price"], row["items_in_stock"]) for row in rows] == \
+        [("iPhone 12", 1500.5, 4), ("Pixel 7", 900.0, None)]
+    assert all(row["business_id"] == 7 for row in rows)
+
+
+def test_unmapped_columns_become_normalized_attributes():
+    rows, _ = transform(catalogue([
+        ["Shirt", "20", "5", "Navy  Blue", "", "S1"],
+        ["Shirt", "20", "5", "", "Red", "S2"],
+        ["Shirt", "20", "5", "any", "", "S3"],
+    ]), MAPPING, business_id=7)
+
+    # "Colour" and "Color " are the same attribute; "any" means no value; SKU is ignored.
+    assert [row["attributes"] for row in rows] == [{"color": "navy blue"}, {"color": "red"}, {}]
+
+
+def test_rows_carry_their_descriptor_and_its_token_count():
+    rows, _ = transform(catalogue([["Shirt", "20", "5", "Red", "", "S1"]]), MAPPING, business_id=7,
+                        lengths={"product_name": 3})
+
+    row, = rows
+    assert row["product_name"] == "Shi"
+    assert row["descriptor"] == "Shi | 20.00 | 5 | color: red"
+    assert row["descriptor_tokens"] == len(row["descriptor"].split())
@@ -0,0 +1,54 @@
+import asyncio
+import os
+
+# The agents package reads these at import; nothing here calls OpenAI, Tavily or Redis.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+from backend.chatbot.agents import central_agent, tools  # noqa: E402
+from backend.chatbot.agents.central_agent_utils import Response  # noqa: E402
+from backend.jobs.tasks import run_central_agent_job  # noqa: E402
+
+
+class WordEncoding:
+    name = "words"
+
+    def encode(self, text):
+        return text.split()
+
+
+class FakeChain:
+    async def ainvoke(self, inputs):
+        return Response(reasoning="", next_step="", message="Your payment is confirmed.", recipient="Customer",
+                        sender="Vendor", customer_id="2348000000001", business_id="1", logistic_id="",
+                        product="iphone 12", finished=False)
+
+
+def test_job_runs_against_an_empty_state(monkeypatch):
+    saved, sent = {}, []
+
+    async def get_user_state(user_id, vendor_id, session_id=None):
+        return {}  # /chat deletes the state after each turn by default
+
+    async def modify_user_state(user_id, vendor_id, user_state, session_id=None):
+        saved[f"{user_id}:{vendor_id}"] = user_state
+
+    async def send_message(phone_number_id, recipient_id, message):
+        sent.append((phone_number_id, recipient_id, message))
+
+    monkeypatch.setattr(central_agent, "get_user_state", get_user_state)
+    monkeypatch.setattr(central_agent, "modify_user_state", modify_user_state)
+    monkeypatch.setattr(central_agent, "llm_chains", {"Payment verification": FakeChain()})
+    monkeypatch.setattr(central_agent.whatsapp, "send_message", send_message)
+    monkeypatch.setattr(tools, "get_encoding", lambda model="gpt-3.5-turbo": WordEncoding())
+
+    asyncio.run(run_central_agent_job({"event_message": {
+        "sender": "customer", "recipient": "vendor", "message": "I have paid", "product_name": "iphone 12",
+        "price": "999", "customer_id": "2348000000001", "business_id": "1", "logistic_id": "",
+        "message_type": "Payment verification", "customer_address": "", "customer_bank_details": "gtbank"}}))
+
+    state = saved["2348000000001:1"]
+    assert state["chat_history"][-1]["role"] == "assistant"
+    assert "iphone 12" in state["processes"]["Payment verification"]
+    assert sent and sent[0][2] == "Your payment is confirmed."
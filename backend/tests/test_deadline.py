@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from backend import deadline
+from backend.db.database import SessionLocal
+
+
+def test_nested_deadlines_only_shorten():
+    assert deadline.remaining() is None
+    with deadline.deadline(10):
+        with deadline.deadline(60):
+            assert deadline.remaining() <= 10
+        with deadline.deadline(1):
+            assert deadline.remaining() <= 1
+    assert deadline.remaining() is None
+
+
+def test_timeout_leaves_the_reserve():
+    assert deadline.timeout(30) == 30
+    with deadline.deadline(10):
+        assert 8 < deadline.timeout(30, reserve=1.5) <= 8.5
+        assert deadline.timeout(2, reserve=1.5) == 2
+        assert deadline.allows(5, reserve=1.5)
+        assert not deadline.allows(9, reserve=1.5)
+    with deadline.deadline(1):
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.timeout(30, reserve=1.5)
+
+
+def test_within_cancels_at_the_deadline():
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def run():
+        with deadline.deadline(0.1):
+            await deadline.within(slow(), reserve=0)
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        asyncio.run(run())
+
+
+def test_statement_timeout_is_set_on_every_transaction():
+    # SQLite stands in for Postgres: set_config records the timeouts it is given.
+    timeouts = []
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function("set_config", 3, lambda name, value, local: timeouts.append(int(value)))
+
+    db = SessionLocal(bind=engine)
+    try:
+        db.execute(text("SELECT 1"))
+        db.commit()
+        assert timeouts == []
+
+        with deadline.deadline(10):
+            db.execute(text("SELECT 1"))
+            db.commit()
+            db.execute(text("SELECT 1"))
+            db.commit()
+    finally:
+        db.close()
+
+    assert len(timeouts) == 2
+    assert all(0 < milliseconds <= 10_000 for milliseconds in timeouts)
@@ -0,0 +1,52 @@
+from backend.db import descriptors
+from backend.db.descriptors import (DESCRIPTOR_MAX_CHARS, count_tokens, descriptor_line, details, is_current,
+                                    render_descriptor)
+
+
+def product(**fields):
+    return {"product_name": "Shirt", "price": 29.99, "items_left_in_stock": 50, "tags": "cotton, casual",
+            "attributes": {"color": "red", "size": "l"}, **fields}
+
+
+def stored(**fields):
+    described = product(**fields)
+    return {**described, "descriptor": render_descriptor(described)}
+
+
+def test_descriptor_shows_name_price_stock_and_details():
+    assert render_descriptor(product()) == "Shirt | 29.99 | 50 | color: red, size: l; cotton, casual"
+    assert render_descriptor(product(price=1500, items_left_in_stock=None, attributes={}, tags="")) == \
+        "Shirt | 1,500.00 |  | "
+
+
+def test_details_list_the_values_of_every_variant():
+    variants = [product(attributes={"size": "m"}), product(attributes={"size": "l"}), product(attributes={"size": "m"})]
+    assert details(variants) == "size: m/l; cotton, casual"
+
+
+def test_descriptor_is_capped():
+    assert len(render_descriptor(product(tags="x" * 500, product_name="y" * 400))) == DESCRIPTOR_MAX_CHARS
+
+
+def test_stored_descriptor_is_used_while_price_and_stock_are_unchanged():
+    row = stored()
+    assert is_current(row)
+    assert descriptor_line(row) is row["descriptor"]
+
+
+def test_stale_or_missing_descriptor_is_rendered_again():
+    for row in ({**stored(), "price": 24.99}, {**stored(), "items_left_in_stock": 0},
+                {**stored(), "product_name": "Shirt XL"}, product(descriptor=None)):
+        assert not is_current(row)
+        assert descriptor_line(row) == render_descriptor(row)
+    # A stock of 5 must not pass for the stored 50.
+    assert not is_current({**stored(), "items_left_in_stock": 5})
+
+
+def test_count_tokens_uses_the_descriptor_encoding(monkeypatch):
+    class WordEncoding:
+        def encode(self, text):
+            return text.split()
+
+    monkeypatch.setattr(descriptors, "descriptor_encoding", WordEncoding)
+    assert count_tokens("Shirt | 29.99 | 50 | ") == 6
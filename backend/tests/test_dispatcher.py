@@ -0,0 +1,63 @@
+import asyncio
+
+from backend.jobs.scheduler import Scheduler
+from backend.whatsapp.dispatcher import ConversationDispatcher
+
+
+def dispatch(messages, coalesce_window=0.0, coalesce_max_wait=5.0, turn_seconds=0.0, gap=0.0):
+    """Submit (conversation, message) pairs `gap` seconds apart and return the handler's batches per conversation."""
+    batches = {}
+
+    async def handler(batch):
+        batches.setdefault(batch[0][0], []).append([message for _, message in batch])
+        await asyncio.sleep(turn_seconds)
+
+    async def run():
+        dispatcher = ConversationDispatcher(handler, scheduler=Scheduler(concurrency=4),
+                                            coalesce_window=coalesce_window, coalesce_max_wait=coalesce_max_wait)
+        for conversation, message in messages:
+            dispatcher.submit(conversation, conversation, message)
+            await asyncio.sleep(gap)
+        while dispatcher.pending() or dispatcher.stats()["active_conversations"] or dispatcher._timers:
+            await asyncio.sleep(0.01)
+        return dispatcher.stats()
+
+    return batches, asyncio.run(run())
+
+
+def test_messages_are_handled_in_order_one_turn_each():
+    batches, stats = dispatch([("a", 1), ("b", 1), ("a", 2), ("a", 3), ("b", 2)], turn_seconds=0.01)
+
+    assert batches == {"a": [[1], [2], [3]], "b": [[1], [2]]}
+    assert (stats["messages"], stats["turns"], stats["turns_saved"]) == (5, 5, 0)
+
+
+def test_conversations_are_handled_concurrently():
+    started = []
+
+    async def handler(batch):
+        started.append(batch[0][0])
+        await asyncio.sleep(0.05)
+
+    async def run():
+        dispatcher = ConversationDispatcher(handler, scheduler=Scheduler(concurrency=4))
+        for conversation in "abc":
+            dispatcher.submit(conversation, conversation)
+        await asyncio.sleep(0.02)
+        return sorted(started)
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+
+
+def test_a_burst_is_coalesced_into_one_turn():
+    batches, stats = dispatch([("a", 1), ("a", 2), ("a", 3), ("b", 1)], coalesce_window=0.05, gap=0.005)
+
+    assert batches == {"a": [[1, 2, 3]], "b": [[1]]}
+    assert (stats["turns"], stats["coalesced_bursts"], stats["turns_saved"], stats["largest_burst"]) == (2, 1, 2, 3)
+
+
+def test_a_long_burst_is_cut_at_the_maximum_wait():
+    batches, _ = dispatch([("a", i) for i in range(8)], coalesce_window=0.05, coalesce_max_wait=0.06, gap=0.02)
+
+    assert len(batches["a"]) > 1
+    assert [message for batch in batches["a"] for message in batch] == list(range(8))
@@ -0,0 +1,55 @@
+from backend.db.fuzzy_index import FuzzyIndex, edit_distance
+
+PRODUCTS = [
+    (1, "iPhone 12", "phone, apple"),
+    (2, "iPhone 12 Pro", "phone, apple"),
+    (3, "Samsung Galaxy S21", "phone, android"),
+    (4, "Snickers bar", "chocolate"),
+    (5, "Mars bar", "chocolate"),
+]
+
+
+def ids(results):
+    return [product_id for product_id, _ in results]
+
+
+def test_edit_distance_stops_past_the_limit():
+    assert edit_distance("samsng", "samsung", 2) == 1
+    assert edit_distance("kitten", "sitting", 3) == 3
+    assert edit_distance("kitten", "sitting", 1) == 2
+    assert edit_distance("a", "abcdef", 2) == 3
+
+
+def test_exact_words_match_with_full_score():
+    results = FuzzyIndex(PRODUCTS).search("iphone 12")
+    assert set(ids(results)) == {1, 2}
+    assert all(score == 1.0 for _, score in results)
+
+
+def test_typos_and_missing_spaces_match():
+    index = FuzzyIndex(PRODUCTS)
+    assert ids(index.search("samsng galaxy")) == [3]
+    assert set(ids(index.search("iphone12"))) == {1, 2}
+    assert ids(index.search("snikers")) == [4]
+
+
+def test_unknown_words_do_not_rule_products_out():
+    index = FuzzyIndex(PRODUCTS)
+    assert ids(index.search("the original galaxy please")) == [3]
+    assert index.search("television") == []
+
+
+def test_a_product_must_match_every_known_word():
+    assert ids(FuzzyIndex(PRODUCTS).search("iphone pro")) == [2]
+
+
+def test_aliases_point_to_the_products_of_their_name():
+    index = FuzzyIndex(PRODUCTS, aliases=[("choco", "Snickers bar"), ("ghost", "Nothing we sell")])
+    assert ids(index.search("choco")) == [4]
+    assert index.search("ghost") == []
+
+
+def test_closer_matches_rank_first_and_results_are_limited():
+    index = FuzzyIndex([(1, "Snickers", ""), (2, "Sneakers", ""), (3, "Stickers", "")])
+    assert ids(index.search("snikers"))[0] == 1
+    assert len(index.search("snikers", limit=2)) == 2
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+# The agents package reads these at import; nothing here calls OpenAI, Tavily or Redis.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+import pytest  # noqa: E402
+
+from backend.chatbot.agents import conversation_summarizer, tools  # noqa: E402
+from backend.chatbot.agents.conversation_summarizer import needs_summary, summarize_user_state  # noqa: E402
+from backend.chatbot.agents.tools import add_to_chat_history, drop_from_chat_history  # noqa: E402
+
+
+class WordEncoding:
+    """One token per word, so the tests do not need tiktoken's BPE files."""
+    name = "words"
+
+    def encode(self, text):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def encoding(monkeypatch):
+    monkeypatch.setattr(tools, "get_encoding", lambda model="gpt-3.5-turbo": WordEncoding())
+
+
+def message(content, name="customer"):
+    return {"role": "user", "name": name, "content": content}
+
+
+def recount(chat_history):
+    return sum(tools.num_tokens_from_message(dict(message, tokens=None)) for message in chat_history)
+
+
+def test_running_total_matches_a_recount():
+    user_state = {"chat_history": [message("hello there")]}
+    total = add_to_chat_history(user_state, [message("do you have the iphone 12"), message("yes we do", "vendor")])
+
+    assert total == user_state["history_tokens"] == recount(user_state["chat_history"])
+
+
+def test_dropping_messages_takes_them_off_the_total():
+    user_state = {}
+    add_to_chat_history(user_state, [message("one two three"), message("four"), message("five six")])
+
+    assert drop_from_chat_history(user_state, 2) == recount([message("five six")])
+    assert [m["content"] for m in user_state["chat_history"]] == ["five six"]
+
+
+def test_a_long_history_is_summarized_before_the_message_trigger():
+    user_state = {}
+    add_to_chat_history(user_state, [message("word " * 50) for _ in range(4)])
+
+    assert not needs_summary(user_state, trigger=24, token_trigger=1000, window=2)
+    assert needs_summary(user_state, trigger=24, token_trigger=100, window=2)
+    # Never when there is nothing to fold beyond the recent window.
+    assert not needs_summary(user_state, trigger=24, token_trigger=100, window=4)
+
+
+def test_fold_keeps_the_running_total(monkeypatch):
+    user_state = {}
+    add_to_chat_history(user_state, [message(f"message number {i}") for i in range(6)])
+    saved = {}
+
+    async def get_user_state(user_id, vendor_id, session_id=None):
+        return saved.get("state", user_state)
+
+    async def modify_user_state(user_id, vendor_id, state, session_id=None):
+        saved["state"] = state
+
+    async def fold_history(summary, messages, chain=None):
+        return "summary"
+
+    monkeypatch.setattr(conversation_summarizer, "get_user_state", get_user_state)
+    monkeypatch.setattr(conversation_summarizer, "modify_user_state", modify_user_state)
+    monkeypatch.setattr(conversation_summarizer, "fold_history", fold_history)
+    asyncio.run(summarize_user_state("2348000000001", "1", window=2, trigger=4))
+
+    state = saved["state"]
+    assert len(state["chat_history"]) == 2
+    assert state["history_tokens"] == recount(state["chat_history"])
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from backend.jobs.queue import JobQueue, PermanentJobError
+from backend.jobs.worker import Worker
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(fakeredis.FakeRedis(), stream="jobs:test", max_attempts=3, backoff_base=2.0, backoff_max=0.0)
+    queue.ensure_group()
+    return queue
+
+
+def test_retried_job_is_promoted_back_onto_the_stream(queue):
+    queue.enqueue("job", {"order": 1})
+    job, = queue.read("worker-1", block_ms=10)
+    queue.retry(job, "boom")
+    assert queue.stats()["delayed"] == 1
+
+    assert queue.promote_due() == 1
+    retried, = queue.read("worker-1", block_ms=10)
+    assert (retried.job, retried.payload, retried.attempts) == ("job", {"order": 1}, 1)
+    assert queue.stats()["delayed"] == 0
+
+
+def test_a_due_job_is_promoted_once(queue):
+    queue.enqueue("job", {})
+    job, = queue.read("worker-1", block_ms=10)
+    queue.retry(job)
+    other_worker = JobQueue(queue._client, stream="jobs:test")
+    assert queue.promote_due() + other_worker.promote_due() == 1
+    assert queue.stats()["depth"] == 1
+
+
+def test_delayed_jobs_are_not_promoted_before_they_are_due(queue):
+    queue.backoff_max = 60.0
+    queue.enqueue("job", {})
+    job, = queue.read("worker-1", block_ms=10)
+    queue.retry(job)
+    assert queue.promote_due() == 0
+    assert queue._client.zscore(queue.delayed_key, queue._client.zrange(queue.delayed_key, 0, 0)[0]) > time.time()
+
+
+def test_a_job_is_delivered_to_one_consumer(queue):
+    queue.enqueue("job", {"order": 1})
+    job, = queue.read("worker-1", block_ms=10)
+    assert (job.job, job.payload, job.attempts) == ("job", {"order": 1}, 0)
+    assert queue.read("worker-2", block_ms=10) == []
+
+    queue.ack(job)
+    stats = queue.stats()
+    assert (stats["depth"], stats["pending"]) == (0, 0)
+
+
+def test_a_job_out_of_attempts_is_dead_lettered(queue):
+    queue.enqueue("job", {})
+    for _ in range(queue.max_attempts):
+        queue.promote_due()
+        job, = queue.read("worker-1", block_ms=10)
+        queue.retry(job, "boom")
+
+    stats = queue.stats()
+    assert (stats["depth"], stats["delayed"], stats["dead"]) == (0, 0, 1)
+    _, fields = queue._client.xrange(queue.dead_letter_stream)[0]
+    assert (fields[b"attempts"], fields[b"error"]) == (b"3", b"boom")
+
+
+def test_a_job_abandoned_by_its_worker_is_reclaimed_as_a_failed_attempt(queue):
+    queue.visibility_timeout = 0
+    queue.enqueue("job", {})
+    queue.read("worker-1", block_ms=10)  # worker-1 dies without acknowledging
+
+    job, = queue.read("worker-2", block_ms=10)
+    assert job.attempts == 1
+    job, = queue.read("worker-3", block_ms=10)
+    assert job.attempts == 2
+    # The third delivery would be its last attempt too many.
+    assert queue.read("worker-4", block_ms=10) == []
+    assert queue.stats()["dead"] == 1
+
+
+def run_job(queue, handlers):
+    job, = queue.read("worker-1", block_ms=10)
+    asyncio.run(Worker(queue, handlers).handle(job))
+
+
+def test_worker_acknowledges_retries_and_dead_letters(queue):
+    async def succeed(payload):
+        pass
+
+    async def fail(payload):
+        raise RuntimeError("try again")
+
+    async def give_up(payload):
+        raise PermanentJobError("cannot succeed")
+
+    queue.enqueue("succeed", {})
+    run_job(queue, {"succeed": succeed})
+    assert queue.stats()["depth"] == 0
+
+    queue.enqueue("fail", {})
+    run_job(queue, {"fail": fail})
+    assert queue.stats()["delayed"] == 1
+
+    queue.enqueue("give_up", {})
+    run_job(queue, {"give_up": give_up})
+    queue.enqueue("unknown", {})
+    run_job(queue, {})
+    assert queue.stats()["dead"] == 2
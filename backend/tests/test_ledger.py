@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+
+from backend.telemetry import ledger as ledger_module  # noqa: E402
+from backend.telemetry.ledger import UsageLedger, _spend_key, price  # noqa: E402
+from backend.telemetry.tracing import turn  # noqa: E402
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(ledger_module.redis_conn, "_client", client)
+    return client
+
+
+def test_price_matches_the_longest_model_prefix():
+    assert price("gpt-4o-mini-2024-07-18", 1_000_000, 0) == pytest.approx(0.15)
+    assert price("gpt-4o-2024-08-06", 0, 1_000_000) == pytest.approx(10.0)
+    assert price("gpt-4-0613", 1_000_000, 1_000_000) == pytest.approx(90.0)
+    assert price("some-local-model", 1_000_000, 1_000_000) == 0.0
+
+
+def test_calls_are_billed_to_the_business_of_the_turn():
+    ledger = UsageLedger()
+    with turn("chat", conversation="2348000000001:7", business="7"):
+        ledger.record("router", "gpt-4o-mini", 1000, 100)
+    ledger.record("summarizer", "gpt-3.5-turbo", 1000, 100, business_id="8")
+
+    assert [row["business_id"] for row in ledger._buffer] == ["7", "8"]
+
+
+def test_records_are_kept_until_the_database_takes_them(redis):
+    ledger, written = UsageLedger(batch_size=2), []
+
+    def insert(batch):
+        raise ConnectionError("database down")
+
+    ledger._insert = insert
+    for _ in range(3):
+        ledger.record("router", "gpt-4o-mini", 1_000_000, 0, business_id="7")
+    asyncio.run(ledger.flush())
+    assert (len(ledger._buffer), ledger.metrics["write_errors"]) == (3, 1)
+    assert redis.get(_spend_key("7")) is None
+
+    ledger._insert = written.extend
+    asyncio.run(ledger.flush())
+    assert (len(ledger._buffer), len(written)) == (0, 3)
+    assert float(redis.get(_spend_key("7"))) == pytest.approx(0.45)
+
+
+def test_spend_is_retried_without_writing_the_rows_again(redis, monkeypatch):
+    ledger, written = UsageLedger(), []
+    ledger._insert = written.extend
+    ledger.record("router", "gpt-4o-mini", 1_000_000, 0, business_id="7")
+
+    redis_down, incrbyfloat = True, redis.incrbyfloat
+
+    def flaky_incrbyfloat(key, amount):
+        if redis_down:
+            raise ConnectionError("redis down")
+        return incrbyfloat(key, amount)
+
+    monkeypatch.setattr(redis, "incrbyfloat", flaky_incrbyfloat)
+    asyncio.run(ledger.flush())
+    assert (len(written), ledger.metrics["spend_errors"]) == (1, 1)
+
+    redis_down = False
+    asyncio.run(ledger.flush())
+    assert len(written) == 1
+    assert float(redis.get(_spend_key("7"))) == pytest.approx(0.15)
+
+
+def test_budget_status(redis, monkeypatch):
+    monkeypatch.setattr(ledger_module, "LLM_BUDGETS", {"7": 1.0})
+    monkeypatch.setattr(ledger_module, "LLM_DAILY_BUDGET_USD", 0)
+    monkeypatch.setattr(ledger_module, "LLM_BUDGET_THROTTLE", True)
+    ledger = UsageLedger()
+
+    for spend, status in [(0.5, "ok"), (0.85, "degrade"), (1.0, "throttle")]:
+        redis.set(_spend_key("7"), spend)
+        ledger._spend_cache.clear()
+        assert ledger.budget_status("7") == status
+    assert ledger.budget_status("8") == "ok"  # no budget
@@ -0,0 +1,52 @@
+import os
+
+# The agents package reads these at import; nothing here calls OpenAI, Tavily or Redis.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+import pytest  # noqa: E402
+
+from backend.chatbot.agents.product_context import rank_products  # noqa: E402
+from backend.db.popularity import CONVERSION_PRIOR_STRENGTH, prior, score_products  # noqa: E402
+
+
+def test_popularity_is_relative_to_the_best_seller_of_the_business():
+    scores = score_products([(1, 10), (2, 10), (3, 10), (4, 20)],
+                            {1: (100.0, 10, 10), 2: (10.0, 2, 4), 4: (1.0, 1, 1)})
+
+    assert scores[1][0] == 1.0
+    assert 0 < scores[2][0] < 1
+    assert scores[3][0] == 0.0  # no sales in the window
+    assert scores[4][0] == 1.0  # best seller of its own business
+
+
+def test_conversion_is_smoothed_towards_the_business_rate():
+    scores = score_products([(1, 10), (2, 10), (3, 10)], {1: (1.0, 1, 1), 2: (5.0, 5, 19)})
+    business_rate = 6 / 20
+
+    # One verified sale out of one is not a 100% conversion.
+    assert scores[1][1] == pytest.approx((1 + CONVERSION_PRIOR_STRENGTH * business_rate) /
+                                         (1 + CONVERSION_PRIOR_STRENGTH), abs=1e-4)
+    assert scores[1][1] < 1
+    # A product without transactions gets the business's rate.
+    assert scores[3][1] == pytest.approx(business_rate, abs=1e-4)
+
+
+def test_a_business_without_transactions_scores_zero():
+    assert score_products([(1, 10), (2, 10)], {}) == {1: (0.0, 0.0), 2: (0.0, 0.0)}
+
+
+def test_prior_ignores_missing_scores():
+    assert prior({}) == 0
+    assert prior({"popularity": 1.0, "conversion": 1.0}) == pytest.approx(1.0)
+
+
+def test_prior_breaks_ties_after_relevance_and_stock():
+    products = [
+        {"id": 1, "product_name": "Blue shirt", "items_left_in_stock": 3, "popularity": 0.1, "conversion": 0.1},
+        {"id": 2, "product_name": "Red shirt", "items_left_in_stock": 3, "popularity": 0.9, "conversion": 0.5},
+        {"id": 3, "product_name": "Green shirt", "items_left_in_stock": 0, "popularity": 1.0, "conversion": 1.0},
+        {"id": 4, "product_name": "Shirt", "items_left_in_stock": 1, "popularity": 0.0, "conversion": 0.0},
+    ]
+    assert [product["id"] for product in rank_products(products, "shirt")] == [4, 2, 1, 3]
@@ -0,0 +1,28 @@
+import os
+
+# The agents package reads these at import; nothing here calls OpenAI, Tavily or Redis.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+from backend.chatbot.agents.product_context import render_row  # noqa: E402
+
+
+def product(name, stock, attributes=None):
+    return {"id": 1, "business_id": 1, "product_name": name, "price": 20.0, "items_left_in_stock": stock,
+            "tags": "", "attributes": attributes or {}}
+
+
+def test_merged_row_shows_stock_per_variant():
+    row = render_row([product("Shirt M", 0), product("Shirt L", 4)])
+    assert row.split(" | ")[2] == "m:0/l:4"
+
+
+def test_merged_row_labels_variants_by_their_differing_attributes():
+    row = render_row([product("Shirt", 0, {"size": "m", "color": "red"}),
+                      product("Shirt", 4, {"size": "l", "color": "red"})])
+    assert row.split(" | ")[2] == "m:0/l:4"
+
+
+def test_merged_row_with_equal_stock_shows_it_once():
+    assert render_row([product("Shirt M", 3), product("Shirt L", 3)]).split(" | ")[2] == "3"
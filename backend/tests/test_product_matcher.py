@@ -0,0 +1,53 @@
+import os
+
+# The agents package reads these at import; nothing here calls OpenAI, Tavily or Redis.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+from backend.chatbot.agents.product_matcher import exact_match  # noqa: E402
+
+
+def product(name, stock=5, attributes=None, tags=""):
+    return {"id": 1, "business_id": 1, "product_name": name, "price": 20.0, "items_left_in_stock": stock,
+            "tags": tags, "attributes": attributes or {}}
+
+
+def test_exact_match_single_in_stock_product():
+    result = exact_match([product("Cotton Shirt", attributes={"color": "red", "size": "xl"})], "cotton shirt",
+                         {"colour": "Red", "size": "XL"})
+    assert result["product_match"] == "EXACT_MATCH"
+    assert result["available_products"][0]["product_name"] == "Cotton Shirt"
+
+
+def test_contradicting_attributes_are_left_to_the_evaluator():
+    # What the unfiltered fallback of the product agent returns when no red XL exists.
+    products = [product("Cotton Shirt", attributes={"color": "blue", "size": "m"})]
+    assert exact_match(products, "cotton shirt", {"color": "red", "size": "XL"}) is None
+
+
+def test_requested_variant_missing_from_product_is_left_to_the_evaluator():
+    assert exact_match([product("Cotton Shirt")], "cotton shirt", {"size": "XL"}) is None
+    assert exact_match([product("Cotton Shirt")], "red cotton shirt") is None
+    assert exact_match([product("Cotton Shirt")], "cotton shirt", customer_message="Do you have it in blue?") is None
+
+
+def test_requested_variant_found_in_name_or_tags():
+    assert exact_match([product("Cotton Shirt Red")], "red cotton shirt")["product_match"] == "EXACT_MATCH"
+    assert exact_match([product("Cotton Shirt", tags="red, casual")], "cotton shirt",
+                       {"color": "red"})["product_match"] == "EXACT_MATCH"
+
+
+def test_non_variant_attribute_must_be_on_the_product():
+    products = [product("Phone X", attributes={"storage": "128gb"})]
+    assert exact_match(products, "phone x", {"storage": "256GB"}) is None
+    assert exact_match(products, "phone x", {"storage": "128 GB"})["product_match"] == "EXACT_MATCH"
+
+
+def test_unasked_variant_in_name_is_left_to_the_evaluator():
+    assert exact_match([product("Cotton Shirt Blue")], "cotton shirt") is None
+
+
+def test_out_of_stock_or_several_candidates_are_left_to_the_evaluator():
+    assert exact_match([product("Cotton Shirt", stock=0)], "cotton shirt") is None
+    assert exact_match([product("Cotton Shirt"), product("Cotton Shirt")], "cotton shirt") is None
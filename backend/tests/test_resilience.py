@@ -0,0 +1,116 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+# The chatbot package reads these at import; nothing here calls OpenAI, Tavily or Redis.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+import httpx  # noqa: E402
+import openai  # noqa: E402
+import pytest  # noqa: E402
+
+from backend import deadline  # noqa: E402
+from backend.chatbot import resilience  # noqa: E402
+from backend.chatbot.resilience import CircuitBreaker, aretrying, hedged, retrying  # noqa: E402
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def test_breaker_opens_after_consecutive_failures_and_lets_one_trial_through(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    breaker = CircuitBreaker("gpt-test", failures=3, reset_seconds=30)
+
+    breaker.record(False)
+    breaker.record(True)  # a success resets the count
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    now[0] += 31
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # only one trial at a time
+
+    breaker.record(False)  # the trial failed
+    assert breaker.state == "open"
+    now[0] += 31
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def hedge(*attempts, delay=0.02):
+    """Run hedged() over attempts given as (seconds, result or exception); returns the result and the started ones."""
+    started = []
+
+    async def start():
+        seconds, result = attempts[len(started)]
+        started.append(seconds)
+        await asyncio.sleep(seconds)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return asyncio.run(hedged("test", start, delay)), started
+
+
+def test_fast_calls_are_not_hedged():
+    assert hedge((0, "primary"), (0, "hedge")) == ("primary", [0])
+
+
+def test_the_hedge_answers_a_slow_primary():
+    assert hedge((1, "primary"), (0, "hedge")) == ("hedge", [1, 0])
+
+
+def test_the_hedge_answers_a_failed_primary():
+    assert hedge((0.05, RuntimeError("boom")), (0.1, "hedge"))[0] == "hedge"
+
+
+def test_hedged_raises_when_both_fail():
+    with pytest.raises(RuntimeError):
+        hedge((0.05, RuntimeError("primary")), (0.05, RuntimeError("hedge")))
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff", lambda attempt: 0)
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        if len(calls) < 2:
+            raise connection_error()
+        return "ok"
+
+    assert retrying("test", attempt) == "ok"
+    assert len(calls) == 2
+
+    def invalid():
+        calls.append(1)
+        raise ValueError("not transient")
+
+    calls.clear()
+    with pytest.raises(ValueError):
+        retrying("test", invalid)
+    assert len(calls) == 1
+
+
+def test_no_retry_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff", lambda attempt: 5)
+
+    async def attempt():
+        raise connection_error()
+
+    async def run():
+        with deadline.deadline(2):
+            await aretrying("test", attempt)
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        asyncio.run(run())
@@ -0,0 +1,80 @@
+import asyncio
+
+from backend.jobs.scheduler import Priority, Scheduler
+
+
+async def finish(scheduler, tasks):
+    # Wait until `tasks` tasks have ended one way or another, then stop the scheduler.
+    def ended():
+        return sum(stats["completed"] + stats["failed"] + stats["timed_out"] + stats["dropped_stale"]
+                   for stats in scheduler.stats()["priorities"].values())
+
+    while ended() < tasks:
+        await asyncio.sleep(0.01)
+    await scheduler.stop()
+
+
+def test_highest_priority_waiting_task_starts_first():
+    order = []
+
+    async def record(name):
+        order.append(name)
+
+    async def run():
+        scheduler = Scheduler(concurrency=1)
+        scheduler.submit(record, "housekeeping", priority=Priority.HOUSEKEEPING)
+        scheduler.submit(record, "vendor", priority=Priority.VENDOR)
+        scheduler.submit(record, "customer", priority=Priority.CUSTOMER)
+        await finish(scheduler, 3)
+
+    asyncio.run(run())
+    assert order == ["customer", "vendor", "housekeeping"]
+
+
+def test_lower_priorities_only_take_their_share_of_slots():
+    running, peak = {"housekeeping": 0}, {"housekeeping": 0}
+
+    async def housekeeping():
+        running["housekeeping"] += 1
+        peak["housekeeping"] = max(peak["housekeeping"], running["housekeeping"])
+        await asyncio.sleep(0.01)
+        running["housekeeping"] -= 1
+
+    async def run():
+        scheduler = Scheduler(concurrency=4, limits={Priority.CUSTOMER: 4, Priority.VENDOR: 2,
+                                                     Priority.HOUSEKEEPING: 1})
+        for _ in range(5):
+            scheduler.submit(housekeeping, priority=Priority.HOUSEKEEPING)
+        await finish(scheduler, 5)
+
+    asyncio.run(run())
+    assert peak["housekeeping"] == 1
+
+
+def test_stale_tasks_are_dropped_and_slow_tasks_cancelled():
+    ran = []
+
+    async def stale():
+        ran.append("stale")
+
+    async def block():
+        await asyncio.sleep(0.05)
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def run():
+        scheduler = Scheduler(concurrency=1)
+        scheduler.submit(block, priority=Priority.CUSTOMER)
+        scheduler.submit(stale, priority=Priority.CUSTOMER, deadline=0.01)
+        scheduler.submit(slow, priority=Priority.CUSTOMER, timeout=0.01)
+        scheduler.submit(fail, priority=Priority.CUSTOMER)
+        await finish(scheduler, 4)
+        return scheduler.stats()["priorities"]["customer"]
+
+    stats = asyncio.run(run())
+    assert ran == []
+    assert (stats["completed"], stats["dropped_stale"], stats["timed_out"], stats["failed"]) == (1, 1, 1, 1)
@@ -0,0 +1,14 @@
+import hashlib
+
+from backend.telemetry import tracing
+from backend.telemetry.tracing import conversation_hash
+
+
+def test_conversation_hash_is_stable_and_keyed(monkeypatch):
+    key = "2348000000001:1"
+    assert conversation_hash(key) == conversation_hash(key)
+    assert conversation_hash(key) != hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+
+    pseudonym = conversation_hash(key)
+    monkeypatch.setattr(tracing, "METRICS_HASH_SECRET", b"another secret")
+    assert conversation_hash(key) != pseudonym
@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+# The agents package reads these at import; nothing here calls OpenAI, Tavily or Redis.
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TAVILY_API_KEY", "test")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+
+from backend.jobs.queue import JobQueue  # noqa: E402
+from backend.jobs.scheduler import Scheduler  # noqa: E402
+from backend.jobs.worker import Worker  # noqa: E402
+from backend.whatsapp import utils  # noqa: E402
+from backend.whatsapp.dispatcher import ConversationDispatcher  # noqa: E402
+
+
+def webhook(*message_ids):
+    messages = [{"id": message_id, "from": "2348000000001", "timestamp": str(i), "type": "text",
+                 "text": {"body": f"message {i}"}} for i, message_id in enumerate(message_ids)]
+    return {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "1"}, "messages": messages}}]}]}
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    client = fakeredis.FakeRedis()
+    queue = JobQueue(client, stream="whatsapp:inbound:test", max_attempts=3, backoff_max=0.0)
+    queue.ensure_group()
+    monkeypatch.setattr(utils.redis_conn, "_client", client)
+    monkeypatch.setattr(utils, "inbound_queue", queue)
+    bot = utils.WhatsappBot("token", "secret", "verify")
+    bot.inbound = Worker(queue, {"whatsapp_inbound": bot.receive})
+    return bot
+
+
+def test_messages_are_queued_once_before_the_webhook_is_acknowledged(bot):
+    bot.dispatch(webhook("wamid.1", "wamid.2"))
+    bot.dispatch(webhook("wamid.2"))  # Meta redelivery
+
+    jobs = bot.inbound.queue.read("web-1", count=10, block_ms=10)
+    assert [job.payload["message"]["id"] for job in jobs] == ["wamid.1", "wamid.2"]
+    assert {job.payload["sender_id"] for job in jobs} == {"2348000000001"}
+
+
+def test_messages_not_queued_are_released_for_the_redelivery(bot, monkeypatch):
+    def enqueue(job, payload):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(bot.inbound.queue, "enqueue", enqueue)
+    with pytest.raises(ConnectionError):
+        bot.dispatch(webhook("wamid.1"))
+
+    assert bot.claim_message("wamid.1")
+
+
+def run_jobs(bot, handle_message):
+    async def run():
+        bot.dispatcher = ConversationDispatcher(bot.process_messages, scheduler=Scheduler(concurrency=2))
+        bot.handle_message = handle_message
+        for job in bot.inbound.queue.read("web-1", count=10, block_ms=10):
+            await bot.inbound.handle(job)
+
+    asyncio.run(run())
+
+
+def test_an_answered_message_is_acknowledged(bot):
+    answered = []
+
+    async def handle_message(sender_id, phone_number_id, messages, background_task):
+        answered.extend(message["id"] for message in messages)
+
+    bot.dispatch(webhook("wamid.1"))
+    run_jobs(bot, handle_message)
+
+    assert answered == ["wamid.1"]
+    assert bot.inbound.queue.stats()["pending"] == 0
+    assert bot.inbound.queue.stats()["delayed"] == 0
+
+
+def test_a_failed_turn_is_retried(bot):
+    async def handle_message(sender_id, phone_number_id, messages, background_task):
+        raise RuntimeError("LLM unavailable")
+
+    bot.dispatch(webhook("wamid.1"))
+    run_jobs(bot, handle_message)
+
+    assert bot.inbound.queue.stats()["delayed"] == 1
+    assert bot.inbound.queue.promote_due() == 1
+    job, = bot.inbound.queue.read("web-1", block_ms=10)
+    assert (job.payload["message"]["id"], job.attempts) == ("wamid.1", 1)
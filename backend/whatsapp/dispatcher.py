@@ -0,0 +1,137 @@
+from collections import deque
+from typing import Callable, Dict
+import asyncio
+import logging
+import os
+import time
+
+from backend.jobs.scheduler import scheduler as default_scheduler, Priority
+
+"""
+Fans incoming messages out across conversations while keeping arrival order within each conversation.
+
+Every conversation (sender + business phone number) gets its own lane. Messages are appended to their lane, and a
+lane with pending messages has exactly one task on the scheduler draining it in order. Different conversations are
+drained concurrently, up to the scheduler's customer slots.
+
+Customers often send a burst of short messages ("hi", "do you have", "iphone 12", "price?"). With a coalesce window,
+a lane is only put on the scheduler once no new message has arrived for `coalesce_window` seconds (or
+`coalesce_max_wait` seconds have passed), and every pending message goes to the handler as one batch, so the burst is
+answered in a single agent turn. The wait is a timer on the event loop, it does not hold a scheduler slot. Messages
+that arrive while a turn is running wait for their own window once it is over. Coalescing adds up to the window to
+every reply, so it is off by default.
+"""
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", 0))
+COALESCE_MAX_WAIT_SECONDS = float(os.getenv("COALESCE_MAX_WAIT_SECONDS", 5))
+# LLM calls made by a customer turn (router + agent), used to estimate the calls saved by coalescing.
+LLM_CALLS_PER_TURN = float(os.getenv("LLM_CALLS_PER_TURN", 2))
+
+
+class ConversationDispatcher:
+    def __init__(self, handler: Callable, scheduler=None, priority: Priority = Priority.CUSTOMER,
+                 coalesce_window: float = 0.0, coalesce_max_wait: float = COALESCE_MAX_WAIT_SECONDS,
+                 llm_calls_per_turn: float = LLM_CALLS_PER_TURN):
+        """
+        Parameters:
+        - handler: Coroutine function called with the list of batched messages (each the args given to submit).
+        - scheduler (Scheduler): Scheduler the lanes are drained on.
+        - priority (Priority): Priority class of the lanes.
+        - coalesce_window (float): Quiet period in seconds that ends a burst, 0 handles messages one at a time.
+        - coalesce_max_wait (float): Maximum seconds to wait for a burst to end.
+        - llm_calls_per_turn (float): LLM calls made per handler call, for the calls saved metric.
+        """
+        self.handler = handler
+        self.scheduler = scheduler or default_scheduler
+        self.priority = priority
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_wait = coalesce_max_wait
+        self.llm_calls_per_turn = llm_calls_per_turn
+        self._lanes = {}
+        self._active = set()
+        # Coalescing: the timer closing each waiting lane's window, and when its burst started and last grew.
+        self._timers = {}
+        self._burst_started = {}
+        self._last_arrival = {}
+        self.metrics = {"messages": 0, "turns": 0, "coalesced_bursts": 0, "turns_saved": 0, "largest_burst": 0}
+
+    def submit(self, key: str, *args):
+        """Queue a message for a conversation. `args` are passed to the handler."""
+        self._lanes.setdefault(key, deque()).append(args)
+        self.metrics["messages"] += 1
+        if not self.coalesce_window:
+            if key not in self._active:
+                self._start(key)
+            return
+
+        now = time.monotonic()
+        self._burst_started.setdefault(key, now)
+        self._last_arrival[key] = now
+        # A running turn re-arms the timer when it is over.
+        if key not in self._active:
+            self._arm(key)
+
+    def pending(self, key: str = None) -> int:
+        if key is not None:
+            return len(self._lanes.get(key, ()))
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def stats(self) -> Dict:
+        stats = dict(self.metrics)
+        stats["llm_calls_saved"] = stats["turns_saved"] * self.llm_calls_per_turn
+        stats["active_conversations"] = len(self._active)
+        stats["coalescing_conversations"] = len(self._timers)
+        stats["pending_messages"] = self.pending()
+        return stats
+
+    def _arm(self, key: str):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        closes = min(self._last_arrival[key] + self.coalesce_window, self._burst_started[key] + self.coalesce_max_wait)
+        delay = closes - time.monotonic()
+        if delay <= 0:
+            self._start(key)
+        else:
+            self._timers[key] = asyncio.get_running_loop().call_later(delay, self._start, key)
+
+    def _start(self, key: str):
+        self._timers.pop(key, None)
+        self._active.add(key)
+        self.scheduler.submit(self._drain, key, priority=self.priority, name="conversation")
+
+    async def _drain(self, key: str):
+        try:
+            lane = self._lanes.get(key)
+            while lane:
+                if self.coalesce_window:
+                    batch = list(lane)
+                    lane.clear()
+                    self._burst_started.pop(key, None)
+                else:
+                    batch = [lane.popleft()]
+
+                self._record(batch)
+                try:
+                    await self.handler(batch)
+                except Exception:
+                    logger.exception(f"Failed to process messages for conversation {key}")
+                if self.coalesce_window:
+                    break
+        finally:
+            self._active.discard(key)
+            if self._lanes.get(key):
+                if self.coalesce_window:
+                    self._arm(key)
+            else:
+                self._lanes.pop(key, None)
+                self._last_arrival.pop(key, None)
+
+    def _record(self, batch):
+        self.metrics["turns"] += 1
+        self.metrics["largest_burst"] = max(self.metrics["largest_burst"], len(batch))
+        if len(batch) > 1:
+            self.metrics["coalesced_bursts"] += 1
+            self.metrics["turns_saved"] += len(batch) - 1
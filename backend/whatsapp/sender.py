@@ -0,0 +1,147 @@
+from typing import Dict, Optional
+import asyncio
+import httpx
+import logging
+import os
+import random
+
+"""
+Async sender for the WhatsApp Cloud (Graph) API.
+
+Messages go through one pooled httpx.AsyncClient per process (keep-alive connections, bounded pool) and a semaphore
+that caps in-flight requests. Throttling (HTTP 429 and Graph rate-limit error codes), 5xx responses and network errors
+are retried with backoff, honouring Retry-After when Graph sends it.
+
+A message that still cannot be delivered after GRAPH_MAX_RETRIES is written to the durable outbox (a JobQueue on
+the "whatsapp:outbox" stream, see backend/jobs/tasks.py), from which the workers keep retrying it with backoff until
+it is delivered or dead-lettered, instead of dropping it.
+"""
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com/v15.0")
+GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", 20))
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", 20))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", 3))
+GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", 0.5))
+GRAPH_BACKOFF_MAX = float(os.getenv("GRAPH_BACKOFF_MAX", 30))
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", 10))
+
+# Graph API error codes for throttling and temporary failures.
+# https://developers.facebook.com/docs/whatsapp/cloud-api/support/error-codes
+RETRYABLE_ERROR_CODES = {1, 2, 4, 17, 32, 613, 80007, 130429, 131000, 131016, 131048, 131056}
+
+
+class SendResult:
+    def __init__(self, ok: bool, status_code: Optional[int] = None, retryable: bool = False,
+                 error: Optional[str] = None, retry_after: Optional[float] = None):
+        self.ok = ok
+        self.status_code = status_code
+        self.retryable = retryable
+        self.error = error
+        self.retry_after = retry_after
+
+    def __repr__(self):
+        return f"SendResult(ok={self.ok}, status_code={self.status_code}, retryable={self.retryable}, error={self.error!r})"
+
+
+class GraphSender:
+    def __init__(self, access_token: str, base_url: str = GRAPH_API_URL, max_connections: int = GRAPH_MAX_CONNECTIONS,
+                 max_concurrency: int = GRAPH_MAX_CONCURRENCY, max_retries: int = GRAPH_MAX_RETRIES,
+                 backoff_base: float = GRAPH_BACKOFF_BASE, backoff_max: float = GRAPH_BACKOFF_MAX,
+                 timeout: float = GRAPH_TIMEOUT):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._client = None
+        self._semaphore = None
+        self.metrics = {"sent": 0, "failed": 0, "retries": 0, "throttled": 0, "queued_to_outbox": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.access_token}"},
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def send(self, phone_number_id: str, payload: Dict, max_retries: Optional[int] = None) -> SendResult:
+        """
+        Post a message payload to the Graph API, retrying throttled and temporary failures.
+
+        Parameters:
+        - phone_number_id (str): The sending WhatsApp phone number id.
+        - payload (dict): The message payload.
+        - max_retries (int): Retries after the first attempt, defaults to the sender's max_retries.
+
+        Returns:
+        SendResult: Outcome of the last attempt.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        client = self.client
+
+        for attempt in range(max_retries + 1):
+            async with self._semaphore:
+                result = await self._post(client, phone_number_id, payload)
+
+            if result.ok:
+                self.metrics["sent"] += 1
+                return result
+            if not result.retryable or attempt == max_retries:
+                break
+
+            self.metrics["retries"] += 1
+            await asyncio.sleep(self.backoff(attempt, result.retry_after))
+
+        self.metrics["failed"] += 1
+        return result
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before the next attempt: Retry-After if given, else exponential backoff with jitter."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * (0.5 + random.random() / 2)
+
+    async def _post(self, client, phone_number_id, payload) -> SendResult:
+        try:
+            response = await client.post(f"/{phone_number_id}/messages", json=payload)
+        except httpx.TransportError as e:
+            return SendResult(ok=False, retryable=True, error=repr(e))
+
+        if response.status_code == 200:
+            return SendResult(ok=True, status_code=200)
+
+        error_code = None
+        try:
+            error_code = response.json().get("error", {}).get("code")
+        except ValueError:
+            pass
+
+        throttled = response.status_code == 429 or error_code in {4, 17, 32, 613, 80007, 130429, 131056}
+        if throttled:
+            self.metrics["throttled"] += 1
+
+        retry_after = response.headers.get("Retry-After")
+        return SendResult(
+            ok=False,
+            status_code=response.status_code,
+            retryable=throttled or response.status_code >= 500 or error_code in RETRYABLE_ERROR_CODES,
+            error=response.text,
+            retry_after=float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None,
+        )
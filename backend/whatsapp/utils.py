@@ -1,11 +1,20 @@
 import hashlib
 import hmac
+import asyncio
 import json
 import os
 from typing import Union
 from urllib.parse import parse_qs
 from pydantic import BaseModel
-import requests
+
+from backend.db.cache_utils import redis_conn
+from backend.jobs.tasks import inbound_queue, outbox_queue
+from backend.jobs.worker import Worker
+from backend.whatsapp.dispatcher import ConversationDispatcher, COALESCE_WINDOW_SECONDS
+from fastapi import BackgroundTasks
+from backend.whatsapp.sender import GraphSender
+from backend.deadline import deadline, TURN_DEADLINE_SECONDS
+from backend.telemetry.tracing import span, turn
 
 from dotenv import load_dotenv
 import logging
@@ -17,6 +26,10 @@ VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
 APP_SECRET = os.getenv("APP_SECRET")
 PAGE_ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
+# Seconds a received message id is remembered, Meta keeps retrying undelivered webhooks for several days.
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", 7 * 24 * 3600))
+# Inbound messages taken at once by a web process, they wait on the dispatcher and the scheduler.
+INBOUND_CONCURRENCY = int(os.getenv("INBOUND_CONCURRENCY", 200))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -43,11 +56,36 @@ class BusinessRequest(BaseModel):
     message_type: str
 
 
+def parse_messages(data):
+    """
+    Extract all messages from a webhook payload, across every entry and change.
+
+    Returns:
+    List[tuple]: (sender_id, phone_number_id, message) in arrival order. Status updates are skipped.
+    """
+    messages = []
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value") or {}
+            if not value.get("messages"):
+                continue
+
+            phone_number_id = value["metadata"]["phone_number_id"]
+            for message in value["messages"]:
+                messages.append((message["from"], phone_number_id, message))
+
+    # Entries are not guaranteed to be in order, WhatsApp timestamps are. sorted() keeps payload order for ties.
+    return sorted(messages, key=lambda item: int(item[2].get("timestamp", 0)))
+
+
 class WhatsappBot:
     def __init__(self, page_access_token, app_secret, verify_token):
         self.page_access_token = page_access_token
         self.app_secret = app_secret
         self.verify_token = verify_token
+        self.sender = GraphSender(page_access_token)
+        self.dispatcher = ConversationDispatcher(self.process_messages, coalesce_window=COALESCE_WINDOW_SECONDS)
+        self.inbound = Worker(inbound_queue, {"whatsapp_inbound": self.receive}, concurrency=INBOUND_CONCURRENCY)
 
     def verify_webhook(self, request):
         query_params = parse_qs(str(request.query_params))
@@ -61,51 +99,113 @@ class WhatsappBot:
             else:
                 return "Invalid verification token"
 
-    async def handle_webhook(self, request, background_task):
-        if request.method == "POST":
-            body = await request.body()
-            signature = request.headers.get("X-Hub-Signature", "")
-
-            if not self.verify_signature(body, signature):
-                return "Invalid signature", 403
-
-            data = json.loads(body)
-
-            entry = data["entry"][0]
-            messaging_events = [
-                changes.get("value")
-                for changes in entry.get("changes", [])
-                if changes.get("value")
-            ]
-
-            if messaging_events[0].get("statuses"):
-                return "OK"
-
-            # for event in messaging_events:
-            recipient_id = messaging_events[0]["metadata"]["display_phone_number"]
-            phone_number_id = messaging_events[0]["metadata"]["phone_number_id"]
-            message = messaging_events[0]["messages"][0]
-            sender_id = message["from"]
-            await self.handle_message(sender_id, phone_number_id, message, background_task)
-        return "OK"
+    async def handle_webhook(self, request):
+        """
+        Verify a webhook delivery and queue its messages, without waiting for the agents. Meta retries deliveries
+        that are not acknowledged quickly, so the messages are answered after the webhook has returned, by
+        `receive`. They are in the durable inbound stream before Meta gets its 200, which it never redelivers.
+        """
+        body = await request.body()
+        signature = request.headers.get("X-Hub-Signature", "")
+
+        if not self.verify_signature(body, signature):
+            return "Invalid signature", 403
+
+        try:
+            self.dispatch(json.loads(body))
+        except Exception as e:
+            # Not acknowledged: Meta delivers the payload again.
+            logger.error(f"Could not queue webhook messages: {e!r}")
+            return "Could not queue messages", 500
+        return "OK", 200
+
+    def dispatch(self, data):
+        """
+        Queue every message of a webhook payload on the inbound stream. Batched deliveries carry several entries,
+        changes and messages.
+
+        Raises:
+        Exception: If Redis failed. The messages not queued are released, so the redelivery queues them.
+        """
+        for sender_id, phone_number_id, message in parse_messages(data):
+            # Meta redelivers messages, make sure each one is only processed once.
+            if not self.claim_message(message["id"]):
+                logger.info(f"Skipping duplicate message {message['id']}")
+                continue
+            try:
+                inbound_queue.enqueue("whatsapp_inbound", {"sender_id": sender_id, "phone_number_id": phone_number_id,
+                                                           "message": message})
+            except Exception:
+                redis_conn.delete(f"whatsapp:message:{message['id']}")
+                raise
+
+    def claim_message(self, message_id):
+        """
+        Record a WhatsApp message id as seen. Returns False if it was already claimed by an earlier delivery.
+        """
+        return redis_conn.set_if_absent(f"whatsapp:message:{message_id}", 1, WEBHOOK_DEDUP_TTL)
+
+    async def receive(self, payload):
+        """
+        Handler of the inbound stream's jobs: hand the message to its conversation's lane and wait for its turn to
+        be answered. Conversations are processed concurrently, and each conversation's messages in arrival order.
+        A failed turn fails the job, which the inbound stream retries.
+        """
+        answered = asyncio.get_running_loop().create_future()
+        sender_id, phone_number_id = payload["sender_id"], payload["phone_number_id"]
+        self.dispatcher.submit(f"{sender_id}:{phone_number_id}", sender_id, phone_number_id, payload["message"],
+                               answered)
+        await answered
+
+    async def process_messages(self, batch):
+        """
+        Answer a burst of messages from one conversation in a single turn.
+
+        Parameters:
+        - batch (List[tuple]): (sender_id, phone_number_id, message, answered) of each message, in arrival order.
+          `answered` is the future its inbound job waits on, or None.
+        """
+        sender_id, phone_number_id, _, _ = batch[0]
+        background_task = BackgroundTasks()
+        try:
+            with turn("whatsapp", conversation=f"{sender_id}:{phone_number_id}", business=phone_number_id,
+                      messages=len(batch)), deadline(TURN_DEADLINE_SECONDS):
+                await self.handle_message(sender_id, phone_number_id, [message for _, _, message, _ in batch],
+                                          background_task)
+        except BaseException as e:
+            # Also on cancellation (shutdown): the messages were not answered.
+            for *_, answered in batch:
+                if answered is not None and not answered.done():
+                    answered.set_exception(e if isinstance(e, Exception) else RuntimeError("Turn cancelled"))
+            raise
+        for *_, answered in batch:
+            if answered is not None and not answered.done():
+                answered.set_result(None)
+        # Run what the agents deferred until after the reply (e.g. central agent hand-offs).
+        await background_task()
 
     def process_audio(self, audio):
         pass
 
-    async def handle_message(self, sender_id, recipient_id, message, background_task):
-        message_text = ""
+    def get_message_text(self, message):
         if message.get("text"):
-            message_text = message["text"]["body"]
+            return message["text"]["body"]
         elif message.get("audio"):
             audio_id = message["audio"]["id"]
             self.process_audio(audio_id)
             # todo: process audio messages in the future
+        return ""
+
+    async def handle_message(self, sender_id, recipient_id, messages, background_task):
+        if isinstance(messages, dict):
+            messages = [messages]
+        message_text = "\n".join(text for text in map(self.get_message_text, messages) if text)
 
         # Create structure for message
         request = UserRequest(user_id=sender_id, vendor_id=recipient_id, message=message_text)
 
         response = await self.get_response(request=request, background_task=background_task)
-        self.send_message(recipient_id, sender_id, response)
+        await self.send_message(recipient_id, sender_id, response)
 
     async def get_response(self, request: Union[UserRequest, BusinessRequest], background_task) -> str:
         from backend.chatbot.agents.user_chat_interface import chat
@@ -121,7 +221,7 @@ class WhatsappBot:
         logger.info(f"Message: {response}")
         return response
 
-    def send_message(self, phone_number_id, recipient_id, message):
+    async def send_message(self, phone_number_id, recipient_id, message):
         payload = {
             "messaging_product": "whatsapp",
             "recipient_type": "individual",
@@ -133,23 +233,21 @@ class WhatsappBot:
             },
         }
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.page_access_token}",
-        }
-
-        response = requests.post(
-            f"https://graph.facebook.com/v15.0/{phone_number_id}/messages",
-            json=payload,
-            headers=headers,
-        )
-        if response.status_code != 200:
-            logging.error(response.text)
-            logging.error(f"Failed to send message: {response.status_code}")
-            return "Failed to send message:", response.status_code
-        else:
+        with span("send_message"):
+            result = await self.sender.send(phone_number_id, payload)
+        if result.ok:
             logging.info(f"Message sent to {recipient_id}")
             return "Message sent to", recipient_id
+        elif result.retryable:
+            # Keep the message in the durable outbox, the workers retry it with backoff.
+            outbox_queue.enqueue("whatsapp_message", {"phone_number_id": phone_number_id, "payload": payload})
+            self.sender.metrics["queued_to_outbox"] += 1
+            logging.warning(f"Message to {recipient_id} queued for retry: {result.status_code}")
+            return "Message queued for retry:", recipient_id
+        else:
+            logging.error(result.error)
+            logging.error(f"Failed to send message: {result.status_code}")
+            return "Failed to send message:", result.status_code
 
     def verify_signature(self, request_body, signature):
         if signature.startswith("sha1="):
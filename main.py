@@ -16,6 +16,17 @@ from backend.chatbot.agents.upselling_agent import run_upselling_agent
 from backend.chatbot.agents.payment_verification_agent import run_verification_agent
 from backend.chatbot.agents.customer_complaint_agent import run_customer_complaint_agent
 from backend.whatsapp.routers import router
+from backend.jobs.routers import router as jobs_router
+from backend.telemetry.routers import router as telemetry_router
+from backend.telemetry.ledger import ledger
+from backend.telemetry.tracing import turn
+from backend.deadline import deadline, TURN_DEADLINE_SECONDS
+from backend.jobs.scheduler import scheduler
+from backend.jobs.tasks import JOB_QUEUE_BACKEND, JOB_HANDLERS, outbox_queue, run_periodic_jobs
+from backend.jobs.worker import Worker
+from backend.whatsapp.utils import whatsapp
+import asyncio
+from contextlib import asynccontextmanager
 
 
 load_dotenv()
@@ -23,8 +34,32 @@ LOG_FILE = os.getenv("LOG_FILE")
 logging.basicConfig(filename=LOG_FILE, level=logging.WARNING,
                     format='%(asctime)s [%(levelname)s]: %(message)s')
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler.start()
+    ledger.start()
+    # Customer messages queued by the WhatsApp webhook.
+    inbound = asyncio.create_task(whatsapp.inbound.run())
+    if JOB_QUEUE_BACKEND == "inline":
+        # No worker running: drain the WhatsApp outbox and run the periodic jobs from the web process.
+        outbox_worker = Worker(outbox_queue, JOB_HANDLERS)
+        asyncio.create_task(outbox_worker.run())
+        periodic = asyncio.create_task(run_periodic_jobs())
+    yield
+    if JOB_QUEUE_BACKEND == "inline":
+        outbox_worker.stop()
+        periodic.cancel()
+    # Messages whose turn did not finish stay pending on the stream and are reclaimed by another web process.
+    whatsapp.inbound.stop()
+    inbound.cancel()
+    await scheduler.stop()
+    await ledger.stop()
+    await whatsapp.sender.aclose()
+
+
 # Create an instance of FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 PORT = os.getenv("PORT", 8000) 
 
@@ -36,13 +71,17 @@ load_csv_to_db("./dummy_data/donrey_fashion.csv", "products")
 
 @app.post("/chat")
 async def get_chat_response(user_request: UserRequest, background_tasks: BackgroundTasks):
-    response = await chat(user_request, background_tasks)
+    with turn("chat", conversation=f"{user_request.user_id}:{user_request.vendor_id}", business=user_request.vendor_id), \
+            deadline(TURN_DEADLINE_SECONDS):
+        response = await chat(user_request, background_tasks)
     return {"message": response}
 
 
 @app.post("/business_chat") # For logistics and businesses as they are both businesses.
 async def get_business_response(business_request: BusinessRequest, background_tasks: BackgroundTasks):
-    response = await business_chat(business_request, background_tasks)
+    with turn("business_chat", conversation=f"{business_request.vendor_id}:{business_request.vendor_id}",
+              business=business_request.vendor_id), deadline(TURN_DEADLINE_SECONDS):
+        response = await business_chat(business_request, background_tasks)
     return {"message": response}
 
 
@@ -67,6 +106,8 @@ async def chat_agent(request: AgentRequest, background_tasks: BackgroundTasks):
         
 
 app.include_router(router=router)
+app.include_router(router=jobs_router)
+app.include_router(router=telemetry_router)
 
 
 # if __name__ == "__main__":
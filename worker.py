@@ -0,0 +1,30 @@
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+from backend.jobs.tasks import JOB_HANDLERS, QUEUES, run_periodic_jobs
+from backend.jobs.worker import run_workers
+from backend.telemetry.ledger import ledger
+
+
+load_dotenv()
+LOG_FILE = os.getenv("LOG_FILE")
+logging.basicConfig(filename=LOG_FILE, level=logging.WARNING,
+                    format='%(asctime)s [%(levelname)s]: %(message)s')
+
+
+async def main():
+    ledger.start()
+    periodic = asyncio.create_task(run_periodic_jobs())
+    try:
+        await run_workers(QUEUES, JOB_HANDLERS)
+    finally:
+        periodic.cancel()
+        # Write the LLM usage of the jobs that ran before shutting down.
+        await ledger.stop()
+
+
+if __name__ == "__main__":
+    # Run as many of these as needed, e.g. `docker compose up --scale worker=3`.
+    asyncio.run(main())